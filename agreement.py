@@ -0,0 +1,58 @@
+'''
+Inter-annotator agreement computed from label-pair counts.
+
+For every Topic-Document pair, each ordered pair of distinct judgments
+contributes one count to (label of first, label of second). Agreement
+of degree d is the fraction of those pairs whose labels differ by less
+than d, so degree 1 is exact agreement and degree 2 allows a difference
+of one grade. Cell[r][c] of the agreement matrix is the probability
+that, given that an annotator selected r for a document, another
+selected c for that same document.
+
+Backends which can count label pairs without materializing judgments
+(e.g. in SQL) use these functions on their counts.
+'''
+from collections import defaultdict
+
+def label_pair_counts(judgments):
+    '''
+    Returns a dictionary of (label, label)-count pairs for judgments.
+    '''
+    histograms = defaultdict(lambda: defaultdict(int))
+    for j in judgments:
+        histograms[(j.topic.id, j.document.id)][int(j.value)] += 1
+    counts = defaultdict(int)
+    for histogram in histograms.values():
+        for r, nr in histogram.items():
+            for c, nc in histogram.items():
+                counts[(r, c)] += nr * (nc - (r == c))
+    return dict((k, n) for k, n in counts.items() if n)
+
+def degree_agreement(counts, degree):
+    '''
+    Returns the agreement of the specified degree for label-pair counts.
+    '''
+    total = sum(counts.values())
+    if not total:
+        return 0.0
+    agreed = sum(n for (r, c), n in counts.items() if abs(r - c) < degree)
+    return float(agreed) / total
+
+def agreement_matrix(counts, labels=None):
+    '''
+    Returns the agreement matrix for label-pair counts as a list of rows.
+
+    Arguments:
+
+    counts -- Dictionary of (label, label)-count pairs.
+    labels -- Row and column labels, in order. Defaults to every label
+              present in counts, sorted.
+    '''
+    if labels is None:
+        labels = sorted(set(r for r, _ in counts) | set(c for _, c in counts))
+    matrix = []
+    for r in labels:
+        row   = [counts.get((r, c), 0) for c in labels]
+        total = sum(row)
+        matrix.append([float(n) / total if total else 0.0 for n in row])
+    return matrix
@@ -0,0 +1,242 @@
+'''
+Vectorized agreement engine.
+
+Judgments are encoded once as integer arrays (Topic-Document pair id,
+label index). A single pass of grouped reductions then produces
+label-pair counts for every Topic-Document pair, every topic, every
+document and the whole collection, from which agreement of any degree
+and the agreement matrix follow. Counts are defined as in the agreement
+module. Agreement matrices span one label set for the whole table, so
+they have the same shape for every topic and pair.
+
+The test collection's compute_agreement and compute_agreement_matrix
+remain the reference: verify() compares the engine against them for
+every topic and pair of a DataModel, and running this module does so on
+a directory of AMT result files.
+'''
+import numpy as np
+
+from collections import OrderedDict
+
+class EncodedJudgments(object):
+    '''
+    Judgments encoded as parallel integer arrays.
+    '''
+
+    def __init__(self, judgments, labels=None):
+        '''
+        Arguments:
+
+        judgments -- Judgments to encode.
+        labels    -- Labels to encode values against, in order. Defaults
+                     to every label judged, sorted. A value outside the
+                     labels raises ValueError.
+        '''
+        pairs = OrderedDict()       # (Topic ID, Document ID) -> pair id
+        pair, value = [], []
+        for j in judgments:
+            key = (j.topic.id, j.document.id)
+            pair.append(pairs.setdefault(key, len(pairs)))
+            value.append(int(j.value))
+
+        self.pairs     = list(pairs)                                # pair id -> (Topic ID, Document ID)
+        self.pair      = np.array(pair, dtype=np.int32)
+        values         = np.array(value, dtype=np.int64)
+        if labels is None:
+            self.labels = np.unique(values)                         # label index -> label
+        else:
+            self.labels = np.array(sorted(labels), dtype=np.int64)
+            unknown = np.setdiff1d(values, self.labels)
+            if len(unknown):
+                raise ValueError("Values %s are not among the labels %s." %
+                                 (unknown.tolist(), self.labels.tolist()))
+        self.label     = np.searchsorted(self.labels, values).astype(np.int32)
+
+        # Topic and document of every pair.
+        self.topics    = list(OrderedDict.fromkeys(t for t, _ in self.pairs))
+        self.documents = list(OrderedDict.fromkeys(d for _, d in self.pairs))
+        topic_ids      = dict((t, i) for i, t in enumerate(self.topics))
+        document_ids   = dict((d, i) for i, d in enumerate(self.documents))
+        self.pair_topic    = np.array([topic_ids[t] for t, _ in self.pairs], dtype=np.int32)
+        self.pair_document = np.array([document_ids[d] for _, d in self.pairs], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.pair)
+
+
+def _grouped_sum(groups, counts, size):
+    '''
+    Sums (N, L, L) counts into (size, L, L) by group.
+    '''
+    n, l, _ = counts.shape
+    flat = counts.reshape(n, l * l)
+    out  = np.empty((size, l * l), dtype=np.int64)
+    for k in range(l * l):
+        out[:, k] = np.bincount(groups, weights=flat[:, k], minlength=size)
+    return out.reshape(size, l, l)
+
+
+class AgreementTable(object):
+    '''
+    Label-pair counts for every topic, document and Topic-Document pair
+    of a set of judgments, over the labels of the encoded judgments.
+    '''
+
+    def __init__(self, judgments, labels=None):
+        '''
+        Arguments:
+
+        judgments -- Judgments, or EncodedJudgments.
+        labels    -- Labels of the agreement matrices, as for
+                     EncodedJudgments. Ignored for EncodedJudgments.
+        '''
+        if isinstance(judgments, EncodedJudgments):
+            encoded = judgments
+        else:
+            encoded = EncodedJudgments(judgments, labels)
+        self.encoded = encoded
+        self.labels  = encoded.labels
+
+        P, L = len(encoded.pairs), len(encoded.labels)
+
+        # Per-pair label histograms, then ordered pairs of distinct judgments.
+        histogram = np.bincount(encoded.pair.astype(np.int64) * L + encoded.label,
+                                minlength=P * L).reshape(P, L).astype(np.int64)
+        counts = histogram[:, :, None] * histogram[:, None, :]
+        diagonal = np.arange(L)
+        counts[:, diagonal, diagonal] -= histogram
+
+        self.pair_counts     = counts
+        self.topic_counts    = _grouped_sum(encoded.pair_topic, counts, len(encoded.topics))
+        self.document_counts = _grouped_sum(encoded.pair_document, counts, len(encoded.documents))
+        self.total_counts    = counts.sum(axis=0) if P else np.zeros((L, L), dtype=np.int64)
+
+        self._pair_index     = dict((p, i) for i, p in enumerate(encoded.pairs))
+        self._topic_index    = dict((t, i) for i, t in enumerate(encoded.topics))
+        self._document_index = dict((d, i) for i, d in enumerate(encoded.documents))
+
+    def counts(self, topic=None, document=None):
+        '''
+        Returns the (L, L) label-pair counts for a topic, document, pair
+        or, without filters, all judgments. Returns None if no judgment
+        matches.
+        '''
+        if topic and document:
+            i = self._pair_index.get((topic, document))
+            return None if i is None else self.pair_counts[i]
+        if topic:
+            i = self._topic_index.get(topic)
+            return None if i is None else self.topic_counts[i]
+        if document:
+            i = self._document_index.get(document)
+            return None if i is None else self.document_counts[i]
+        return self.total_counts
+
+    def _agreed(self, degree):
+        labels = self.labels
+        return np.abs(labels[:, None] - labels[None, :]) < degree
+
+    def agreement(self, degree, topic=None, document=None):
+        '''
+        Returns agreement of the specified degree. See the agreement module.
+        '''
+        counts = self.counts(topic, document)
+        if counts is None:
+            return 0.0
+        total = counts.sum()
+        return float(counts[self._agreed(degree)].sum()) / total if total else 0.0
+
+    def agreements(self, degree, level='pair'):
+        '''
+        Returns agreement of the specified degree for every pair, topic
+        or document at once, as a dictionary keyed like the level.
+
+        Arguments:
+
+        level -- One of 'pair', 'topic' or 'document'.
+        '''
+        counts, keys = {'pair'     : (self.pair_counts, self.encoded.pairs),
+                        'topic'    : (self.topic_counts, self.encoded.topics),
+                        'document' : (self.document_counts, self.encoded.documents)}[level]
+        agreed = (counts * self._agreed(degree)).sum(axis=(1, 2))
+        total  = counts.sum(axis=(1, 2))
+        ratio  = np.where(total > 0, agreed / np.maximum(total, 1).astype(float), 0.0)
+        return OrderedDict(zip(keys, ratio.tolist()))
+
+    def matrix(self, topic=None, document=None):
+        '''
+        Returns the agreement matrix as a list of rows, over all labels
+        of the table, so its shape does not depend on the selection.
+        Rows of labels without counts are zero. See the agreement module.
+        '''
+        counts = self.counts(topic, document)
+        if counts is None:
+            counts = np.zeros((len(self.labels),) * 2, dtype=np.int64)
+        totals  = counts.sum(axis=1)
+        rows    = counts / np.maximum(totals, 1)[:, None].astype(float)
+        return rows.tolist()
+
+    def label_pair_counts(self, topic=None, document=None):
+        '''
+        Returns the counts as a dictionary of (label, label)-count pairs.
+        '''
+        counts = self.counts(topic, document)
+        if counts is None:
+            return {}
+        labels = self.labels.tolist()
+        rows, cols = np.nonzero(counts)
+        return dict(((labels[r], labels[c]), int(counts[r, c])) for r, c in zip(rows, cols))
+
+
+def verify(data_model, labels=None):
+    '''
+    Compares the engine against the test collection's compute_agreement
+    and compute_agreement_matrix for all loaded judgments and every
+    topic, document and Topic-Document pair loaded in a DataModel. Values
+    must be equal, and matrices of the same shape. Returns a list of
+    (statistic, topic, document, expected, actual) mismatches.
+    tests/test_agreementengine.py runs it on the data/ files.
+    '''
+    tc    = data_model.test_collection
+    table = AgreementTable(data_model.judged_data, labels)
+    keys  = ([(None, None)] + [(t, None) for t in table.encoded.topics] +
+             [(None, d) for d in table.encoded.documents] + list(table.encoded.pairs))
+
+    mismatches = []
+    for topic, document in keys:
+        filtered = data_model._filtered(topic, document)
+        for degree in (1, 2):
+            expected, _ = tc.compute_agreement(filtered, degree)
+            actual = table.agreement(degree, topic, document)
+            if expected != actual:
+                mismatches.append(('agreement %d' % degree, topic, document, expected, actual))
+        expected = [list(r) for r in tc.compute_agreement_matrix(filtered)]
+        actual   = table.matrix(topic, document)
+        if expected != actual:
+            mismatches.append(('matrix', topic, document, expected, actual))
+    return mismatches
+
+
+if __name__ == "__main__":
+    # Checks the engine against the test collection on a directory of
+    # AMT result files. Exits with status 1 on any mismatch.
+    #
+    # Usage: python agreementengine.py [directory] [collection]
+    import sys
+    import time
+
+    import ingest
+    from datamodel import DataModel
+
+    dm = DataModel(sys.argv[2] if len(sys.argv) > 2 else '2009.mqt')
+    dm.load_files(ingest.find_files(sys.argv[1] if len(sys.argv) > 1 else 'data'))
+
+    start = time.time()
+    AgreementTable(dm.judged_data)
+    print ("Computed %d judgments in %.3fs." % (len(dm.judged_data), time.time() - start))
+
+    mismatches = verify(dm)
+    for m in mismatches:
+        print ("Mismatch in %s for topic %s, document %s: expected %r, got %r" % m)
+    print ("%d mismatches." % len(mismatches))
+    sys.exit(1 if mismatches else 0)
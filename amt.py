@@ -0,0 +1,152 @@
+'''
+Reading of AMT result metadata.
+
+The test collection turns AMT result rows into relevance judgments, but
+keeps none of the assignment details (worker, assignment status, work
+time, ...). This module reads those columns directly and attaches them
+to the corresponding judgments.
+'''
+import csv
+import re
+
+from collections import namedtuple, defaultdict, deque
+
+# Columns of one AMT result row that the CWR uses.
+AMTAssignment = namedtuple('AMTAssignment', ['assignment_id',
+                                             'hit_id',
+                                             'worker_id',
+                                             'status',
+                                             'work_time',
+                                             'approval_rate',
+                                             'topic_id',
+                                             'document_id',
+                                             'document_url',
+                                             'gold_standard',
+                                             'relevance',
+                                             'rationale',
+                                             'feedback'])
+
+_RATE = re.compile(r'\((\d+)/(\d+)\)')
+
+def _int(value, default=None):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+def _rate(value):
+    '''
+    Parses an approval rate such as "100% (91/91)" into a fraction.
+    '''
+    match = _RATE.search(value or '')
+    if not match or not int(match.group(2)):
+        return None
+    return float(match.group(1)) / int(match.group(2))
+
+def parse_row(row):
+    '''
+    Returns the AMTAssignment for a row of an AMT result file, given as
+    a column-value dictionary.
+    '''
+    return AMTAssignment(assignment_id = row.get('AssignmentId'),
+                         hit_id        = row.get('HITId'),
+                         worker_id     = row.get('WorkerId'),
+                         status        = row.get('AssignmentStatus'),
+                         work_time     = _int(row.get('WorkTimeInSeconds')),
+                         approval_rate = _rate(row.get('LifetimeApprovalRate')),
+                         topic_id      = row.get('query_id'),
+                         document_id   = row.get('document_id'),
+                         document_url  = row.get('document_url'),
+                         gold_standard = _int(row.get('gold_standard')),
+                         relevance     = _int(row.get('user_relevance')),
+                         rationale     = row.get('user_rationale'),
+                         feedback      = row.get('user_feedback'))
+
+# Column of each AMTAssignment field, in field order.
+_COLUMNS = ('AssignmentId', 'HITId', 'WorkerId', 'AssignmentStatus', 'WorkTimeInSeconds',
+            'LifetimeApprovalRate', 'query_id', 'document_id', 'document_url', 'gold_standard',
+            'user_relevance', 'user_rationale', 'user_feedback')
+
+def read_assignments(filename):
+    '''
+    Returns the AMTAssignment of every row of an AMT result file, in
+    file order, as parse_row would.
+
+    The test collection imports a file from its path, so the file is
+    read a second time here. This pass only picks out the columns of an
+    AMTAssignment by position and parses each distinct approval rate
+    once.
+    '''
+    with open(filename, 'r') as f:
+        rows   = csv.reader(f)
+        header = next(rows, [])
+        where  = dict((column, i) for i, column in enumerate(header))
+        picks  = [where.get(column) for column in _COLUMNS]
+        rates  = {}
+        assignments = []
+        for row in rows:
+            if not row:
+                continue
+            v = [row[i] if i is not None and i < len(row) else None for i in picks]
+            if v[5] not in rates:
+                rates[v[5]] = _rate(v[5])
+            assignments.append(AMTAssignment(v[0], v[1], v[2], v[3], _int(v[4]), rates[v[5]],
+                                             v[6], v[7], v[8], _int(v[9]), _int(v[10]),
+                                             v[11], v[12]))
+        return assignments
+
+def _normalized(text):
+    '''
+    Returns text with case and whitespace differences removed.
+    '''
+    return ' '.join((text or '').split()).lower()
+
+def annotate(judgments, assignments):
+    '''
+    Sets the "assignment" attribute of each judgment to the AMTAssignment
+    it was imported from, or None if it cannot be told apart.
+
+    A judgment is matched to the rows of its file with the same topic,
+    document, relevance and rationale text, in file order; rows that
+    agree on all of these are indistinguishable to the test collection,
+    which imports rows in file order. Judgments without such a row, as
+    when import_amt_results changed the rationale text, are then matched
+    on the text with case and whitespace differences removed, in file
+    order, but only where as many rows as judgments are left with that
+    text. Otherwise those judgments are left without an assignment
+    rather than given another worker's.
+    '''
+    exact      = defaultdict(deque)     # (Topic ID, Document ID, relevance, rationale) -> [index]
+    normalized = defaultdict(list)      # Same, with the rationale normalized -> [index]
+    for i, a in enumerate(assignments):
+        key = (a.topic_id, a.document_id, a.relevance)
+        exact[key + (a.rationale,)].append(i)
+        normalized[key + (_normalized(a.rationale),)].append(i)
+
+    # Exact matches first, so that a judgment whose text was changed
+    # cannot take the row of one whose text was not.
+    used      = set()
+    unmatched = defaultdict(list)       # Normalized key -> [Judgment]
+    for j in judgments:
+        key = (j.topic.id, j.document.id, _int(j.value))
+        candidates = exact.get(key + (j.rationale,))
+        if candidates:
+            i = candidates.popleft()
+            used.add(i)
+            j.assignment = assignments[i]
+        else:
+            j.assignment = None
+            unmatched[key + (_normalized(j.rationale),)].append(j)
+
+    for key, group in unmatched.items():
+        left = [i for i in normalized.get(key, ()) if i not in used]
+        if len(left) == len(group):
+            for j, i in zip(group, left):
+                j.assignment = assignments[i]
+    return judgments
+
+def assignment(judgment):
+    '''
+    Returns the AMTAssignment attached to a judgment, or None.
+    '''
+    return getattr(judgment, 'assignment', None)
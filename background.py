@@ -0,0 +1,123 @@
+'''
+Debounced, cancellable background computation for the CWR interface.
+'''
+import threading
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+from PyQt4 import QtCore
+
+class Cancelled(Exception):
+    '''
+    Raised inside a computation whose result is no longer wanted.
+    '''
+    pass
+
+class CancellationToken(object):
+    '''
+    Handed to a background computation, which should call check() at
+    convenient points so that it stops early once cancelled.
+    '''
+
+    def __init__(self):
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def check(self):
+        if self._cancelled:
+            raise Cancelled()
+
+class BackgroundTask(QtCore.QObject):
+    '''
+    Runs the latest requested computation on a single worker thread.
+
+    request() may be called any number of times in quick succession; the
+    computation only starts once no new request has arrived for "delay"
+    milliseconds. A new request cancels the computation in flight. The
+    result of the latest computation is delivered on the GUI thread
+    through the "ready" signal, and stale results are discarded.
+    '''
+
+    # (context, result) of a finished computation. Emitted on the GUI thread.
+    ready = QtCore.pyqtSignal(object, object)
+
+    # Internal: (token, context, result), emitted from the worker thread.
+    _finished = QtCore.pyqtSignal(object, object, object)
+
+    def __init__(self, prepare, compute, delay=200, parent=None):
+        '''
+        Arguments:
+
+        prepare -- Called on the GUI thread when a computation starts.
+                   Returns (context, args), or None to skip it. Widgets
+                   should only be read here.
+        compute -- Called on the worker thread as compute(token, *args).
+        delay   -- Debounce delay in milliseconds.
+        '''
+        super(BackgroundTask, self).__init__(parent)
+        self._prepare = prepare
+        self._compute = compute
+        self._token   = None            # Token of the latest computation.
+        self._queue   = queue.Queue()
+
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay)
+        self._timer.timeout.connect(self._start)
+        self._finished.connect(self._deliver)
+
+        self._worker = threading.Thread(target=self._run)
+        self._worker.daemon = True
+        self._worker.start()
+
+    def request(self):
+        '''
+        Requests a computation, cancelling any in flight and restarting
+        the debounce delay.
+        '''
+        self.cancel()
+        self._timer.start()
+
+    def cancel(self):
+        '''
+        Cancels the computation in flight, if any.
+        '''
+        if self._token:
+            self._token.cancel()
+            self._token = None
+
+    def _start(self):
+        prepared = self._prepare()
+        if prepared is None:
+            return
+        context, args = prepared
+        self._token = CancellationToken()
+        self._queue.put((self._token, context, args))
+
+    def _run(self):
+        while True:
+            token, context, args = self._queue.get()
+            if token.cancelled:
+                continue
+            try:
+                result = self._compute(token, *args)
+            except Cancelled:
+                continue
+            except Exception as e:
+                print ("Background computation failed: %s" % e)
+                continue
+            self._finished.emit(token, context, result)
+
+    def _deliver(self, token, context, result):
+        if token is self._token and not token.cancelled:
+            self._token = None
+            self.ready.emit(context, result)
@@ -0,0 +1,379 @@
+'''
+Benchmark suite for the DataModel and rationale overlap hot paths.
+
+For each corpus size, writes a synthetic AMT corpus (see the synthetic
+module) and measures the throughput and peak memory of each case on it:
+generating and parsing the files, adding judgments to each judgment
+store, filtering, agreement, confusion matrices and rationale overlap.
+With a test collection, the corpus is drawn from its gold standard and
+the same paths are also measured through a loaded DataModel.
+
+The application's statistics are computed by the test collection, so
+only the model_ cases measure them. The agreement_proxy and
+confusion_matrix_proxy cases compute similar statistics with the
+agreement module, and serve as a proxy when no collection is given.
+
+Every case runs in its own forked process, so cases do not share caches
+or memory. Throughput is measured in one run and peak memory, traced
+with tracemalloc, in a second one so that tracing does not skew the
+timing. Only memory allocated by Python is traced; SQLite's page cache
+is not included.
+
+Results can be saved as JSON and compared against a saved baseline, in
+which case slower or larger results are flagged.
+
+Usage: python benchmark.py [--sizes 10000,100000,1000000] [--collection MQT]
+                           [--cases CASE,...] [--overlap-documents N]
+                           [--no-memory] [--output FILE] [--baseline FILE]
+'''
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+from collections import namedtuple, OrderedDict
+
+import amt
+import synthetic
+from agreement import label_pair_counts, degree_agreement, agreement_matrix
+from judgmentstore import JudgmentIndex, CompactJudgmentStore
+from sqlitestore import SQLiteJudgmentStore
+from rationale import Rationale
+
+# Measurement of one case on one corpus size. peak_bytes is None if
+# memory was not measured.
+Result = namedtuple('Result', ['size', 'case', 'items', 'unit', 'seconds', 'peak_bytes'])
+
+# Case name -> (setup, unit, needs a DataModel). setup(corpus) prepares
+# the case and returns a function that runs it once and returns the
+# number of items processed.
+CASES = OrderedDict()
+
+def case(name, unit, model=False):
+    def register(setup):
+        CASES[name] = (setup, unit, model)
+        return setup
+    return register
+
+
+class Corpus(object):
+    '''
+    A synthetic corpus of one size, shared by the cases run on it.
+    '''
+
+    def __init__(self, size, directory, pairs=None, collection=None, overlap_documents=200):
+        self.size              = size
+        self.directory         = directory
+        self.pairs             = pairs           # Topic-Document pairs, or None for invented ones.
+        self.collection        = collection      # Test collection path, or None.
+        self.overlap_documents = overlap_documents
+        self.judgments         = None            # Judgment stand-ins, set by load().
+
+    def write(self):
+        return synthetic.write_corpus(self.directory, self.size, pairs=self.pairs)
+
+    @property
+    def files(self):
+        return sorted(os.path.join(self.directory, f) for f in os.listdir(self.directory)
+                      if f.endswith('_rationales.csv'))
+
+    def load(self):
+        '''
+        Reads the corpus files into judgment stand-ins, once, before the
+        cases that use them fork.
+        '''
+        self.judgments = list(synthetic.judgments(self.files))
+
+    def index(self):
+        index = JudgmentIndex()
+        index.add(self.judgments)
+        return index
+
+    def model(self):
+        from datamodel import DataModel
+        dm = DataModel(self.collection)
+        dm.load_files(self.files)
+        return dm
+
+
+def _keys(store):
+    '''
+    Returns the topic IDs and (topic ID, document ID) pairs of a store.
+    '''
+    topics = [t.id for t in store.topics()]
+    pairs  = [(t, d.id) for t in topics for d in store.documents_by_topic(t)]
+    return topics, pairs
+
+@case('generate', 'rows')
+def _generate(corpus):
+    def run():
+        corpus.write()
+        return corpus.size
+    return run
+
+@case('read_assignments', 'rows')
+def _read_assignments(corpus):
+    return lambda: sum(len(amt.read_assignments(f)) for f in corpus.files)
+
+def _add(store_type):
+    def setup(corpus):
+        def run():
+            store = store_type()
+            store.add(corpus.judgments)
+            return len(store)
+        return run
+    return setup
+
+case('store_objects', 'judgments')(_add(JudgmentIndex))
+case('store_compact', 'judgments')(_add(CompactJudgmentStore))
+case('store_sqlite', 'judgments')(_add(SQLiteJudgmentStore))
+
+@case('filtered', 'lookups')
+def _filtered(corpus):
+    index = corpus.index()
+    topics, pairs = _keys(index)
+    def run():
+        for t in topics:
+            index.by_topic(t)
+        for t, d in pairs:
+            index.by_pair(t, d)
+        return len(topics) + len(pairs)
+    return run
+
+@case('agreement_proxy', 'statistics')
+def _agreement_proxy(corpus):
+    index = corpus.index()
+    topics, pairs = _keys(index)
+    def run():
+        for t in topics:
+            counts = label_pair_counts(index.by_topic(t))
+            degree_agreement(counts, 1), degree_agreement(counts, 2)
+        for t, d in pairs:
+            counts = label_pair_counts(index.by_pair(t, d))
+            degree_agreement(counts, 1), degree_agreement(counts, 2)
+        return len(topics) + len(pairs)
+    return run
+
+@case('confusion_matrix_proxy', 'statistics')
+def _confusion_matrix_proxy(corpus):
+    index = corpus.index()
+    topics, pairs = _keys(index)
+    def run():
+        for t in topics:
+            agreement_matrix(label_pair_counts(index.by_topic(t)))
+        for t, d in pairs:
+            agreement_matrix(label_pair_counts(index.by_pair(t, d)))
+        return len(topics) + len(pairs)
+    return run
+
+@case('agreement_table', 'judgments')
+def _agreement_table(corpus):
+    from agreementengine import AgreementTable
+    def run():
+        AgreementTable(corpus.judgments)
+        return len(corpus.judgments)
+    return run
+
+@case('overlap', 'documents')
+def _overlap(corpus):
+    index = corpus.index()
+    _, pairs = _keys(index)
+    work = []
+    for t, d in pairs[:corpus.overlap_documents]:
+        rationales = [Rationale(str(i), j) for i, j in enumerate(index.by_pair(t, d))]
+        work.append((synthetic.document_text(d), rationales))
+    def run():
+        for text, rationales in work:
+            Rationale.compute_overlap(text, rationales)
+        return len(work)
+    return run
+
+@case('model_load', 'judgments', model=True)
+def _model_load(corpus):
+    from datamodel import DataModel
+    dm = DataModel(corpus.collection)
+    def run():
+        dm.load_files(corpus.files)
+        return len(dm.judged_data)
+    return run
+
+def _model_statistic(compute):
+    def setup(corpus):
+        dm = corpus.model()
+        topics = [t.id for t in dm.judged_topics()]
+        pairs  = [(t, d.id) for t in topics for d in dm.judged_documents_by_topic(t)]
+        def run():
+            dm.statistics_cache.clear()
+            for t in topics:
+                compute(dm, t, None)
+            for t, d in pairs:
+                compute(dm, t, d)
+            return len(topics) + len(pairs)
+        return run
+    return setup
+
+case('model_filtered', 'lookups', model=True)(
+    _model_statistic(lambda dm, t, d: dm._filtered(t, d)))
+case('model_agreement', 'statistics', model=True)(
+    _model_statistic(lambda dm, t, d: (dm.agreement(1, t, d), dm.agreement(2, t, d))))
+case('model_confusion_matrix', 'statistics', model=True)(
+    _model_statistic(lambda dm, t, d: dm.confusion_matrix(t, d)))
+
+
+def _measure(setup, corpus, memory, queue):
+    '''
+    Child process entry point. Puts (items, seconds, peak bytes) or an
+    error on the queue.
+    '''
+    try:
+        run = setup(corpus)
+        gc.collect()
+        start = time.time()
+        items = run()
+        seconds = time.time() - start
+
+        peak = None
+        if memory:
+            try:
+                import tracemalloc
+            except ImportError:
+                tracemalloc = None
+            if tracemalloc:
+                run = setup(corpus)
+                gc.collect()
+                tracemalloc.start()
+                run()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+        queue.put((items, seconds, peak))
+    except Exception:
+        queue.put(traceback.format_exc())
+
+def measure(name, corpus, memory=True):
+    '''
+    Runs a case on a corpus in a forked process. Returns its Result, or
+    raises RuntimeError with the error of a failed case.
+    '''
+    setup, unit, _ = CASES[name]
+    queue = multiprocessing.Queue()
+    p = multiprocessing.Process(target=_measure, args=(setup, corpus, memory, queue))
+    p.start()
+    outcome = queue.get()
+    p.join()
+    if not isinstance(outcome, tuple):
+        raise RuntimeError(outcome)
+    items, seconds, peak = outcome
+    return Result(corpus.size, name, items, unit, seconds, peak)
+
+def run(sizes, cases=None, collection=None, overlap_documents=200, memory=True, report=None):
+    '''
+    Runs the cases on corpora of the given sizes. Returns the list of
+    Results, calling report(result, error) as each case finishes.
+
+    Arguments:
+
+    sizes             -- Numbers of judgments of the corpora.
+    cases             -- Names of the cases to run. Defaults to all; the
+                         DataModel cases need a collection.
+    collection        -- Optional path of an MQT test collection.
+    overlap_documents -- Documents used by the overlap case.
+    memory            -- If False, peak memory is not measured.
+    '''
+    pairs = None
+    if collection:
+        from testcollection.mqt import MQT
+        pairs = synthetic.collection_pairs(MQT.load(collection))
+
+    names = list(cases or CASES)
+    if not collection:
+        names = [n for n in names if not CASES[n][2]]
+
+    results = []
+    for size in sizes:
+        directory = tempfile.mkdtemp(prefix='cwr_benchmark_')
+        try:
+            corpus = Corpus(size, directory, pairs, collection, overlap_documents)
+            if 'generate' not in names:
+                corpus.write()
+            for name in names:
+                if corpus.judgments is None and name not in ('generate', 'read_assignments'):
+                    corpus.load()
+                try:
+                    result = measure(name, corpus, memory)
+                except RuntimeError as e:
+                    if report:
+                        report(Result(size, name, None, CASES[name][1], None, None), str(e))
+                    continue
+                results.append(result)
+                if report:
+                    report(result, None)
+        finally:
+            shutil.rmtree(directory)
+    return results
+
+def compare(results, baseline, tolerance=0.2):
+    '''
+    Compares results against baseline results. Returns a list of
+    (result, throughput ratio, memory ratio, regressed) for every case
+    found in both; ratios above 1 are better than the baseline.
+    '''
+    known = dict(((b.size, b.case), b) for b in baseline)
+    compared = []
+    for r in results:
+        b = known.get((r.size, r.case))
+        if not b or not r.seconds or not b.seconds:
+            continue
+        speed = (float(r.items) / r.seconds) / (float(b.items) / b.seconds)
+        space = float(b.peak_bytes) / r.peak_bytes if r.peak_bytes and b.peak_bytes else None
+        regressed = speed < 1 - tolerance or (space is not None and space < 1 - tolerance)
+        compared.append((r, speed, space, regressed))
+    return compared
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the CWR hot paths on synthetic corpora.")
+    parser.add_argument('--sizes', default='10000,100000,1000000',
+                        help="comma-separated numbers of judgments")
+    parser.add_argument('--collection', default=None,
+                        help="MQT test collection, enabling the DataModel cases")
+    parser.add_argument('--cases', default=None,
+                        help="comma-separated cases to run, from: %s" % ', '.join(CASES))
+    parser.add_argument('--overlap-documents', type=int, default=200)
+    parser.add_argument('--no-memory', action='store_true', help="skip peak memory measurement")
+    parser.add_argument('--output', default=None, help="write results to this JSON file")
+    parser.add_argument('--baseline', default=None, help="compare against this JSON file")
+    args = parser.parse_args()
+
+    def report(result, error):
+        if error:
+            print ("%9d %-24s failed:\n%s" % (result.size, result.case, error))
+            return
+        peak = "%10.1f MB" % (result.peak_bytes / 1e6) if result.peak_bytes is not None else "%13s" % "-"
+        print ("%9d %-24s %10d %-10s %9.3fs %12.0f/s %s" %
+               (result.size, result.case, result.items, result.unit, result.seconds,
+                result.items / result.seconds if result.seconds else 0, peak))
+        sys.stdout.flush()
+
+    print ("%9s %-24s %21s %10s %14s %13s" % ('size', 'case', 'items', 'time', 'throughput', 'peak'))
+    results = run([int(s) for s in args.sizes.split(',')],
+                  args.cases.split(',') if args.cases else None,
+                  args.collection, args.overlap_documents, not args.no_memory, report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump([r._asdict() for r in results], f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = [Result(**r) for r in json.load(f)]
+        print ("\nAgainst %s:" % args.baseline)
+        for r, speed, space, regressed in compare(results, baseline):
+            print ("%9d %-24s throughput %5.2fx  memory %s%s" %
+                   (r.size, r.case, speed, "%5.2fx" % space if space else "    -",
+                    "  REGRESSION" if regressed else ""))
@@ -3,11 +3,21 @@ import requests
 import random
 import os
 
+import ingest
 from datamodel import DataModel
-
-from threading import Thread
+from rationale import Rationale
+from matching import coverage_segments
+
+from background import BackgroundTask
+from overlapcache import OverlapCache
+from matchindex import MatchIndex
+from documentstore import DocumentStore, DocumentFetcher
+from statsprefetch import StatisticsPrefetcher
+from listmodel import SortedIdListModel
+from refresh import RefreshScheduler
+from instrument import traced, span
+from watch import ResultWatcher
 from bs4 import BeautifulSoup
-from difflib import SequenceMatcher
 from abc import abstractmethod
 from collections import namedtuple, defaultdict
 from highlightinterface import HighlightWebView, HighlightBox
@@ -21,12 +31,13 @@ from testcollection.mqt import MQTTopic, MQTDocument, MQTRelevanceJudgment, MQT
 
 class CWR(QtGui.QWidget):
     
-    def __init__(self):
-        self._dm = DataModel()              # Primary data model.
+    def __init__(self, snapshot=None, match_index=None, documents=None):
+        self._dm = DataModel(snapshot=snapshot)     # Primary data model.
 
-        self._topics    = []                # All topics for which judgments have been loaded.
-        self._documents = []                # Documents for which we have a judgment for the
-                                            # currently selected topic.
+        self._topics    = []                # IDs of all topics for which judgments have been
+                                            # loaded, sorted.
+        self._documents = []                # IDs of documents for which we have a judgment for
+                                            # the currently selected topic, sorted.
 
         self._selected_topic    = None      # Currently selected topic.
         self._selected_document = None      # Currently selected document.
@@ -34,10 +45,29 @@ class CWR(QtGui.QWidget):
 
         self._display_text = None           # Text of document being manipulated.
 
+        # Local snapshots of judged documents, filled in the background.
+        self._document_store = DocumentStore(documents) if documents else None
+        self._fetcher = DocumentFetcher(self._document_store) if documents else None
+
+        # Statistics of a selected topic's documents, computed in the background.
+        self._statistics_prefetcher = StatisticsPrefetcher(self._dm)
+
         super(CWR, self).__init__()
 
+        # Background rationale overlap computation, and its result cache.
+        backing = {'matches' : MatchIndex(match_index)} if match_index else None
+        self._overlap_cache = OverlapCache(backing=backing)
+        self._overlap_task = BackgroundTask(self._prepare_rationale_display,
+                                            self._compute_rationale_display,
+                                            parent=self)
+        self._overlap_task.ready.connect(self._rationale_display_ready)
+
         self.init_UI()
 
+        # Statistics views, refreshed only when their inputs change.
+        self._refresh = RefreshScheduler()
+        self._register_panels()
+
         # For testing WebView.
         ''' 
         test_url = 'https://en.wikipedia.org/wiki/The_Beatles'
@@ -67,10 +97,17 @@ class CWR(QtGui.QWidget):
         topic_view.setLayout(topic_layout)
         grid.addWidget(topic_view, 0, 0)
 
+        # Topic Filter
+        self._topic_filter = QtGui.QLineEdit()
+        self._topic_filter.setPlaceholderText("Filter topics")
+        topic_layout.addWidget(self._topic_filter)
+
         # Topic List
-        self._topic_list = QtGui.QListWidget()
+        self._topic_model = SortedIdListModel(self)
+        self._topic_list = self._id_list_view(self._topic_model)
         self._topic_list.setSizePolicy(QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Minimum)
-        self._topic_list.itemClicked.connect(self._topic_selected)
+        self._topic_list.clicked.connect(self._topic_selected)
+        self._topic_filter.textChanged.connect(self._topic_model.set_prefix)
         topic_layout.addWidget(self._topic_list)
         
 
@@ -83,10 +120,17 @@ class CWR(QtGui.QWidget):
         document_view.setLayout(document_layout)
         grid.addWidget(document_view, 0, 1)
 
+        # Document Filter
+        self._document_filter = QtGui.QLineEdit()
+        self._document_filter.setPlaceholderText("Filter documents")
+        document_layout.addWidget(self._document_filter)
+
         # Document List
-        self._document_list = QtGui.QListWidget()
+        self._document_model = SortedIdListModel(self)
+        self._document_list = self._id_list_view(self._document_model)
         self._document_list.setSizePolicy(QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Expanding)
-        self._document_list.itemClicked.connect(self._document_selected)
+        self._document_list.clicked.connect(self._document_selected)
+        self._document_filter.textChanged.connect(self._document_model.set_prefix)
         document_layout.addWidget(self._document_list)
 
 
@@ -166,6 +210,10 @@ class CWR(QtGui.QWidget):
         selection_view.setLayout(self._selection_layout)
         rationale_view.addWidget(selection_view, 1, 0)
 
+        # Overlap Cache Statistics
+        self._overlap_cache_view = QtGui.QLabel("Overlap Cache: N/A")
+        rationale_view.addWidget(self._overlap_cache_view, 3, 0)
+
 
         #####################################
         # Worker View                       #
@@ -206,41 +254,94 @@ class CWR(QtGui.QWidget):
         self.setGeometry(300, 300, 1000, 1000)
         self.setWindowTitle("The Crowdworker's Rationale")
         self.show()
+
+    def _id_list_view(self, model):
+        '''
+        Returns a list view over a SortedIdListModel. Rows have a uniform
+        height, so only the visible rows are ever asked for.
+        '''
+        view = QtGui.QListView()
+        view.setModel(model)
+        view.setUniformItemSizes(True)
+        view.setLayoutMode(QtGui.QListView.Batched)
+        view.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
+        return view
         
+    @traced('cwr.load')
     def load(self, directory):
         '''
         Loads rationale data from the specified file.
         '''
         dm = self._dm
-        for dirpath, _, filenames in os.walk(directory):
-            for f in filenames:
-                if f.endswith(".csv"): 
-                    absolute_path = os.path.abspath(os.path.join(dirpath, f))
-                    dm.load(absolute_path)
-        self.update_topic_list(dm.judged_topics())
+        errors = dm.load_files(ingest.find_files(directory, ".csv"))
+        for filename, error in errors.items():
+            print ("Error while loading AMT results from %s:\n%s" % (filename, error))
+        self.update_topic_list(dm.sorted_topic_ids())
         self.update_document_list([])
 
+    def watch(self, directory, interval=2000):
+        '''
+        Keeps the interface current with a live crowdsourcing run: every
+        interval milliseconds, rows added to the AMT result files in
+        directory since the last look are loaded, and the lists and
+        statistics views they affect are refreshed. The first look reads
+        the files present now again, adding only rows that were appended
+        since they were loaded.
+        '''
+        self._watcher = ResultWatcher(self._dm, directory)
+        self._watch_timer = QtCore.QTimer(self)
+        self._watch_timer.timeout.connect(self._poll_results)
+        self._watch_timer.start(interval)
+
+    @traced('cwr.poll_results')
+    def _poll_results(self):
+        '''
+        Loads new AMT results and refreshes what they changed.
+        '''
+        changes = self._watcher.poll()
+        for filename, added in changes.items():
+            if not isinstance(added, int):
+                print ("Error while loading new AMT results from %s:\n%s" % (filename, added))
+        if not any(isinstance(added, int) for added in changes.values()):
+            return
+
+        # Sorted ID lists are replaced only when judgments change them.
+        dm = self._dm
+        if dm.sorted_topic_ids() is not self._topics:
+            self.update_topic_list(dm.sorted_topic_ids())
+        topic, document = self._selected_topic, self._selected_document
+        if topic:
+            if dm.sorted_document_ids(str(topic)) is not self._documents:
+                self.update_document_list(dm.sorted_document_ids(str(topic)))
+            self.update_statistics(str(topic), str(document) if document else None)
+
 #########################################################################################
 # Updateable UI Elements                                                                #
 #########################################################################################
 
+    @traced('cwr.update_topic_list')
     def update_topic_list(self, topics):
         '''
         Updates the topics displayed in Topic View.
+
+        Arguments:
+        topics -- sorted list of topic IDs
         '''
         self._topics = topics
-        self._topic_list.clear()
-        self._topic_list.addItems([t.id for t in topics])
-        self._topic_list.sortItems()   
+        self._topic_model.set_ids(topics)
         
+    @traced('cwr.update_document_list')
     def update_document_list(self, documents):
         '''
         Updates the documents displayed in Document View.
+
+        Arguments:
+        documents -- sorted list of document IDs
         '''
-        self._document_list.clear()
-        self._document_list.addItems(documents)
-        self._document_list.sortItems() 
+        self._documents = documents
+        self._document_model.set_ids(documents)
 
+    @traced('cwr.update_rationale_selection')
     def update_rationale_selection(self, rationales):
         '''
         Regenerates data structures and display logic for rationale selection.
@@ -258,6 +359,9 @@ class CWR(QtGui.QWidget):
                   QtGui.QColor(255, 102, 178), # Light Pink
                   QtGui.QColor(192, 192, 192)] # Light Grey
 
+        # Results for the old rationales are no longer wanted.
+        self._overlap_task.cancel()
+
         # Remove old rationale widgets.
         layout = self._selection_layout
         for i in reversed(range(layout.count())): 
@@ -272,91 +376,109 @@ class CWR(QtGui.QWidget):
             d.stateChanged.connect(self._rationale_selection_changed)
             self._rationales.append(container(rationale = r, color = c, display = d))
             self._selection_layout.addWidget(d)
+        self._refresh.set(rationales=tuple(self._rationales), selection=())
 
     def update_rationale_display(self):
         '''
-        Recomputes rationale overlap and updates display. Expensive.
+        Requests a recomputation of rationale overlap. Expensive, so it runs
+        in the background: rapid successive requests cost one computation,
+        and the display is updated once it finishes.
         '''
-        print ("Updating rationale display...")
-        
-        # Disable rationale selection while updating.
-        for this_rationale in self._rationales:
-            this_rationale.display.setEnabled(False)
-        
-        # Locate selected rationales.
-        selected = []
-        for this_rationale in self._rationales:
-            if this_rationale.display.isChecked():
-                selected.extend([r for r in self._rationales if this_rationale.display.text() == r.rationale.label])
-        print (selected)
+        self._overlap_task.request()
 
-        # Gather text.
-        text = self._rationale_display.get_text()
+    @traced('cwr.prepare_rationale_display')
+    def _prepare_rationale_display(self):
+        '''
+        Gathers the selected rationales and document text for an overlap
+        computation. Runs on the GUI thread. Rationales are matched against
+        the documenttext.MatchText of the page, as in precompute.
+        '''
+        selected = [r for r in self._rationales if r.display.isChecked()]
+        text = self._rationale_display.match_text()
+        return ((selected, text), (text.text, [r.rationale for r in selected], self._overlap_cache))
 
-        # Compute overlap.
-        just_rationales = [r.rationale for r in selected]
-        result = Rationale.compute_overlap(text, just_rationales)
+    @staticmethod
+    def _compute_rationale_display(token, text, rationales, cache):
+        return Rationale.compute_overlap(text, rationales, token, cache)
 
-        # Update display with rationale matches.
-        display = self._rationale_display
-        display.clear()
-        
-        # If more than one rationale is selected, highlight overlap.
-        '''
-        if result.overlap:
-            for string in result.overlap:
-                print ("Highlighted string: %s" % string)
-                display.highlight(string)
-        # Else, highlight single rationale
-        elif result.matches:
-            strings = [QtCore.QString(s) for s in itertools.chain(*[s for s in result.matches.values()])]
-            for string in strings:
-                print ("Highlighting string: %s" % string)
-                display.highlight(string)
-        '''
-
-        for r in just_rationales:
-            display.highlight(r.rationale.rationale)
-            
-        # This is code exclusively for a multi-color highlight interface.
+    @traced('cwr.rationale_display_ready')
+    def _rationale_display_ready(self, context, result):
         '''
-        for rationale, matches in result.matches.items():
-            # Map back to container to find correct color.
-            color = [c.color for c in selected if c.rationale is rationale][0]
-            
-            # Highlight in display.
-            for match in matches:
-                display.highlight(match, color)
+        Updates display with the rationale matches of a finished overlap
+        computation. Text covered by one rationale is highlighted in its
+        color and text covered by more than one in the overlap color, all
+        in a single update.
+        '''
+        selected, text = context
+        self.update_overlap_cache_view()
 
+        # Map back to container to find correct color.
+        colors = dict((c.rationale, c.color) for c in selected)
         overlap_color = QtGui.QColor(255, 255, 102) # Light Yellow
-        for string in result.overlap:
-            display.highlight(string, overlap_color)
-        '''
 
-        # Re-enable rationale selection.
-        for this_rationale in self._rationales:
-            this_rationale.display.setEnabled(True)
+        # Matches are offsets into the MatchText; highlights into the page text.
+        spans = [text.visible_span(m.text_start, m.text_start + m.length) + (rationale,)
+                 for rationale, matches in result.spans.items()
+                 for m in matches]
+        segments = [(s.start, s.end, colors[next(iter(s.owners))] if len(s.owners) == 1 else overlap_color)
+                    for s in coverage_segments(spans)]
+
+        display = self._rationale_display
+        display.clear()
+        display.highlight_segments(segments)
+
+    @traced('cwr.update_overlap_cache_view')
+    def update_overlap_cache_view(self):
+        '''
+        Updates the overlap cache statistics.
+        '''
+        stats  = self._overlap_cache.stats()
+        hits   = sum(stats['hits'].values())
+        misses = sum(stats['misses'].values())
+        self._overlap_cache_view.setText("Overlap Cache: %d hits, %d misses, %.1f/%.0f MB" %
+                                         (hits, misses, stats['bytes'] / 1e6, stats['max_bytes'] / 1e6))
 
+    @traced('cwr.update_statistics')
     def update_statistics(self, topic=None, document=None):
-        self.update_gold_standard_view(topic, document)
-        self.update_topic_view(topic)
-        self.update_rationale_list()
-        self.update_judgment_list()
-        self.update_confusion_matrix(topic, document)
-        self.update_agreement_view(topic, document)
+        '''
+        Updates the statistics views for a selection. Only the views whose
+        inputs changed are refreshed. Statistics of documents are usually
+        prefetched when their topic is selected, and are only computed
+        here if they are not.
+        '''
+        self._refresh.set(topic=topic, document=document, data=self._dm.version)
+        self._refresh.refresh()
 
+    def _register_panels(self):
+        '''
+        Declares which inputs each statistics view depends on.
+        '''
+        refresh = self._refresh
+        refresh.panel('gold_standard', ('topic', 'document', 'data'),
+                      lambda topic, document, _: self.update_gold_standard_view(topic, document))
+        refresh.panel('topic', ('topic', 'data'),
+                      lambda topic, _: self.update_topic_view(topic))
+        refresh.panel('rationale_list', ('rationales', 'selection'), self.update_rationale_list)
+        refresh.panel('judgment_list', ('rationales', 'selection'), self.update_judgment_list)
+        refresh.panel('confusion_matrix', ('topic', 'document', 'data'),
+                      lambda topic, document, _: self.update_confusion_matrix(topic, document))
+        refresh.panel('agreement', ('topic', 'document', 'data'),
+                      lambda topic, document, _: self.update_agreement_view(topic, document))
+
+    @traced('cwr.update_confusion_matrix')
     def update_confusion_matrix(self, topic=None, document=None):
-        cm = self._dm.confusion_matrix(topic, document)
-        self._confusion_matrix.setText(cm)
+        statistics = self._dm.statistics(topic, document)
+        self._confusion_matrix.setText(statistics.confusion_matrix)
 
+    @traced('cwr.update_gold_standard_view')
     def update_gold_standard_view(self, topic, document):
         '''
         Updates the current gold standard view.
         '''
-        if topic and document:
-            value = self._dm.gold_standard(topic, document)
-            self._gold_standard_view.setText("Gold Standard: %s" % value)
+        value = self._dm.statistics(topic, document).gold_standard
+        self._gold_standard_view.setText("Gold Standard: %s" % (value if value is not None else "N/A"))
 
+    @traced('cwr.update_topic_view')
     def update_topic_view(self, topic):
         '''
         Updates the current topic and rationale display.
@@ -365,44 +487,53 @@ class CWR(QtGui.QWidget):
         self._topic_view.setText("<b>Topic</b>: %s" % topic)
         self._narrative_view.setText("%s" % narrative)
         
+    @traced('cwr.update_agreement_view')
     def update_agreement_view(self, topic, document):
         '''
-        Computes and updates the agreement for currently selected Topic or Document.
+        Updates the agreement for currently selected Topic or Document.
         '''
-        d1_agree = self._dm.agreement(1, topic, document)
-        self._d1_agreement_view.setText("D1 Agreement: %f" % d1_agree)
-        d2_agree = self._dm.agreement(2, topic, document)
-        self._d2_agreement_view.setText("D2 Agreement: %f" % d2_agree)
-        
+        statistics = self._dm.statistics(topic, document)
+        self._d1_agreement_view.setText("D1 Agreement: %f" % statistics.d1_agreement)
+        self._d2_agreement_view.setText("D2 Agreement: %f" % statistics.d2_agreement)
+
+    def _displayed_rationales(self, rationales, selection):
+        '''
+        Returns the selected rationale containers, or all of them if none
+        are selected.
+        '''
+        selected = [rationales[i] for i in selection]
+        return selected if selected else rationales
 
-    def update_rationale_list(self):
+    @traced('cwr.update_rationale_list')
+    def update_rationale_list(self, rationales, selection):
         '''
         Updates the worker rationale list. If one or more worker IDs is 
         selected, this will display only the rationales by the selected 
         workers. Otherwise, this will display all rationales for the 
         selected Topic and Document.
+
+        Arguments:
+        rationales -- rationale containers of the selected document
+        selection  -- indexes of the checked rationales
         '''
-        display_text = ''
-        selected = [r for r in self._rationales if r.display.isChecked()]
-        # If none are selected, display all.
-        selected = selected if selected else self._rationales
-        for r in selected:
-            display_text += ('%s\n\n%s\n\n' % (r.rationale.label, r.rationale.rationale.rationale))
-        self._worker_rationales.setText(display_text)
+        self._worker_rationales.setText(''.join(
+            '%s\n\n%s\n\n' % (r.rationale.label, r.rationale.rationale.rationale)
+            for r in self._displayed_rationales(rationales, selection)))
 
-    def update_judgment_list(self, topic=None, document=None):
+    @traced('cwr.update_judgment_list')
+    def update_judgment_list(self, rationales, selection):
         '''
         Updates the worker judgment list. If one or more worker IDs is
         selected, this will display only the judgments of those selected
         workers. Otherwise, this will display the judgments from all workers.
+
+        Arguments:
+        rationales -- rationale containers of the selected document
+        selection  -- indexes of the checked rationales
         '''
-        display_text = ''
-        selected = [r for r in self._rationales if r.display.isChecked()]
-        # If none are selected, display all.
-        selected = selected if selected else self._rationales
-        for r in selected:
-            display_text += ('%s: %s\n' % (r.rationale.label, r.rationale.rationale.value))
-        self._worker_judgments.setText(display_text)
+        self._worker_judgments.setText(''.join(
+            '%s: %s\n' % (r.rationale.label, r.rationale.rationale.value)
+            for r in self._displayed_rationales(rationales, selection)))
         
     def update_rationale_text(self, text):
         '''
@@ -413,15 +544,37 @@ class CWR(QtGui.QWidget):
     def highlight_rationale(self, text):
         self._rationale_display.highlight(text)
 
-    def load_document(self, url):
-        self._rationale_display.load(QUrl(url))
+    @traced('cwr.load_document')
+    def load_document(self, document):
+        '''
+        Displays a document, from the local document store if it has a
+        snapshot of it and from its URL otherwise.
+        '''
+        store = self._document_store
+        content = store.get(document.id) if store else None
+        if content is not None:
+            self._rationale_display.setHtml(content, QUrl(document.url))
+            return
+        self._rationale_display.load(QUrl(document.url))
+        if self._fetcher:
+            self._fetcher.enqueue(document.id, document.url)
+
+    def prefetch_documents(self, document_ids):
+        '''
+        Fetches snapshots of documents into the local document store in
+        the background, in the order given.
+        '''
+        if self._fetcher:
+            dm = self._dm
+            self._fetcher.prefetch([(d, dm.document(d).url) for d in document_ids])
         
 
 #########################################################################################
 # Signals                                                                               #
 #########################################################################################
 
-    def _topic_selected(self, item):
+    @traced('cwr.topic_selected')
+    def _topic_selected(self, index):
         '''
         Handler function - user selects a topic in the Topic View.
         
@@ -429,26 +582,33 @@ class CWR(QtGui.QWidget):
         all documents for which a worker judgment has been loaded
         for that topic. Computes statistics across that topic.
         '''
-        topic_id = item.text()
+        topic_id = self._topic_model.id_at(index.row())
 
-        # Update control selection.
-        self._selected_topic = topic_id
+        # Update control selection. The selected document belonged to the
+        # previous topic.
+        self._selected_topic    = topic_id
+        self._selected_document = None
 
         # Update statistics view.
         self.update_statistics(topic=str(topic_id))
 
-        print ("Loading documents for topic %s" % topic_id)
-        documents = self._dm.judged_documents_by_topic(topic_id)
-        self.update_document_list([d.id for d in documents])
+        with span('cwr.load_documents', topic=topic_id):
+            documents = self._dm.sorted_document_ids(str(topic_id))
+            self.update_document_list(documents)
+
+        # Compute statistics and fetch documents ahead of clicks, in list order.
+        self._statistics_prefetcher.prefetch(str(topic_id), documents)
+        self.prefetch_documents(documents)
 
-    def _document_selected(self, item):
+    @traced('cwr.document_selected')
+    def _document_selected(self, index):
         '''
         Handler function - user select a document in the Document View.
         
         Loads the text from that document into the rationale display
         and computes statistics for that document.
         '''
-        document_id       = item.text()
+        document_id       = self._document_model.id_at(index.row())
         
         # Update control selection.
         self._selected_document = document_id
@@ -457,85 +617,30 @@ class CWR(QtGui.QWidget):
         selected_topic    = self._selected_topic
         selected_document = self._selected_document
 
-        print ("Loading rationales for document %s, topic %s" % (selected_document, selected_topic))
-        rationales = self._dm.judgments(selected_topic, selected_document)
-        rationales = [Rationale(str(random.randint(1,10000)), r) for r in rationales]
-        self.update_rationale_selection(rationales)
+        with span('cwr.load_rationales', topic=selected_topic, document=selected_document):
+            rationales = self._dm.statistics(str(selected_topic), str(selected_document)).judgments
+            rationales = [Rationale(str(random.randint(1,10000)), r) for r in rationales]
+            self.update_rationale_selection(rationales)
 
         # Update statistics view.
         self.update_statistics(str(selected_topic), str(selected_document))
 
         # Load document.
-        document = next((d for d in self._dm.judged_documents() if d.id == selected_document), None)
-        self.load_document(document.url)
+        document = self._dm.document(str(selected_document))
+        self.load_document(document)
         
+    @traced('cwr.rationale_selection_changed')
     def _rationale_selection_changed(self, state):
         '''
         Handler function called when a user selects or deselects a rationale
         check box.
         '''
-        worker = Thread(target=self.update_rationale_display)
-        worker.start()
-    
-    
-class Rationale(object):
-    '''
-    Provides various utilities for analyzing similarity of rationales
-    with respect to each and a source text.
-    '''
-
-    def __init__(self, label, rationale):
-        self.label      = label
-        self.rationale  = rationale 
-
-    @staticmethod
-    def compute_overlap(text, rationales):
-        '''
-        Stores the key-string tuple and, for every tuple stored, computes the 
-        overlap of the string with the source text. Additionally, separately
-        computes overlapping portions of the text common to more than one triple.
-        
-        Arguments:
-        
-        text       -- Source text to compare rationales against.
-        rationales -- Rationales to use for computation. 
-        
-        Returns namedtuple with fields:
-        
-        matches -- Dictionary of rationale-[string] pairs, where the list of strings 
-                   mapped to a rationale are substrings found in the text.
-        overlap -- List of strings that are common to two or more rationales.
-        '''
-        minimum_match_length = 5
-        result = namedtuple('RationaleComputation', ['matches', 'overlap'])
-        
-        # Compute matches
-        matches  = defaultdict(list)
-        for rationale in rationales:
-            # Yes, this is stupid naming by me.
-            rationale_text = rationale.rationale.rationale
-            for match in SequenceMatcher(None, text, rationale_text).get_matching_blocks():
-                start  = match[0]
-                length = match[2]
-                if length > minimum_match_length:
-                    matches[rationale].append(text[start : start + length])
-     
-        # Compute overlap in rationales.
-        overlap = []
-        for pair in itertools.combinations(rationales, 2):
-            string1 = pair[0].rationale.rationale
-            string2 = pair[1].rationale.rationale
-            for match in SequenceMatcher(None, string1, string2).get_matching_blocks():
-                start  = match[0]
-                length = match[2]
-                if length > minimum_match_length:
-                    overlap.append(string1[start : start + length])
-                
-        return result(matches = matches, overlap = overlap)
+        selection = tuple(i for i, r in enumerate(self._rationales) if r.display.isChecked())
+        self._refresh.set(selection=selection)
+        self._refresh.refresh()
+        self.update_rationale_display()
 
 
-
-        
 if __name__ == "__main__":
     import sys
     a = QtGui.QApplication(sys.argv)
@@ -543,8 +648,10 @@ if __name__ == "__main__":
     #t = MyHighlighter()
     #t.show()
     
-    window = CWR()
+    window = CWR(snapshot='cwr.snapshot', match_index='cwr.matches', documents='documents')
     window.load('data')
+    if '--watch' in sys.argv:
+        window.watch('data')
 #    window.update_topic_list(["978", "1067", "1065"])
 #    window.update_document_list(["https://en.wikipedia.org/wiki/Taylor_Swift", "https://en.wikipedia.org/wiki/The_Beatles"])
     
@@ -1,29 +1,224 @@
 from testcollection.mqt import MQTTopic, MQTDocument, MQTRelevanceJudgment, MQT
-from sets import Set
+from collections import OrderedDict, namedtuple
+from statscache import StatisticsCache
+from workerstats import WorkerAggregates
+from snapshot import Snapshot
+from lazymqt import LazyMQT
+from judgmentstore import JudgmentIndex, CompactJudgmentStore
+from sqlitestore import SQLiteJudgmentStore
+from agreement import degree_agreement, agreement_matrix
+import amt
+import ingest
+from instrument import traced
+
+# Statistics shown for a topic or Topic-Document pair. gold_standard and
+# judgments are None without a document.
+Statistics = namedtuple('Statistics', ['gold_standard', 'd1_agreement', 'd2_agreement',
+                                       'confusion_matrix', 'judgments'])
 
 class DataModel(object):
     '''
-    Abstraction for the CWR data model. Eventually, this
-    would ideally be a shim layer for relational db calls.
+    Abstraction for the CWR data model. With the 'sqlite' store, queries
+    are shims over relational db calls, and agreement and confusion
+    matrices are computed from label-pair counts aggregated in SQL, so
+    they do not read judgments into memory. judged_data still reads every
+    judgment. Other stores have the test collection compute statistics
+    on the judgments queried.
     '''
 
-    def __init__(self):
+    # Judgment stores, by name.
+    STORES = ('objects', 'compact', 'sqlite')
+
+    def __init__(self, collection='2009.mqt', snapshot=None, lazy=False, store='objects',
+                 database=':memory:'):
+        '''
+        Arguments:
+
+        collection -- Path of the MQT test collection.
+        snapshot   -- Optional path of an on-disk snapshot used to skip
+                      re-parsing the collection and unchanged AMT files.
+        lazy       -- If True, topics, documents and gold standard
+                      judgments are read from the collection on first
+                      access instead of all at startup.
+        store      -- How judgments are kept: 'objects' keeps the test
+                      collection's judgment objects, 'compact' keeps them
+                      in a CompactJudgmentStore and 'sqlite' in a
+                      SQLiteJudgmentStore, which also counts the labels
+                      behind agreement and confusion matrices in SQL.
+        database   -- Database file used by the 'sqlite' store.
+        '''
+        self._snapshot = Snapshot(snapshot) if snapshot else None
+        self._lazy     = lazy
+
         # All data is captured by test collection.
-        self.test_collection = MQT.load('2009.mqt')
+        loader = LazyMQT.open if lazy else MQT.load
+        if self._snapshot:
+            self.test_collection = self._snapshot.test_collection(collection, loader)
+        else:
+            self.test_collection = loader(collection)
         
-        # Loaded AMT runs.
-        self.judged_data = []
+        # Loaded AMT runs, indexed by topic, document and Topic-Document pair.
+        if store == 'objects':
+            self._store = JudgmentIndex()
+        elif store == 'compact':
+            self._store = CompactJudgmentStore()
+        elif store == 'sqlite':
+            self._store = SQLiteJudgmentStore(database)
+        else:
+            raise ValueError("Unknown judgment store %r, expected one of %s." % (store, self.STORES))
+
+        # True if the store computes label-pair counts itself.
+        self._pushdown = isinstance(self._store, SQLiteJudgmentStore)
+
+        # Topic ID -> Topic. Holds every topic in the test collection, or
+        # only those looked up so far if the collection is lazy.
+        if lazy:
+            self._topics = {}
+        else:
+            self._topics = dict((t.id, t) for t in self.test_collection.topics())
+
+        # Memoized agreement and confusion matrix results.
+        self.statistics_cache = StatisticsCache()
+
+        # Per-worker aggregates, updated as judgments are added.
+        self.worker_aggregates = WorkerAggregates()
+
+        # AssignmentIds of the judgments added so far.
+        self._assignment_ids = set()
+
+        # Agreement for all topics and pairs at once, built on demand.
+        self._agreement_table = None
+
+        # Attribute indexes for filtered statistics, built on demand and
+        # extended as judgments are added.
+        self._filter_index = None
+
+        # Incremented whenever judgments are added.
+        self.version = 0
+
+        # Sorted judged topic IDs (under None) and document IDs by topic
+        # ID, built on first access.
+        self._sorted_ids = {}
         
+    @traced('datamodel.load')
     def load(self, filename):
         '''
-        Loads AMT data into the test collection.
+        Loads one AMT result file. Errors are reported as by load_files.
+        '''
+        return self.load_files([filename])
+
+    @traced('datamodel.load_rows')
+    def load_rows(self, header, records):
+        '''
+        Loads some rows of an AMT result file, given as the raw bytes of
+        the file's header line and of complete CSV records. Used to load
+        rows appended to a file that was already loaded.
+
+        Returns the number of judgments added.
+        '''
+        judgments = ingest.parse_rows(self.test_collection, header, records)
+        return self._add(self._canonical(judgments))
+
+    @traced('datamodel.load_files')
+    def load_files(self, filenames, processes=None):
+        '''
+        Loads several AMT result files, optionally parsing them in
+        parallel. Judgments are merged in the order the files are given.
+
+        Arguments:
+
+        filenames -- Paths of the AMT result files.
+        processes -- Number of worker processes. Defaults to 1, parsing
+                     in this process; see the ingest module.
+
+        If the model has a snapshot, unchanged files are read from it
+        instead of being parsed, and the snapshot is updated afterwards.
+
+        Returns an ordered dictionary of filename-error pairs for every
+        file that failed to load.
         '''
-        try:
-            tc = self.test_collection
-            self.judged_data.extend(tc.import_amt_results(filename))
-        except:
-            # TODO: Pass error upstream.
-            print ("Error while loading AMT results.")
+        filenames = list(filenames)
+        snapshot  = self._snapshot
+
+        # Judgments for each file, from the snapshot where possible.
+        loaded = OrderedDict((f, snapshot.judgments(f) if snapshot else None) for f in filenames)
+        stale  = [f for f, judgments in loaded.items() if judgments is None]
+
+        errors = OrderedDict()
+        for parsed in ingest.parse_files(self.test_collection, stale, processes):
+            if parsed.error:
+                errors[parsed.filename] = parsed.error
+                del loaded[parsed.filename]
+            else:
+                loaded[parsed.filename] = parsed.judgments
+
+        for f, judgments in loaded.items():
+            judgments = self._canonical(judgments)
+            if snapshot and f in stale:
+                snapshot.store(f, judgments)
+            self._add(judgments)
+
+        if snapshot:
+            snapshot.prune()
+            snapshot.write()
+        return errors
+
+    def _canonical(self, judgments):
+        '''
+        Points judgments parsed in another process or read from the
+        snapshot back at this model's Topic and Document objects, so that
+        identity is preserved.
+        '''
+        for j in judgments:
+            j.topic    = self.topic(j.topic.id) or j.topic
+            j.document = self._store.document(j.document.id) or j.document
+        return judgments
+
+    def _add(self, judgments):
+        '''
+        Adds newly loaded judgments to the store and invalidates cached
+        statistics they affect. Judgments whose AssignmentId was already
+        added are skipped, so loading the same rows twice adds them once.
+
+        Returns the number of judgments added.
+        '''
+        judgments = self._unseen(judgments)
+        if not judgments:
+            return 0
+        self._store.add(judgments)
+        self.worker_aggregates.add(judgments)
+        self.statistics_cache.invalidate((j.topic.id, j.document.id) for j in judgments)
+        self._agreement_table = None
+        if self._filter_index is not None:
+            self._filter_index.add(judgments)
+        self.version += 1
+        self._sorted_ids.pop(None, None)
+        for topic_id in set(j.topic.id for j in judgments):
+            self._sorted_ids.pop(topic_id, None)
+        return len(judgments)
+
+    def _unseen(self, judgments):
+        '''
+        Returns the judgments whose AssignmentId has not been added yet,
+        and records their IDs. Judgments without an AssignmentId are kept.
+        '''
+        seen   = self._assignment_ids
+        unseen = []
+        for j in judgments:
+            a = amt.assignment(j)
+            if a is not None and a.assignment_id:
+                if a.assignment_id in seen:
+                    continue
+                seen.add(a.assignment_id)
+            unseen.append(j)
+        return unseen
+
+    @property
+    def judged_data(self):
+        '''
+        All loaded judgments.
+        '''
+        return self._store.judgments()
 
     def all_topics(self):
         '''
@@ -35,15 +230,35 @@ class DataModel(object):
         '''
         Returns all topics for which judgments have been loaded.
         '''
-        return list(set([j.topic for j in self.judged_data]))        
+        return self._store.topics()
+
+    def sorted_topic_ids(self):
+        '''
+        Returns the IDs of all judged topics, sorted. The list is shared
+        and must not be changed.
+        '''
+        ids = self._sorted_ids.get(None)
+        if ids is None:
+            ids = self._sorted_ids[None] = sorted(t.id for t in self.judged_topics())
+        return ids
+
+    def topic(self, topic_id):
+        '''
+        Returns the Topic with the specified ID, or None.
+        '''
+        t = self._topics.get(topic_id)
+        if t is None and self._lazy:
+            t = self.test_collection.find_topic(topic_id)
+            if t:
+                self._topics[topic_id] = t
+        return t
 
     def topic_information(self, topic):
         '''
         Returns (query, narrative) for a specified topic ID. Returns an
         empty string if no narrative is found for the topic.
         '''
-        tc = self.test_collection
-        t = next((t for t in tc.topics() if t.id == topic), None)
+        t = self.topic(topic)
         if t:
             return (t.query, t.narrative)
         else:
@@ -59,8 +274,15 @@ class DataModel(object):
         '''
         Returns all documents for which judgments have been loaded.
         '''
-        return list(Set([j.document for j in self.judged_data]))
+        return self._store.documents()
+
+    def document(self, document_id):
+        '''
+        Returns the judged Document with the specified ID, or None.
+        '''
+        return self._store.document(document_id)
 
+    @traced('datamodel.judged_documents_by_topic')
     def judged_documents_by_topic(self, topic_id):
         '''
         Returns all documents for which judgments have been loaded with
@@ -69,18 +291,34 @@ class DataModel(object):
         Arguments:
         topic_id -- string id of topic
         '''
-        return list(Set([j.document for j in self.judged_data if j.topic.id == topic_id]))
+        return self._store.documents_by_topic(topic_id)
         
+    @traced('datamodel.sorted_document_ids')
+    def sorted_document_ids(self, topic_id):
+        '''
+        Returns the IDs of all documents judged with a topic, sorted. The
+        list is shared and must not be changed.
+        '''
+        ids = self._sorted_ids.get(topic_id)
+        if ids is None:
+            ids = sorted(d.id for d in self.judged_documents_by_topic(topic_id))
+            self._sorted_ids[topic_id] = ids
+        return ids
+
+    @traced('datamodel.judgments')
     def judgments(self, topic_id, document_id):
-        return list(Set([j for j in self.judged_data if 
-                         j.topic.id == topic_id and 
-                         j.document.id == document_id]))
+        '''
+        Returns all loaded judgments for a Topic-Document pair.
+        '''
+        return list(self._store.by_pair(topic_id, document_id))
+
     def all_gs(self):
         '''
         Returns all gold standard judgments.
         '''
         return self.test_collection.gold_standard()
 
+    @traced('datamodel.gold_standard')
     def gold_standard(self, topic_id, document_id):
         '''
         Returns the gold standard judgment for a Topic-Document pair.
@@ -88,50 +326,159 @@ class DataModel(object):
         gs = self.test_collection.find_gold_standard(topic_id, document_id)
         return gs.value
         
-    def agreement(self, degree, topic=None, document=None):
+    @traced('datamodel.agreement')
+    def agreement(self, degree, topic=None, document=None, where=None):
         '''
         Calculates the "degree" of agreement for all loaded judgments. Provides
-        filters for topic and documents. See the test collection module for 
+        filters for topic and documents, and for any other attributes with a
+        filterindex.Filter as where. See the test collection module for 
         more information on this statistic.
         '''
+        topic, document = topic or None, document or None
+        if where is not None:
+            agreement, _ = self.test_collection.compute_agreement(
+                self.select(self._where(topic, document, where)), degree)
+            return agreement
+        compute = lambda: self._agreement(degree, topic, document)
+        return self.statistics_cache.get('agreement', degree, topic, document, compute)
+
+    def _agreement(self, degree, topic, document):
+        if self._pushdown:
+            return degree_agreement(self._store.label_pair_counts(topic, document), degree)
         filtered = self._filtered(topic, document)
-        
-        # Compute.
         agreement, _ = self.test_collection.compute_agreement(filtered, degree)
         return agreement
 
-    def confusion_matrix(self, topic=None, document=None):
+    @traced('datamodel.confusion_matrix')
+    def confusion_matrix(self, topic=None, document=None, where=None):
         '''
-        Computes and returns a confusion matrix for the list of judgments.
+        Computes and returns a confusion matrix for the list of judgments,
+        optionally restricted by a filterindex.Filter as where.
         
         Cell[r][c] of the confusion matrix holds the probability that,
         given that an annotator selected r for a document, another 
         selected c for that same document.
         '''
+        topic, document = topic or None, document or None
+        if where is not None:
+            cm = self.test_collection.compute_agreement_matrix(
+                self.select(self._where(topic, document, where)))
+            return self._confusion_matrix_string(cm)
+        compute = lambda: self._confusion_matrix(topic, document)
+        return self.statistics_cache.get('confusion_matrix', None, topic, document, compute)
+
+    def _confusion_matrix(self, topic, document):
+        if self._pushdown:
+            counts = self._store.label_pair_counts(topic, document)
+            return self._confusion_matrix_string(agreement_matrix(counts, self._store.labels()))
         filtered = self._filtered(topic, document)
-            
-        # Compute.
         cm = self.test_collection.compute_agreement_matrix(filtered)
         return self._confusion_matrix_string(cm)
 
+    @traced('datamodel.statistics')
+    def statistics(self, topic=None, document=None):
+        '''
+        Returns the Statistics for a topic or Topic-Document pair: gold
+        standard, degree 1 and 2 agreement, confusion matrix and the
+        pair's judgments. Cached as one entry, and safe to call from
+        several threads at once.
+        '''
+        topic, document = topic or None, document or None
+        def compute():
+            gold, judgments = None, None
+            if topic and document:
+                try:
+                    gold = self.gold_standard(topic, document)
+                except Exception:
+                    pass
+                judgments = self.judgments(topic, document)
+            return Statistics(gold_standard    = gold,
+                              d1_agreement     = self._agreement(1, topic, document),
+                              d2_agreement     = self._agreement(2, topic, document),
+                              confusion_matrix = self._confusion_matrix(topic, document),
+                              judgments        = judgments)
+        return self.statistics_cache.get('statistics', None, topic, document, compute)
+
+    def has_statistics(self, topic=None, document=None):
+        '''
+        True if the Statistics for a topic or Topic-Document pair are
+        cached.
+        '''
+        return ('statistics', None, topic or None, document or None) in self.statistics_cache
+
+    def worker_statistics(self, worker_id):
+        '''
+        Returns the workerstats.WorkerStatistics of a worker: judgment
+        count, gold accuracy and confusion, agreement with co-judges and
+        work time distribution. Returns None for an unknown worker.
+        '''
+        return self.worker_aggregates.statistics(worker_id)
+
+    def worker_ranking(self, key='gold_accuracy', minimum_judgments=1):
+        '''
+        Returns the WorkerStatistics of all workers, best first by the
+        named field. See WorkerAggregates.ranking.
+        '''
+        return self.worker_aggregates.ranking(key, minimum_judgments)
+
+    @traced('datamodel.agreement_table')
+    def agreement_table(self):
+        '''
+        Returns an AgreementTable over all loaded judgments, which holds
+        agreement counts for every topic, document and Topic-Document
+        pair, computed in one vectorized pass. Its matrices span every
+        label loaded. agreementengine.verify checks it against the test
+        collection. Requires numpy.
+        '''
+        if self._agreement_table is None:
+            from agreementengine import AgreementTable
+            self._agreement_table = AgreementTable(self.judged_data)
+        return self._agreement_table
+
+    @traced('datamodel.filter_index')
+    def filter_index(self):
+        '''
+        Returns a filterindex.FilterIndex over all loaded judgments, for
+        selecting judgments by topic, document, worker, assignment status,
+        approval rate, label, gold standard and work time. Built on the
+        first call; judgments added later are appended to it. Requires
+        numpy.
+        '''
+        if self._filter_index is None:
+            from filterindex import FilterIndex
+            self._filter_index = FilterIndex(self.judged_data)
+        return self._filter_index
+
+    def select(self, where):
+        '''
+        Returns the loaded judgments matching a filterindex.Filter.
+        '''
+        return self.filter_index().select(where)
+
+    def _where(self, topic, document, where):
+        from filterindex import Is
+        if topic:
+            where = Is('topic', topic) & where
+        if document:
+            where = Is('document', document) & where
+        return where
+
     def _confusion_matrix_string(self, cm):
-        as_string = ''
-        for r in range(len(cm)):
-            for c in range(len(cm[r])):
-                as_string += ('%f ' % cm[r][c])
-            as_string += '\n'
-        return as_string
+        return ''.join(''.join('%f ' % value for value in row) + '\n' for row in cm)
 
+    @traced('datamodel.filtered')
     def _filtered(self, topic=None, document=None):
         '''
-        From judged data, filters by Topic and Document.
+        From judged data, filters by Topic and Document using the
+        maintained indexes.
         '''
-        filtered = self.judged_data
+        if topic and document:
+            return self._store.by_pair(topic, document)
         if topic:
-            filtered = [j for j in filtered if j.topic.id == topic]
+            return self._store.by_topic(topic)
         if document:
-            filtered = [j for j in filtered if j.document.id == document]
-        return filtered
+            return self._store.by_document(document)
+        return self._store.judgments()
             
 
     
@@ -0,0 +1,338 @@
+'''
+Local store of judged document content, and a fetcher to fill it.
+
+Each document is kept as a snapshot of its content under its document
+ID, with a small metadata file recording where and when it was fetched
+and its Content-Type. The raw bytes are stored, and stored and
+downloaded content are decoded by the same charset rule.
+The fetcher downloads documents with a bounded number of worker threads,
+each reusing one HTTP connection pool, and can prefetch a list of
+documents in the background in list order.
+'''
+import codecs
+import json
+import os
+import re
+import threading
+import time
+import traceback
+
+try:
+    import Queue as queue
+    from urllib import quote
+except ImportError:
+    import queue
+    from urllib.parse import quote
+
+from instrument import traced
+
+# Charset parameter of a Content-Type value.
+_CHARSET = re.compile(r'''charset\s*=\s*["']?\s*([-\w.:]+)''', re.I)
+
+# Meta elements, looked for in the first bytes of a document as browsers
+# do. A UTF-16 declaration there cannot be right, and means UTF-8.
+_META        = re.compile(r'<meta\b[^>]*>', re.I)
+META_PRESCAN = 1024
+
+def _codec(value):
+    '''
+    Returns the codec name of the charset in a Content-Type value or
+    meta element, or None if there is none or it is unknown.
+    '''
+    found = _CHARSET.search(value) if value else None
+    if found:
+        try:
+            return codecs.lookup(found.group(1)).name
+        except LookupError:
+            pass
+    return None
+
+def decode(content, content_type=None):
+    '''
+    Decodes the raw content of a document: with the charset of its
+    Content-Type header, else the charset declared by a <meta> element
+    near the start of the document, else UTF-8. Bytes that do not decode
+    are replaced.
+    '''
+    codec = _codec(content_type)
+    if codec is None:
+        declared = [_codec(m) for m in _META.findall(content[:META_PRESCAN].decode('latin-1'))]
+        codec    = next((c for c in declared if c), 'utf-8')
+        if codec.startswith('utf-16'):
+            codec = 'utf-8'
+    return content.decode(codec, 'replace')
+
+class DocumentStore(object):
+    '''
+    Directory of document snapshots, keyed by document ID.
+    '''
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, document_id):
+        return os.path.join(self.directory, quote(document_id, safe=''))
+
+    def __contains__(self, document_id):
+        return os.path.exists(self._path(document_id))
+
+    def get(self, document_id):
+        '''
+        Returns the stored content of a document as text, or None.
+        '''
+        try:
+            with open(self._path(document_id), 'rb') as f:
+                content = f.read()
+        except IOError:
+            return None
+        return decode(content, (self.metadata(document_id) or {}).get('content_type'))
+
+    def metadata(self, document_id):
+        '''
+        Returns the metadata dictionary of a stored document, or None.
+        '''
+        try:
+            with open(self._path(document_id) + '.json', 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def put(self, document_id, url, content, status=None, content_type=None):
+        '''
+        Stores the content of a document. The content is written before
+        becoming visible, so readers never see a partial snapshot.
+
+        Arguments:
+
+        content      -- Raw bytes as served. Text is stored as UTF-8.
+        content_type -- Content-Type header it was served with.
+        '''
+        path = self._path(document_id)
+        if not isinstance(content, bytes):
+            content = content.encode('utf-8')
+        with open(path + '.json.tmp', 'w') as f:
+            json.dump({'document_id'  : document_id,
+                       'url'          : url,
+                       'status'       : status,
+                       'content_type' : content_type,
+                       'fetched'      : time.time(),
+                       'bytes'        : len(content)}, f)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(content)
+        os.rename(path + '.json.tmp', path + '.json')
+        os.rename(path + '.tmp', path)
+
+
+class DocumentFetcher(object):
+    '''
+    Fetches documents into a DocumentStore with a bounded number of
+    worker threads. Every worker keeps its own HTTP session, so
+    connections to the same host are reused across documents.
+    '''
+
+    def __init__(self, store, concurrency=8, timeout=30, session_factory=None):
+        '''
+        Arguments:
+
+        store           -- DocumentStore to fill.
+        concurrency     -- Number of worker threads.
+        timeout         -- Per-request timeout in seconds.
+        session_factory -- Returns a new HTTP session for a worker.
+                           Defaults to requests.Session.
+        '''
+        self.store           = store
+        self.concurrency     = concurrency
+        self.timeout         = timeout
+        self.session_factory = session_factory
+
+        self._queue      = queue.Queue()
+        self._generation = 0            # Incremented to drop queued prefetches.
+        self._lock       = threading.Lock()
+        self._pending    = set()        # Document IDs queued or in flight.
+        self._local      = threading.local()
+        self.errors      = {}           # Document ID -> error of last failed fetch.
+        self._workers    = []
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            if self.session_factory:
+                session = self.session_factory()
+            else:
+                import requests
+                session = requests.Session()
+            self._local.session = session
+        return session
+
+    def download(self, url):
+        '''
+        Downloads a URL on the calling thread without storing it. Returns
+        the text, decoded as stored documents are. Raises the HTTP error of
+        a failed request.
+        '''
+        response = self._session().get(url, timeout=self.timeout)
+        response.raise_for_status()
+        return decode(response.content, response.headers.get('Content-Type'))
+
+    @traced('documentstore.fetch_one')
+    def fetch_one(self, document_id, url):
+        '''
+        Fetches one document into the store on the calling thread.
+        Returns None on success, or the error.
+        '''
+        try:
+            response = self._session().get(url, timeout=self.timeout)
+            response.raise_for_status()
+            self.store.put(document_id, url, response.content, response.status_code,
+                           response.headers.get('Content-Type'))
+            self.errors.pop(document_id, None)
+            return None
+        except Exception:
+            error = traceback.format_exc()
+            self.errors[document_id] = error
+            return error
+
+    def fetch(self, documents):
+        '''
+        Fetches (document ID, URL) pairs that are not stored yet and waits
+        for them. Returns a dictionary of document ID-error pairs for every
+        document that could not be fetched.
+        '''
+        documents = [(d, u) for d, u in documents if d not in self.store]
+        done = threading.Event()
+        remaining = [len(documents)]
+        errors = {}
+        def finished(document_id, error):
+            with self._lock:
+                if error:
+                    errors[document_id] = error
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    done.set()
+        if not documents:
+            return errors
+        for document_id, url in documents:
+            self._submit(document_id, url, finished, force=True)
+        done.wait()
+        return errors
+
+    def prefetch(self, documents):
+        '''
+        Queues (document ID, URL) pairs that are not stored yet for
+        fetching in the background, in order. Replaces any prefetches
+        still queued from an earlier call.
+        '''
+        with self._lock:
+            self._generation += 1
+            self._pending.clear()
+        for document_id, url in documents:
+            if document_id not in self.store:
+                self._submit(document_id, url)
+
+    def enqueue(self, document_id, url):
+        '''
+        Queues one document for fetching in the background, without
+        dropping queued prefetches.
+        '''
+        if document_id not in self.store:
+            self._submit(document_id, url, force=True)
+
+    def _submit(self, document_id, url, callback=None, force=False):
+        with self._lock:
+            if not force and document_id in self._pending:
+                return
+            self._pending.add(document_id)
+            generation = None if force else self._generation
+            self._start_workers()
+        self._queue.put((generation, document_id, url, callback))
+
+    def _start_workers(self):
+        while len(self._workers) < self.concurrency:
+            worker = threading.Thread(target=self._run)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def _run(self):
+        while True:
+            generation, document_id, url, callback = self._queue.get()
+            error = None
+            stale = generation is not None and generation != self._generation
+            if not stale and document_id not in self.store:
+                error = self.fetch_one(document_id, url)
+            with self._lock:
+                self._pending.discard(document_id)
+            if callback:
+                callback(document_id, error)
+
+
+if __name__ == "__main__":
+    # Fetches synthetic documents from a local HTTP stand-in and reports
+    # throughput.
+    #
+    # Usage: python documentstore.py [documents] [concurrency]
+    import shutil
+    import sys
+    import tempfile
+
+    try:
+        from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+        from SocketServer import ThreadingMixIn
+    except ImportError:
+        from http.server import HTTPServer, BaseHTTPRequestHandler
+        from socketserver import ThreadingMixIn
+
+    count       = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    latency     = 0.05
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(latency)
+            if self.path.startswith('/gone'):
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = ('<html><body><p>Document %s</p></body></html>' % self.path).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever).start()
+    base = 'http://127.0.0.1:%d' % server.server_address[1]
+
+    directory = tempfile.mkdtemp(prefix='cwr_documents_')
+    try:
+        documents = [('doc%05d' % i, '%s/doc%05d' % (base, i)) for i in range(count)]
+        documents.append(('gone', base + '/gone'))
+        store   = DocumentStore(directory)
+        fetcher = DocumentFetcher(store, concurrency)
+
+        start  = time.time()
+        errors = fetcher.fetch(documents)
+        took   = time.time() - start
+        print ("Fetched %d documents in %.2fs (%.0f/s, %d errors; serial would take %.2fs)" %
+               (count, took, count / took, len(errors), (count + 1) * latency))
+        assert list(errors) == ['gone']
+        assert store.get('doc00007') == u'<html><body><p>Document /doc00007</p></body></html>'
+
+        start = time.time()
+        fetcher.fetch(documents[:-1])
+        print ("Re-fetch of stored documents took %.3fs" % (time.time() - start))
+    finally:
+        server.shutdown()
+        shutil.rmtree(directory)
@@ -0,0 +1,212 @@
+'''
+Visible text of HTML documents, with a map back to the DOM.
+
+The text of a page is the concatenation of its text nodes, in document
+order, skipping those inside elements that are never displayed. Every
+character offset into that text therefore maps to exactly one
+(text node, offset within node) position, which is what highlighting
+needs to land in the right place.
+
+html_text extracts the same text offline. It builds the document tree
+with html5lib, which implements the HTML5 parsing algorithm WebKit
+uses, so scripts, entities, <br>, stray text after </body> and text
+inside tables end up in the same text nodes as in the page. Neither side
+consults styles: text hidden with CSS is part of the text on both.
+
+Rationales are matched against MatchText, the visible text with runs of
+whitespace collapsed, so the viewer and the offline precomputation agree
+on the text and its digest.
+
+Offsets are Python code point offsets. The page counts UTF-16 code
+units, which differ after any character outside the Basic Multilingual
+Plane, so TextMap converts offsets passed to and from the page.
+'''
+import re
+import sys
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+# Runs of whitespace, collapsed to one space in MatchText.
+_WHITESPACE = re.compile(u'\\s+', re.UNICODE)
+
+# Characters stored as two UTF-16 code units. On narrow Python 2 builds
+# strings are UTF-16 already, and offsets need no conversion.
+_ASTRAL = re.compile(u'[\U00010000-\U0010FFFF]', re.UNICODE) if sys.maxunicode > 0xFFFF else None
+
+# Elements whose text is never displayed.
+HIDDEN_ELEMENTS = ('script', 'style', 'noscript', 'template', 'head', 'title')
+
+# Defines, in the page, a function returning the visible text nodes of
+# the document and their start offsets into the visible text.
+_COLLECT_JS = '''
+window.__cwrCollect = window.__cwrCollect || function () {
+    var hidden = {%s};
+    var root   = document.body || document.documentElement;
+    var walker = document.createTreeWalker(root, NodeFilter.SHOW_TEXT, null, false);
+    var nodes = [], starts = [], offset = 0, node, parent, visible;
+    while ((node = walker.nextNode())) {
+        visible = true;
+        for (parent = node.parentNode; parent && parent !== root; parent = parent.parentNode) {
+            if (hidden[parent.nodeName]) { visible = false; break; }
+        }
+        if (!visible || !node.data.length) continue;
+        nodes.push(node);
+        starts.push(offset);
+        offset += node.data.length;
+    }
+    return {nodes: nodes, starts: starts};
+};
+''' % ', '.join('%s: 1' % e.upper() for e in HIDDEN_ELEMENTS)
+
+# Run in the page. Returns the visible text and text node start offsets
+# as JSON.
+EXTRACT_TEXT_JS = _COLLECT_JS + '''
+(function () {
+    var collected = window.__cwrCollect(), parts = [];
+    for (var i = 0; i < collected.nodes.length; i++) parts.push(collected.nodes[i].data);
+    return JSON.stringify({text: parts.join(''), starts: collected.starts});
+})();
+'''
+
+# Run in the page. Removes every highlight added by HIGHLIGHT_JS.
+CLEAR_HIGHLIGHTS_JS = '''
+(function () {
+    var spans = document.querySelectorAll('span.__cwr-highlight'), parents = [];
+    for (var i = 0; i < spans.length; i++) {
+        var span = spans[i], parent = span.parentNode;
+        while (span.firstChild) parent.insertBefore(span.firstChild, span);
+        parent.removeChild(span);
+        parents.push(parent);
+    }
+    for (var i = 0; i < parents.length; i++) parents[i].normalize();
+})();
+'''
+
+# Run in the page, formatted with a JSON list of [start, end, color]
+# segments that are sorted and do not overlap. Wraps each segment in a
+# colored span, in one pass over the text nodes. Segments are applied
+# from last to first, so splitting a text node never moves text that is
+# still to be wrapped.
+HIGHLIGHT_JS = _COLLECT_JS + CLEAR_HIGHLIGHTS_JS + '''
+(function (segments) {
+    var collected = window.__cwrCollect(), nodes = collected.nodes, starts = collected.starts;
+    var n = nodes.length - 1;
+    for (var s = segments.length - 1; s >= 0; s--) {
+        var start = segments[s][0], end = segments[s][1], color = segments[s][2];
+        while (n >= 0 && starts[n] >= end) n--;
+        for (var i = n; i >= 0 && starts[i] + nodes[i].data.length > start; i--) {
+            var node = nodes[i];
+            var from = Math.max(start - starts[i], 0);
+            var to   = Math.min(end - starts[i], node.data.length);
+            if (from >= to) continue;
+            var range = document.createRange();
+            range.setStart(node, from);
+            range.setEnd(node, to);
+            var span = document.createElement('span');
+            span.className = '__cwr-highlight';
+            span.style.backgroundColor = color;
+            range.surroundContents(span);
+        }
+    }
+})(%s);
+'''
+
+class TextMap(object):
+    '''
+    Visible text of a document and the start offset of each of its
+    text nodes.
+    '''
+
+    def __init__(self, text, starts):
+        self.text   = text
+        self.starts = starts
+        # Code point offsets of characters taking two UTF-16 code units.
+        self._astral = [m.start() for m in _ASTRAL.finditer(text)] if _ASTRAL else []
+
+    @classmethod
+    def from_page(cls, text, starts):
+        '''
+        Returns the TextMap of the result of EXTRACT_TEXT_JS, whose start
+        offsets are in UTF-16 code units.
+        '''
+        result = cls(text, starts)
+        if result._astral:
+            units = [offset + i for i, offset in enumerate(result._astral)]
+            result.starts = [start - bisect_right(units, start - 2) for start in starts]
+        return result
+
+    def __len__(self):
+        return len(self.text)
+
+    def page_offset(self, offset):
+        '''
+        Returns the UTF-16 offset into the page text of a text offset.
+        '''
+        return offset + bisect_left(self._astral, offset)
+
+    def dom_position(self, offset):
+        '''
+        Returns (text node index, offset within node) for a text offset.
+        '''
+        node = max(bisect_right(self.starts, offset) - 1, 0)
+        return (node, offset - self.starts[node]) if self.starts else (0, offset)
+
+class MatchText(object):
+    '''
+    Text rationales are matched against: visible text with every run of
+    whitespace collapsed to one space, and leading and trailing whitespace
+    removed. Offsets into it map back to the visible text.
+    '''
+
+    def __init__(self, visible):
+        self.visible = visible
+        parts, origins = [], array('l')     # origins: offset -> offset into visible
+        position = 0
+        for run in _WHITESPACE.finditer(visible):
+            parts.append(visible[position:run.start()])
+            origins.extend(range(position, run.start()))
+            if origins and run.end() < len(visible):
+                parts.append(u' ')
+                origins.append(run.start())
+            position = run.end()
+        parts.append(visible[position:])
+        origins.extend(range(position, len(visible)))
+        self.text    = u''.join(parts)
+        self.origins = origins
+
+    def __len__(self):
+        return len(self.text)
+
+    def visible_span(self, start, end):
+        '''
+        Returns the (start, end) offsets into the visible text of the
+        text between two offsets.
+        '''
+        if end <= start:
+            at = self.origins[start] if start < len(self.origins) else len(self.visible)
+            return (at, at)
+        return (self.origins[start], self.origins[end - 1] + 1)
+
+def html_text(html):
+    '''
+    Returns the TextMap of an HTML document, extracted the same way as
+    EXTRACT_TEXT_JS does in a rendered page. Requires BeautifulSoup and
+    html5lib.
+    '''
+    from bs4 import BeautifulSoup, Comment, Doctype, ProcessingInstruction, CData
+
+    soup = BeautifulSoup(html, "html5lib")
+    root = soup.body or soup
+    parts, starts, offset = [], [], 0
+    for node in root.find_all(text=True):
+        if isinstance(node, (Comment, Doctype, ProcessingInstruction, CData)):
+            continue
+        if any(p.name in HIDDEN_ELEMENTS for p in node.parents if p is not root):
+            continue
+        if not node:
+            continue
+        starts.append(offset)
+        parts.append(node)
+        offset += len(node)
+    return TextMap(u''.join(parts), starts)
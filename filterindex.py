@@ -0,0 +1,360 @@
+'''
+Bitmap-indexed multi-criteria filtering of judgments.
+
+FilterIndex indexes loaded judgments by the attributes analysts slice
+by: topic, document, worker, assignment status, approval rate, relevance
+label, gold standard label, agreement with the gold standard and work
+time. Filters are built from Is and Between terms combined with & (and),
+| (or) and ~ (not), for example
+
+    (Is('status', 'Approved') & Between('approval_rate', 0.95)) | Is('worker', 'A1HV2V9M87ZTM9')
+
+and resolve to a bitmap of matching judgments by bitwise operations.
+Attributes with few distinct values keep a bitmap per value; the others
+keep the row numbers of each value, and numeric attributes keep their
+row numbers sorted by value, from which the bitmap of a range is set.
+Judgments loaded later are appended to the indexes in place. The
+DataModel computes agreement and agreement matrices on a selection with
+the test collection. Requires numpy.
+'''
+from abc import abstractmethod
+from numbers import Integral
+
+import numpy as np
+
+import amt
+
+# Attributes with discrete values, and those compared by range.
+CATEGORICAL = ('topic', 'document', 'worker', 'status', 'relevance', 'gold_standard',
+               'gold_agreement')
+NUMERIC     = ('approval_rate', 'work_time')
+
+try:
+    _TEXT = basestring
+except NameError:
+    _TEXT = str
+
+# Type of the known values of each categorical attribute. Is rejects
+# values of any other type: they would match nothing, or, as True == 1,
+# a boolean would match the integer label and an integer the boolean.
+TYPES = {'topic'          : _TEXT,
+         'document'       : _TEXT,
+         'worker'         : _TEXT,
+         'status'         : _TEXT,
+         'relevance'      : Integral,
+         'gold_standard'  : Integral,
+         'gold_agreement' : bool}
+
+# Categorical attributes with at most this many distinct values keep a
+# bitmap per value.
+DENSE_LIMIT = 64
+
+def _attributes(j):
+    '''
+    Returns the attribute values of a judgment, in the order of
+    CATEGORICAL + NUMERIC. Unknown values are None.
+    '''
+    a = amt.assignment(j)
+    try:
+        relevance = int(j.value)
+    except (TypeError, ValueError):
+        relevance = None
+    gold = a.gold_standard if a else None
+    agrees = None if gold is None or relevance is None else relevance == gold
+    return (j.topic.id, j.document.id,
+            a.worker_id if a else None,
+            a.status if a else None,
+            relevance, gold, agrees,
+            a.approval_rate if a else None,
+            a.work_time if a else None)
+
+
+class Filter(object):
+    '''
+    A condition on judgments. Combine with &, | and ~.
+    '''
+
+    def __and__(self, other):
+        return _Combined(np.bitwise_and, self, other)
+
+    def __or__(self, other):
+        return _Combined(np.bitwise_or, self, other)
+
+    def __invert__(self):
+        return _Not(self)
+
+    @abstractmethod
+    def bitmap(self, index):
+        '''
+        Returns the packed bitmap of the judgments of a FilterIndex that
+        match.
+        '''
+        pass
+
+class Is(Filter):
+    '''
+    Matches judgments whose attribute has one of the specified values,
+    of the attribute's type in TYPES, or None for judgments where it is
+    unknown.
+    '''
+
+    def __init__(self, attribute, *values):
+        if attribute not in CATEGORICAL:
+            raise ValueError("Unknown attribute %r, expected one of %s." % (attribute, CATEGORICAL))
+        expected = TYPES[attribute]
+        for v in values:
+            if v is not None and (not isinstance(v, expected) or
+                                  (expected is not bool and isinstance(v, bool))):
+                raise ValueError("Value %r of %r is not a %s." % (v, attribute, expected.__name__))
+        self.attribute = attribute
+        self.values    = values
+
+    def bitmap(self, index):
+        return index._values_bitmap(self.attribute, self.values)
+
+class Between(Filter):
+    '''
+    Matches judgments whose numeric attribute is within [low, high].
+    Either bound may be None. Judgments without a value never match.
+    '''
+
+    def __init__(self, attribute, low=None, high=None):
+        if attribute not in NUMERIC:
+            raise ValueError("Unknown attribute %r, expected one of %s." % (attribute, NUMERIC))
+        self.attribute = attribute
+        self.low       = low
+        self.high      = high
+
+    def bitmap(self, index):
+        return index._range_bitmap(self.attribute, self.low, self.high)
+
+class _Combined(Filter):
+
+    def __init__(self, operation, left, right):
+        self.operation = operation
+        self.left      = left
+        self.right     = right
+
+    def bitmap(self, index):
+        return self.operation(self.left.bitmap(index), self.right.bitmap(index))
+
+class _Not(Filter):
+
+    def __init__(self, term):
+        self.term = term
+
+    def bitmap(self, index):
+        return np.bitwise_and(np.invert(self.term.bitmap(index)), index._everything)
+
+
+class FilterIndex(object):
+    '''
+    Attribute indexes over a list of judgments. Judgments are numbered
+    by their position in the list; add() appends to the list and
+    extends the indexes in place.
+    '''
+
+    def __init__(self, judgments=()):
+        self.judgments = []
+        self.size      = 0
+        self._dense    = {}     # Attribute -> {value: bitmap}
+        self._sparse   = {}     # Attribute -> {value: rows}
+        self._sorted   = {}     # Attribute -> (sorted values, rows in that order)
+
+        # Bitmaps are allocated for capacity judgments and grow by
+        # doubling, so appending does not copy them every time. Bits past
+        # size are always clear.
+        self._capacity   = 0
+        self._everything = np.zeros(0, dtype=np.uint8)
+        self.add(judgments)
+
+    def add(self, judgments):
+        '''
+        Appends judgments and indexes them. Costs time proportional to the
+        judgments added, apart from the sorted numeric indexes, which are
+        merged in one vectorized copy.
+        '''
+        judgments = list(judgments)
+        start = self.size
+        self.judgments.extend(judgments)
+        self.size += len(judgments)
+        self._reserve(self.size)
+
+        columns = list(zip(*[_attributes(j) for j in judgments])) or \
+                  [()] * (len(CATEGORICAL) + len(NUMERIC))
+
+        for attribute, column in zip(CATEGORICAL, columns):
+            codes = {}
+            coded = np.array([codes.setdefault(v, len(codes)) for v in column], dtype=np.int32)
+            order  = np.argsort(coded, kind='mergesort').astype(np.int32)
+            bounds = np.searchsorted(coded[order], np.arange(len(codes) + 1))
+            groups = [(v, order[bounds[i]:bounds[i + 1]] + start) for i, v in enumerate(codes)]
+            self._add_categorical(attribute, groups, start)
+
+        for attribute, column in zip(NUMERIC, columns[len(CATEGORICAL):]):
+            known  = np.array([i for i, v in enumerate(column) if v is not None], dtype=np.int32)
+            values = np.array([column[i] for i in known], dtype=np.float64)
+            order  = np.argsort(values, kind='mergesort')
+            values, rows = values[order], known[order] + start
+            if attribute in self._sorted:
+                # Later rows go after equal values, keeping rows sorted by
+                # (value, row).
+                old_values, old_rows = self._sorted[attribute]
+                at     = np.searchsorted(old_values, values, 'right')
+                values = np.insert(old_values, at, values)
+                rows   = np.insert(old_rows, at, rows)
+            self._sorted[attribute] = (values, rows)
+
+        self._set_rows(self._everything, np.arange(start, self.size, dtype=np.int32), start)
+
+    def _add_categorical(self, attribute, groups, start):
+        if attribute not in self._dense and attribute not in self._sparse:
+            (self._dense if len(groups) <= DENSE_LIMIT else self._sparse)[attribute] = {}
+        bitmaps = self._dense.get(attribute)
+        if bitmaps is not None and len(set(bitmaps).union(v for v, _ in groups)) > DENSE_LIMIT:
+            # Too many values for a bitmap each from now on.
+            self._sparse[attribute] = dict((v, np.flatnonzero(np.unpackbits(b)[:start]).astype(np.int32))
+                                           for v, b in bitmaps.items())
+            del self._dense[attribute]
+            bitmaps = None
+        if bitmaps is not None:
+            for v, rows in groups:
+                if v not in bitmaps:
+                    bitmaps[v] = np.zeros(self._capacity, dtype=np.uint8)
+                self._set_rows(bitmaps[v], rows, start)
+        else:
+            lists = self._sparse[attribute]
+            for v, rows in groups:
+                lists[v] = np.concatenate((lists[v], rows)) if v in lists else rows
+
+    def _reserve(self, size):
+        '''
+        Grows every bitmap to hold at least size judgments.
+        '''
+        needed = (size + 7) // 8
+        if needed <= self._capacity:
+            return
+        capacity = max(needed, 2 * self._capacity)
+        grow = lambda b: np.concatenate((b, np.zeros(capacity - len(b), dtype=np.uint8)))
+        self._everything = grow(self._everything)
+        for bitmaps in self._dense.values():
+            for v in bitmaps:
+                bitmaps[v] = grow(bitmaps[v])
+        self._capacity = capacity
+
+    def _set_rows(self, bitmap, rows, start):
+        '''
+        Sets the bits of rows, all at or after start, in a bitmap.
+        '''
+        base = start - start % 8
+        mask = np.zeros(self.size - base, dtype=bool)
+        mask[rows - base] = True
+        packed = np.packbits(mask)
+        bitmap[base // 8:base // 8 + len(packed)] |= packed
+
+    def _rows_bitmap(self, rows):
+        mask = np.zeros(self._capacity * 8, dtype=bool)
+        mask[rows] = True
+        return np.packbits(mask)
+
+    def _values_bitmap(self, attribute, values):
+        if attribute in self._dense:
+            bitmaps = self._dense[attribute]
+            bitmap  = np.zeros_like(self._everything)
+            for v in values:
+                if v in bitmaps:
+                    bitmap |= bitmaps[v]
+            return bitmap
+        lists = self._sparse[attribute]
+        rows  = [lists[v] for v in values if v in lists]
+        return self._rows_bitmap(np.concatenate(rows) if rows else [])
+
+    def _range_bitmap(self, attribute, low, high):
+        values, rows = self._sorted[attribute]
+        start = 0 if low is None else np.searchsorted(values, low, 'left')
+        end   = len(values) if high is None else np.searchsorted(values, high, 'right')
+        return self._rows_bitmap(rows[start:end])
+
+    def values(self, attribute):
+        '''
+        Returns the distinct known values of a categorical attribute.
+        '''
+        values = self._dense[attribute] if attribute in self._dense else self._sparse[attribute]
+        return sorted(v for v in values if v is not None)
+
+    def rows(self, where=None):
+        '''
+        Returns the sorted row numbers of the judgments matching a Filter,
+        or of all judgments.
+        '''
+        bitmap = self._everything if where is None else where.bitmap(self)
+        return np.flatnonzero(np.unpackbits(bitmap)[:self.size])
+
+    def count(self, where=None):
+        '''
+        Returns the number of judgments matching a Filter.
+        '''
+        return len(self.rows(where))
+
+    def select(self, where=None):
+        '''
+        Returns the judgments matching a Filter, in order.
+        '''
+        judgments = self.judgments
+        return [judgments[i] for i in self.rows(where)]
+
+
+if __name__ == "__main__":
+    # Indexes a synthetic corpus, appends judgments to an index built on
+    # most of it, then resolves combined filters on both and checks them
+    # against a scan of the judgments.
+    #
+    # Usage: python filterindex.py [judgments]
+    import shutil
+    import sys
+    import tempfile
+    import time
+
+    import synthetic
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    directory = tempfile.mkdtemp(prefix='cwr_filter_')
+    try:
+        judgments = list(synthetic.judgments(synthetic.write_corpus(directory, n)))
+    finally:
+        shutil.rmtree(directory)
+
+    start = time.time()
+    index = FilterIndex(judgments)
+    print ("%d judgments indexed in %.3fs" % (len(judgments), time.time() - start))
+
+    # Appends the last 1% as one batch of newly loaded results would be.
+    split = len(judgments) - max(1, len(judgments) // 100)
+    appended = FilterIndex(judgments[:split])
+    start = time.time()
+    appended.add(judgments[split:])
+    print ("%d judgments appended in %.3fs" % (len(judgments) - split, time.time() - start))
+
+    workers = index.values('worker')
+    filters = [
+        ('approved', Is('status', 'Approved'),
+         lambda a, r: a.status == 'Approved'),
+        ('approved, rate >= 0.95, 10-300s',
+         Is('status', 'Approved') & Between('approval_rate', 0.95) & Between('work_time', 10, 300),
+         lambda a, r: a.status == 'Approved' and a.approval_rate >= 0.95 and 10 <= a.work_time <= 300),
+        ('disagrees with gold or unreviewed',
+         Is('gold_agreement', False) | Is('status', 'Submitted'),
+         lambda a, r: (a.gold_standard is not None and r != a.gold_standard) or a.status == 'Submitted'),
+        ('10 workers, not relevant',
+         Is('worker', *workers[:10]) & ~Is('relevance', 0),
+         lambda a, r: a.worker_id in workers[:10] and r != 0),
+    ]
+    for name, where, matches in filters:
+        start = time.time()
+        rows = index.rows(where)
+        resolved = time.time() - start
+
+        expected = [j for j in judgments if matches(j.assignment, int(j.value))]
+        assert index.select(where) == expected
+        assert appended.select(where) == expected
+        print ("%-35s %7d judgments  resolved in %6.2f ms" % (name, len(rows), resolved * 1e3))
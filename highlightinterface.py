@@ -1,3 +1,5 @@
+import json
+
 from abc import abstractmethod
 
 from PyQt4 import QtCore
@@ -5,6 +7,20 @@ from PyQt4 import QtGui
 from PyQt4 import QtWebKit
 from PyQt4.Qt import QUrl, QCheckBox
 
+from instrument import traced, span
+from documenttext import TextMap, MatchText, EXTRACT_TEXT_JS, HIGHLIGHT_JS, CLEAR_HIGHLIGHTS_JS
+
+def _string(value):
+    '''
+    Converts a QVariant or QString to a Python string.
+    '''
+    if hasattr(value, 'toString'):
+        value = value.toString()
+    try:
+        return unicode(value)
+    except NameError:
+        return str(value)
+
 
 class HighlightInterface(object):
     
@@ -14,6 +30,19 @@ class HighlightInterface(object):
         '''
         pass
     
+    @abstractmethod
+    def highlight_segments(self, segments):
+        '''
+        Highlights every segment in one batched update, replacing any
+        previous segment highlights.
+
+        Arguments:
+
+        segments -- Sorted, non-overlapping (start, end, QColor) triples
+                    of offsets into the text returned by get_text().
+        '''
+        pass
+
     @abstractmethod
     def clear(self):
         '''
@@ -28,8 +57,36 @@ class HighlightWebView(QtWebKit.QWebView, HighlightInterface):
     def __init__(self, parent=None):
         super(HighlightWebView, self).__init__(parent)
         
-        # The raw display text.
-        self._text = None
+        # Visible text of the current page, extracted once per page load,
+        # and its MatchText.
+        self._text_map   = None
+        self._match_text = None
+        self.loadStarted.connect(self._invalidate_text)
+        self.loadFinished.connect(self._page_loaded)
+
+    def _invalidate_text(self):
+        self._text_map   = None
+        self._match_text = None
+
+    def _page_loaded(self, ok):
+        self._invalidate_text()
+        if ok:
+            self.text_map()
+
+    @traced('highlight.HighlightWebView.text_map')
+    def text_map(self):
+        '''
+        Returns the TextMap of the current page, extracting it on first use
+        after each page load.
+        '''
+        if self._text_map is None:
+            frame  = self.page().mainFrame()
+            result = json.loads(_string(frame.evaluateJavaScript(EXTRACT_TEXT_JS)) or 'null')
+            if result:
+                self._text_map = TextMap.from_page(result['text'], result['starts'])
+            else:
+                self._text_map = TextMap(u'', [])
+        return self._text_map
         
     def show_html(self):
         html = BeautifulSoup(self.page().mainFrame().toHtml(), "html.parser")
@@ -44,21 +101,45 @@ class HighlightWebView(QtWebKit.QWebView, HighlightInterface):
         #print (self.page().mainFrame().toHtml())
 
     def get_text(self):
-        return self.page().mainFrame().toHtml().toUtf8()
+        '''
+        Returns the visible text of the current page. Cached per page load.
+        '''
+        return self.text_map().text
+
+    def match_text(self):
+        '''
+        Returns the documenttext.MatchText of the current page. Cached per
+        page load.
+        '''
+        if self._match_text is None:
+            self._match_text = MatchText(self.get_text())
+        return self._match_text
 
     def highlight(self, string, color=None):
         '''
         Highlight all occurrences of specified string.
         '''
-        string = QtCore.QString(string)
-        print ("Highlighting: %s" % string)
-        return self.findText(string, QtWebKit.QWebPage.HighlightAllOccurrences)
+        with span('highlight.HighlightWebView.highlight', string=string):
+            string = QtCore.QString(string)
+            return self.findText(string, QtWebKit.QWebPage.HighlightAllOccurrences)
 
+    @traced('highlight.HighlightWebView.highlight_segments')
+    def highlight_segments(self, segments):
+        '''
+        Highlights every segment with a single script run over the page's
+        text nodes, whose offsets are in UTF-16 code units.
+        '''
+        text_map = self.text_map()
+        segments = [[text_map.page_offset(start), text_map.page_offset(end), str(color.name())]
+                    for start, end, color in segments]
+        self.page().mainFrame().evaluateJavaScript(HIGHLIGHT_JS % json.dumps(segments))
+
+    @traced('highlight.HighlightWebView.clear')
     def clear(self):
         '''
         Clears highlights.
         '''
-        print ("Clearing highlights.")
+        self.page().mainFrame().evaluateJavaScript(CLEAR_HIGHLIGHTS_JS)
         return self.findText('', QtWebKit.QWebPage.HighlightAllOccurrences)
     
 class HighlightBox(QtGui.QTextEdit, HighlightInterface):
@@ -102,8 +183,32 @@ class HighlightBox(QtGui.QTextEdit, HighlightInterface):
             length = match[2]
             self._highlight(start, length, color)
             
+    @traced('highlight.HighlightBox.highlight_segments')
+    def highlight_segments(self, segments):
+        '''
+        Highlights every segment as one list of extra selections, set in a
+        single call.
+        '''
+        selections = []
+        for start, end, color in segments:
+            selection = QtGui.QTextEdit.ExtraSelection()
+            selection.format.setBackground(QtGui.QBrush(color))
+            selection.cursor = QtGui.QTextCursor(self.document())
+            selection.cursor.setPosition(start)
+            selection.cursor.setPosition(end, QtGui.QTextCursor.KeepAnchor)
+            selections.append(selection)
+        self.setExtraSelections(selections)
+
+    def get_text(self):
+        return self._text
+
+    def match_text(self):
+        return MatchText(self._text)
+
+    @traced('highlight.HighlightBox.clear')
     def clear(self):
         '''
         Clears all highlights.
         '''
+        self.setExtraSelections([])
         self._highlight(0, len(self._text), QtGui.QColor("white"))
@@ -0,0 +1,194 @@
+'''
+Parallel ingestion of AMT result files.
+
+Files are parsed by the test collection in the loading process by
+default. With several processes, each file is parsed in a worker
+process; workers receive the collection through the pool initializer,
+so they work with any start method: forked workers inherit it, spawned
+ones unpickle a copy. Results are handed back in the order the files
+were given so merging is deterministic regardless of which worker
+finishes first.
+
+Parallel parsing is opt-in: on the machines measured so far (see
+__main__), the cost of starting workers and sending judgments back
+outweighed the parsing spread across them.
+
+import_amt_results may also record what it imports in the collection
+itself, such as documents the collection did not know. In a worker, such
+changes are made to the worker's copy of the collection and are lost
+with it; only the returned judgments reach the loading process. The
+DataModel does not depend on them, as it keeps loaded judgments in its
+own store and points them at its own Topic and Document objects. Code
+that needs the collection itself updated should parse with processes=1,
+which imports in the calling process.
+'''
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+from collections import namedtuple
+
+import amt
+from instrument import traced
+
+# Result of parsing one file. Exactly one of judgments and error is set.
+ParsedFile = namedtuple('ParsedFile', ['filename', 'judgments', 'error'])
+
+# Test collection used by _parse. Set by _initialize in worker processes
+# and by parse_files in the loading process.
+_collection = None
+
+def _initialize(collection):
+    '''
+    Worker initializer. Sets the collection files are parsed with.
+    '''
+    global _collection
+    _collection = collection
+
+def _parse(filename):
+    '''
+    Worker entry point. Parses a single file with the shared collection.
+    '''
+    try:
+        judgments = _collection.import_amt_results(filename)
+        amt.annotate(judgments, amt.read_assignments(filename))
+        return ParsedFile(filename, judgments, None)
+    except Exception:
+        return ParsedFile(filename, None, traceback.format_exc())
+
+@traced('ingest.parse_files')
+def parse_files(collection, filenames, processes=None):
+    '''
+    Parses AMT result files, optionally in parallel.
+
+    Arguments:
+
+    collection -- Test collection used to import the AMT results. Must
+                  be picklable for processes > 1 unless workers fork.
+    filenames  -- Paths of the files to parse.
+    processes  -- Number of worker processes. Defaults to 1, which
+                  imports files in this process, so changes
+                  import_amt_results makes to the collection are kept.
+
+    Returns a list of ParsedFile, in the same order as filenames.
+    '''
+    global _collection
+    filenames = list(filenames)
+    processes = min(processes or 1, len(filenames))
+
+    if processes < 2:
+        _collection = collection
+        try:
+            return [_parse(f) for f in filenames]
+        finally:
+            _collection = None
+
+    pool = multiprocessing.Pool(processes, _initialize, (collection,))
+    try:
+        pending = [(f, pool.apply_async(_parse, (f,))) for f in filenames]
+        results = []
+        for f, p in pending:
+            try:
+                results.append(p.get())
+            except Exception:
+                # Raised when a result cannot be sent back from the worker.
+                results.append(ParsedFile(f, None, traceback.format_exc()))
+        return results
+    finally:
+        pool.close()
+        pool.join()
+
+@traced('ingest.parse_rows')
+def parse_rows(collection, header, records):
+    '''
+    Parses some rows of an AMT result file, given as the raw bytes of the
+    file's header line and of complete CSV records, by handing them to
+    the test collection as a file of their own.
+
+    Returns the annotated judgments.
+    '''
+    fd, filename = tempfile.mkstemp(prefix='cwr_rows_', suffix='.csv')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            f.write(records)
+        judgments = collection.import_amt_results(filename)
+        amt.annotate(judgments, amt.read_assignments(filename))
+        return judgments
+    finally:
+        os.remove(filename)
+
+def find_files(directory, suffix='.csv'):
+    '''
+    Returns the sorted absolute paths of all files under directory
+    ending with suffix.
+    '''
+    found = []
+    for dirpath, _, filenames in os.walk(directory):
+        for f in filenames:
+            if f.endswith(suffix):
+                found.append(os.path.abspath(os.path.join(dirpath, f)))
+    return sorted(found)
+
+
+if __name__ == "__main__":
+    # Measures serial vs. parallel ingestion, on copies of an AMT result
+    # file imported by the test collection, or on a synthetic corpus
+    # parsed by a stand-in collection.
+    #
+    # Usage: python ingest.py <results.csv> [--copies N] [--processes P]
+    #        python ingest.py --synthetic JUDGMENTS [--files N] [--processes P]
+    #        [--start-method fork|spawn|forkserver]
+    import argparse
+
+    import synthetic
+
+    parser = argparse.ArgumentParser(description="Measures parallel AMT result ingestion.")
+    parser.add_argument('source', nargs='?', help="AMT result file to copy")
+    parser.add_argument('--copies', type=int, default=64, help="copies of source")
+    parser.add_argument('--synthetic', type=int, metavar='JUDGMENTS',
+                        help="parse a synthetic corpus of this many judgments instead")
+    parser.add_argument('--files', type=int, default=64, help="files of the synthetic corpus")
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--start-method', default=None, help="multiprocessing start method")
+    args = parser.parse_args()
+    if not args.source and not args.synthetic:
+        parser.error("either an AMT result file or --synthetic is required")
+    if args.start_method:
+        multiprocessing.set_start_method(args.start_method)
+    processes = args.processes or multiprocessing.cpu_count()
+
+    corpus = tempfile.mkdtemp(prefix='cwr_ingest_')
+    try:
+        if args.synthetic:
+            collection = synthetic.Collection()
+            synthetic.write_corpus(corpus, args.synthetic,
+                                   rows_per_file=max(1, args.synthetic // args.files))
+        else:
+            from testcollection.mqt import MQT
+            collection = MQT.load('2009.mqt')
+            for i in range(args.copies):
+                shutil.copy(args.source, os.path.join(corpus, 'copy%04d_rationales.csv' % i))
+        files = find_files(corpus)
+
+        start = time.time()
+        serial = parse_files(collection, files, processes=1)
+        serial_time = time.time() - start
+
+        start = time.time()
+        parallel = parse_files(collection, files, processes=processes)
+        parallel_time = time.time() - start
+
+        assert [len(r.judgments or []) for r in serial] == \
+               [len(r.judgments or []) for r in parallel]
+        print ("Files:     %d (%d judgments)" % (len(files), sum(len(r.judgments or []) for r in serial)))
+        print ("CPUs:      %d" % multiprocessing.cpu_count())
+        print ("Serial:    %.3fs" % serial_time)
+        print ("Parallel:  %.3fs (%d processes)" % (parallel_time, processes))
+        print ("Speedup:   %.2fx" % (serial_time / parallel_time))
+    finally:
+        shutil.rmtree(corpus)
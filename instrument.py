@@ -0,0 +1,165 @@
+'''
+Lightweight timing instrumentation.
+
+Spans are recorded around data model queries, file loads, overlap
+computation, highlighting and panel refreshes. Recording is turned on by
+setting the CWR_TRACE environment variable to a file name before start:
+
+    CWR_TRACE=cwr.trace.json python cwr.py
+
+At exit, the spans are written to that file in the Chrome trace event
+format, which chrome://tracing and https://ui.perfetto.dev open, and a
+per-operation latency summary is printed to standard error.
+
+When CWR_TRACE is not set, traced() returns functions unchanged and
+span() returns a shared do-nothing context manager, so instrumentation
+costs next to nothing.
+'''
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+# Trace file named by the environment, or None if recording is off.
+TRACE_FILE = os.environ.get('CWR_TRACE') or None
+
+# Recorded spans, as (name, start, duration, thread ID, arguments).
+# Times are in seconds from the start of recording.
+_spans  = []
+_origin = time.time()
+
+def enabled():
+    '''
+    True if spans are being recorded.
+    '''
+    return TRACE_FILE is not None
+
+
+class _Span(object):
+    '''
+    Context manager recording one span.
+    '''
+    __slots__ = ('name', 'args', 'start')
+
+    def __init__(self, name, args):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.time()
+        _spans.append((self.name, self.start - _origin, end - self.start,
+                       threading.current_thread().ident, self.args))
+        return False
+
+
+class _NoSpan(object):
+    '''
+    Context manager that records nothing.
+    '''
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+def span(name, **args):
+    '''
+    Returns a context manager recording a span of the specified name
+    around its body. Keyword arguments are recorded with the span.
+    '''
+    if TRACE_FILE is None:
+        return _NO_SPAN
+    return _Span(name, args)
+
+def traced(name):
+    '''
+    Decorator recording a span of the specified name around every call.
+    Without recording, the function is returned as is.
+    '''
+    def decorate(function):
+        if TRACE_FILE is None:
+            return function
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _Span(name, None):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def spans():
+    '''
+    Returns the spans recorded so far.
+    '''
+    return list(_spans)
+
+def _json_value(value):
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    return '%s' % (value,)
+
+def chrome_trace(recorded=None):
+    '''
+    Returns spans as a Chrome trace event dictionary.
+    '''
+    pid = os.getpid()
+    events = []
+    for name, start, duration, thread, args in (_spans if recorded is None else recorded):
+        event = {'name' : name,
+                 'cat'  : name.split('.', 1)[0],
+                 'ph'   : 'X',
+                 'ts'   : start * 1e6,
+                 'dur'  : duration * 1e6,
+                 'pid'  : pid,
+                 'tid'  : thread}
+        if args:
+            event['args'] = dict((k, _json_value(v)) for k, v in args.items())
+        events.append(event)
+    return {'traceEvents' : events, 'displayTimeUnit' : 'ms'}
+
+def write_trace(filename, recorded=None):
+    '''
+    Writes spans to a file in the Chrome trace event format.
+    '''
+    with open(filename, 'w') as f:
+        json.dump(chrome_trace(recorded), f)
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def summary(recorded=None):
+    '''
+    Returns a latency summary of spans, one line per span name, slowest
+    total time first.
+    '''
+    durations = {}
+    for name, _, duration, _, _ in (_spans if recorded is None else recorded):
+        durations.setdefault(name, []).append(duration)
+
+    lines = ["%-40s %7s %10s %9s %9s %9s %9s" %
+             ('operation', 'count', 'total ms', 'mean ms', 'p50 ms', 'p95 ms', 'max ms')]
+    for name, values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+        values.sort()
+        lines.append("%-40s %7d %10.1f %9.2f %9.2f %9.2f %9.2f" %
+                     (name, len(values), sum(values) * 1e3, sum(values) / len(values) * 1e3,
+                      _percentile(values, 0.5) * 1e3, _percentile(values, 0.95) * 1e3,
+                      values[-1] * 1e3))
+    return '\n'.join(lines)
+
+def _export():
+    recorded = spans()
+    write_trace(TRACE_FILE, recorded)
+    sys.stderr.write("Wrote %d spans to %s\n%s\n" % (len(recorded), TRACE_FILE, summary(recorded)))
+
+if TRACE_FILE is not None:
+    atexit.register(_export)
@@ -0,0 +1,435 @@
+'''
+Storage for loaded judgments.
+
+Both stores answer the same queries. JudgmentIndex keeps the judgment
+objects produced by the test collection. CompactJudgmentStore keeps one
+row per judgment in typed arrays, with ids interned to integers and all
+rationale text in a single buffer, and hands out lightweight views.
+'''
+from array import array
+from collections import defaultdict, OrderedDict
+
+from amt import AMTAssignment, assignment
+
+class JudgmentIndex(object):
+    '''
+    Judgment objects, indexed by topic, document and Topic-Document pair.
+    '''
+
+    def __init__(self):
+        self._judgments          = []                        # [Judgment]
+        self._by_topic           = defaultdict(list)         # Topic ID -> [Judgment]
+        self._by_document        = defaultdict(list)         # Document ID -> [Judgment]
+        self._by_pair            = defaultdict(list)         # (Topic ID, Document ID) -> [Judgment]
+        self._topics             = OrderedDict()             # Topic ID -> Topic
+        self._documents          = OrderedDict()             # Document ID -> Document
+        self._documents_by_topic = defaultdict(OrderedDict)  # Topic ID -> {Document ID -> Document}
+
+    def __len__(self):
+        return len(self._judgments)
+
+    def add(self, judgments):
+        '''
+        Adds judgments to the store and its indexes.
+        '''
+        for j in judgments:
+            topic_id    = j.topic.id
+            document_id = j.document.id
+            self._judgments.append(j)
+            self._by_topic[topic_id].append(j)
+            self._by_document[document_id].append(j)
+            self._by_pair[(topic_id, document_id)].append(j)
+            self._topics.setdefault(topic_id, j.topic)
+            self._documents.setdefault(document_id, j.document)
+            self._documents_by_topic[topic_id].setdefault(document_id, j.document)
+
+    def judgments(self):
+        return self._judgments
+
+    def by_topic(self, topic_id):
+        return self._by_topic.get(topic_id, [])
+
+    def by_document(self, document_id):
+        return self._by_document.get(document_id, [])
+
+    def by_pair(self, topic_id, document_id):
+        return self._by_pair.get((topic_id, document_id), [])
+
+    def topics(self):
+        return list(self._topics.values())
+
+    def documents(self):
+        return list(self._documents.values())
+
+    def document(self, document_id):
+        return self._documents.get(document_id)
+
+    def documents_by_topic(self, topic_id):
+        documents = self._documents_by_topic.get(topic_id)
+        return list(documents.values()) if documents else []
+
+
+class Interner(object):
+    '''
+    Two-way mapping between values and consecutive integer ids.
+    '''
+
+    def __init__(self):
+        self.ids    = {}        # Value -> ID
+        self.values = []        # ID -> Value
+
+    def __len__(self):
+        return len(self.values)
+
+    def intern(self, value):
+        i = self.ids.get(value)
+        if i is None:
+            i = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+    def get(self, value):
+        return self.ids.get(value)
+
+
+class TextColumn(object):
+    '''
+    Strings held as UTF-8 in one contiguous buffer with per-entry offsets.
+    None is kept apart from the empty string.
+    '''
+
+    def __init__(self):
+        self._offsets = array('L', [0])     # Entry -> start; one extra end offset.
+        self._text    = bytearray()
+        self._none    = set()               # Entries that are None.
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def append(self, text):
+        if text is None:
+            self._none.add(len(self))
+        else:
+            if not isinstance(text, bytes):
+                text = text.encode('utf-8')
+            self._text.extend(text)
+        self._offsets.append(len(self._text))
+
+    def __getitem__(self, i):
+        if i in self._none:
+            return None
+        return bytes(self._text[self._offsets[i]:self._offsets[i + 1]]).decode('utf-8')
+
+
+class StoredJudgment(object):
+    '''
+    View of one row of a CompactJudgmentStore. Exposes the attributes of
+    a test collection judgment annotated with its AMT assignment; values
+    are read from the store on access.
+    '''
+    __slots__ = ('_store', 'row')
+
+    def __init__(self, store, row):
+        self._store = store
+        self.row    = row
+
+    def __eq__(self, other):
+        return (isinstance(other, StoredJudgment) and
+                other._store is self._store and other.row == self.row)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self._store), self.row))
+
+    @property
+    def topic(self):
+        return self._store._topic_objects[self._store._topic[self.row]]
+
+    @property
+    def document(self):
+        return self._store._document_objects[self._store._document[self.row]]
+
+    @property
+    def worker(self):
+        return self._store._workers.values[self._store._worker[self.row]]
+
+    @property
+    def value(self):
+        return self._store._values.values[self._store._value[self.row]]
+
+    @property
+    def gold_standard(self):
+        gold = self._store._gold[self.row]
+        return None if gold == CompactJudgmentStore.MISSING else gold
+
+    @property
+    def rationale(self):
+        return self._store._rationales[self.row]
+
+    @property
+    def feedback(self):
+        return self._store._feedback[self.row]
+
+    @property
+    def assignment(self):
+        return self._store.assignment(self.row)
+
+
+class CompactJudgmentStore(object):
+    '''
+    Judgments held as typed arrays, one row per judgment.
+
+    Topic, document and worker ids are interned to integers, as are the
+    judgments' relevance values, so they are handed back as the objects
+    the test collection produced. Gold standard labels are stored as
+    signed bytes, rationale and feedback text as UTF-8 in contiguous
+    buffers with per-row offsets, and the per-topic, per-document and
+    per-pair indexes as arrays of row numbers. Topic and Document
+    objects are kept once per id. The AMT assignment of each judgment is
+    kept in columns of its own and rebuilt on access.
+    '''
+
+    # Stored in place of a missing gold standard label or relevance.
+    MISSING = -128
+
+    # Stored in place of a missing work time.
+    MISSING_TIME = -2 ** 31
+
+    # Distinct relevance values that fit the value column.
+    MAX_VALUES = 2 ** 16
+
+    def __init__(self):
+        self._topics    = Interner()            # Topic ID <-> int
+        self._documents = Interner()            # Document ID <-> int
+        self._workers   = Interner()            # Worker ID <-> int
+        self._values    = Interner()            # Relevance value <-> int
+
+        self._topic_objects    = []             # int -> Topic
+        self._document_objects = []             # int -> Document
+
+        # Rows.
+        self._topic      = array('i')           # Row -> Topic int
+        self._document   = array('i')           # Row -> Document int
+        self._worker     = array('i')           # Row -> Worker int
+        self._value      = array('H')           # Row -> Relevance value int
+        self._gold       = array('b')           # Row -> Gold standard label
+        self._rationales = TextColumn()         # Row -> Rationale
+        self._feedback   = TextColumn()         # Row -> Feedback
+
+        # AMT assignment columns, by row.
+        self._hits       = Interner()           # HIT ID <-> int
+        self._statuses   = Interner()           # Assignment status <-> int
+        self._urls       = Interner()           # Document URL <-> int
+        self._assigned   = array('b')           # Row -> 1 if it has an assignment
+        self._assignment_ids = TextColumn()     # Row -> Assignment ID
+        self._hit        = array('i')           # Row -> HIT int
+        self._status     = array('i')           # Row -> Status int
+        self._url        = array('i')           # Row -> URL int
+        self._work_time  = array('i')           # Row -> Work time, or MISSING_TIME
+        self._approval   = array('d')           # Row -> Approval rate, or NaN
+        self._relevance  = array('b')           # Row -> Relevance column, or MISSING
+        self._assignment_text = {}              # Row -> (rationale, feedback) of the
+                                                # assignment, where not the judgment's.
+
+        # Indexes of row numbers.
+        self._by_topic           = defaultdict(lambda: array('i'))  # Topic int -> rows
+        self._by_document        = defaultdict(lambda: array('i'))  # Document int -> rows
+        self._by_pair            = defaultdict(lambda: array('i'))  # (Topic int, Document int) -> rows
+        self._documents_by_topic = defaultdict(OrderedDict)         # Topic int -> {Document int -> None}
+
+    def __len__(self):
+        return len(self._topic)
+
+    def add(self, judgments):
+        '''
+        Appends judgments to the store and its indexes. Raises ValueError
+        for a judgment the columns cannot hold, before storing any of it.
+        '''
+        for j in judgments:
+            a = assignment(j)
+            gold = a.gold_standard if a and a.gold_standard is not None else self.MISSING
+            for label in (gold, a.relevance if a and a.relevance is not None else self.MISSING):
+                if not self.MISSING <= label < 128:
+                    raise ValueError("Label %r does not fit the compact store's label columns." % label)
+            if self._values.get(j.value) is None and len(self._values) == self.MAX_VALUES:
+                raise ValueError("The compact store holds at most %d distinct relevance values."
+                                 % self.MAX_VALUES)
+            t = self._intern_object(self._topics, self._topic_objects, j.topic)
+            d = self._intern_object(self._documents, self._document_objects, j.document)
+            w = self._workers.intern(a.worker_id if a else None)
+            feedback = getattr(j, 'feedback', None)
+
+            row = len(self._topic)
+            self._topic.append(t)
+            self._document.append(d)
+            self._worker.append(w)
+            self._value.append(self._values.intern(j.value))
+            self._gold.append(gold)
+            self._rationales.append(j.rationale)
+            self._feedback.append(feedback)
+            self._add_assignment(row, a, j.rationale, feedback)
+
+            self._by_topic[t].append(row)
+            self._by_document[d].append(row)
+            self._by_pair[(t, d)].append(row)
+            self._documents_by_topic[t][d] = None
+
+    def _add_assignment(self, row, a, rationale, feedback):
+        self._assigned.append(a is not None)
+        self._assignment_ids.append(a.assignment_id if a else None)
+        self._hit.append(self._hits.intern(a.hit_id if a else None))
+        self._status.append(self._statuses.intern(a.status if a else None))
+        self._url.append(self._urls.intern(a.document_url if a else None))
+        self._work_time.append(a.work_time if a and a.work_time is not None else self.MISSING_TIME)
+        self._approval.append(a.approval_rate if a and a.approval_rate is not None else float('nan'))
+        self._relevance.append(a.relevance if a and a.relevance is not None else self.MISSING)
+        if a and (a.rationale != rationale or a.feedback != feedback):
+            self._assignment_text[row] = (a.rationale, a.feedback)
+
+    def assignment(self, row):
+        '''
+        Returns the AMTAssignment of a row, or None.
+        '''
+        if not self._assigned[row]:
+            return None
+        rationale, feedback = self._assignment_text.get(row) or \
+                              (self._rationales[row], self._feedback[row])
+        work_time = self._work_time[row]
+        approval  = self._approval[row]
+        relevance = self._relevance[row]
+        gold      = self._gold[row]
+        return AMTAssignment(assignment_id = self._assignment_ids[row],
+                             hit_id        = self._hits.values[self._hit[row]],
+                             worker_id     = self._workers.values[self._worker[row]],
+                             status        = self._statuses.values[self._status[row]],
+                             work_time     = None if work_time == self.MISSING_TIME else work_time,
+                             approval_rate = None if approval != approval else approval,
+                             topic_id      = self._topics.values[self._topic[row]],
+                             document_id   = self._documents.values[self._document[row]],
+                             document_url  = self._urls.values[self._url[row]],
+                             gold_standard = None if gold == self.MISSING else gold,
+                             relevance     = None if relevance == self.MISSING else relevance,
+                             rationale     = rationale,
+                             feedback      = feedback)
+
+    @staticmethod
+    def _intern_object(interner, objects, obj):
+        i = interner.intern(obj.id)
+        if i == len(objects):
+            objects.append(obj)
+        return i
+
+    def rationale(self, row):
+        '''
+        Returns the rationale text of a row.
+        '''
+        return self._rationales[row]
+
+    def _views(self, rows):
+        return [StoredJudgment(self, r) for r in rows]
+
+    def judgments(self):
+        return self._views(range(len(self)))
+
+    def by_topic(self, topic_id):
+        t = self._topics.get(topic_id)
+        return self._views(self._by_topic[t]) if t is not None else []
+
+    def by_document(self, document_id):
+        d = self._documents.get(document_id)
+        return self._views(self._by_document[d]) if d is not None else []
+
+    def by_pair(self, topic_id, document_id):
+        t = self._topics.get(topic_id)
+        d = self._documents.get(document_id)
+        if t is None or d is None or (t, d) not in self._by_pair:
+            return []
+        return self._views(self._by_pair[(t, d)])
+
+    def topics(self):
+        return list(self._topic_objects)
+
+    def documents(self):
+        return list(self._document_objects)
+
+    def document(self, document_id):
+        d = self._documents.get(document_id)
+        return self._document_objects[d] if d is not None else None
+
+    def documents_by_topic(self, topic_id):
+        t = self._topics.get(topic_id)
+        if t is None:
+            return []
+        return [self._document_objects[d] for d in self._documents_by_topic[t]]
+
+
+if __name__ == "__main__":
+    # Compares the memory used by judgment objects against the compact
+    # store for synthetic judgments.
+    #
+    # Usage: python judgmentstore.py [judgments]
+    import gc
+    import os
+    import random
+    import sys
+    import multiprocessing
+
+    class Record(object):
+        '''
+        Stand-in for a test collection topic, document or judgment.
+        '''
+        def __init__(self, **attributes):
+            self.__dict__.update(attributes)
+
+    def rss():
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    def synthetic(n):
+        rng       = random.Random(0)
+        topics    = [Record(id=str(20000 + i)) for i in range(n // 500 + 1)]
+        documents = [Record(id='clueweb09-en%010d' % i, url='http://example.com/%d' % i)
+                     for i in range(n // 8 + 1)]
+        words     = ['relevant', 'page', 'describes', 'music', 'career', 'award',
+                     'education', 'history', 'album', 'the', 'of', 'and']
+        # Eight judgments per Topic-Document pair, as in a HIT.
+        pairs     = [(topics[rng.randrange(len(topics))], d) for d in documents]
+        for i in range(n):
+            t, d = pairs[rng.randrange(len(pairs))]
+            rationale = ' '.join(rng.choice(words) for _ in range(rng.randint(5, 40)))
+            worker    = 'A%013d' % rng.randrange(n // 20 + 1)
+            a = AMTAssignment('%030d' % i, '%030d' % (i // 8), worker, 'Approved',
+                              rng.randint(10, 300), 1.0, t.id, d.id, d.url,
+                              rng.randint(0, 2), rng.randint(-1, 3), rationale, '{}')
+            yield Record(topic=t, document=d, value=str(a.relevance), rationale=rationale,
+                         feedback='{}', assignment=a)
+
+    def measure(kind, n, queue):
+        # Judgments are streamed into the store, so only the store itself
+        # is alive at the end of the measurement.
+        # Uses tracemalloc where available, since freed temporaries
+        # still count towards RSS.
+        try:
+            import tracemalloc
+        except ImportError:
+            tracemalloc = None
+        gc.collect()
+        if tracemalloc:
+            tracemalloc.start()
+        before = rss()
+        store = JudgmentIndex() if kind == 'objects' else CompactJudgmentStore()
+        store.add(synthetic(n))
+        gc.collect()
+        queue.put(tracemalloc.get_traced_memory()[0] if tracemalloc else rss() - before)
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    queue = multiprocessing.Queue()
+    for kind in ('objects', 'compact'):
+        p = multiprocessing.Process(target=measure, args=(kind, n, queue))
+        p.start()
+        size = queue.get()
+        p.join()
+        print ("%-8s %10d judgments %8.1f MB %6.1f bytes/judgment" %
+               (kind, n, size / 1e6, float(size) / n))
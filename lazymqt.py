@@ -0,0 +1,224 @@
+'''
+Lazy, on-demand access to an MQT test collection.
+
+The .mqt source format belongs to the testcollection package, so offsets
+into it cannot be computed here. Instead, the first time a collection is
+opened lazily it is loaded in full once and rewritten as a derived record
+file: every topic, document and gold standard judgment is pickled as its
+own record, followed by an index of record offsets and lengths. The
+record file is rebuilt whenever the source changes. Later sessions only
+read the index; records are unpickled on first access and kept
+afterwards. References between records (e.g. from a gold standard
+judgment to its topic) are stored by id and resolved through the same
+lazy lookups, so object identity is preserved. Resolving a reference
+reads another record while one is being unpickled, so each record is
+read whole first and unpickled from its own buffer.
+'''
+import io
+import os
+import struct
+import threading
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from testcollection.mqt import MQTTopic, MQTDocument, MQT
+from snapshot import signature
+
+# Bump whenever the layout of the record file changes.
+VERSION = 2
+
+# Record file header: offset of the pickled index.
+HEADER = struct.Struct('<Q')
+
+def _gold_standard_key(gs):
+    return (gs.topic.id, gs.document.id)
+
+class LazyMQT(MQT):
+    '''
+    Read-only MQT test collection whose topics, documents and gold
+    standard judgments are loaded on first access.
+
+    LazyMQT serves the collection's state through the accessors below:
+    topics, documents and gold_standard, and find_topic, find_document
+    and find_gold_standard. Other MQT methods, such as importing AMT
+    results and computing agreement, are inherited and run against
+    those accessors. Any other collection state is not available lazily,
+    and reading it raises AttributeError instead of loading the full
+    collection; use MQT.load for such uses.
+    '''
+
+    def __init__(self, source, records):
+        self.source   = source      # Path of the MQT collection.
+        self.records  = records     # Path of the record file.
+
+        self._file    = open(records, 'rb')
+        self._lock    = threading.RLock()
+        self._index   = self._read_index()
+        self._loaded  = {'topics' : {}, 'documents' : {}, 'gold_standard' : {}}
+
+    @classmethod
+    def open(cls, source):
+        '''
+        Opens the collection at source lazily, (re)building its record
+        file if it is missing or older than source.
+        '''
+        source  = os.path.abspath(source)
+        records = source + '.records'
+        if not cls._current(source, records):
+            cls.build(MQT.load(source), source, records)
+        return cls(source, records)
+
+    @staticmethod
+    def _current(source, records):
+        try:
+            with open(records, 'rb') as f:
+                f.seek(HEADER.unpack(f.read(HEADER.size))[0])
+                index = pickle.load(f)
+        except Exception:
+            return False
+        return index.get('version') == VERSION and index.get('source') == signature(source)
+
+    @staticmethod
+    def build(collection, source, records):
+        '''
+        Writes the record file for a fully loaded collection.
+        '''
+        index = {'version'       : VERSION,
+                 'source'        : signature(source),
+                 'topics'        : {},
+                 'documents'     : {},
+                 'gold_standard' : {}}
+        entries = [('topics',        lambda t: t.id,    collection.topics()),
+                   ('documents',     lambda d: d.id,    collection.documents()),
+                   ('gold_standard', _gold_standard_key, collection.gold_standard())]
+
+        temporary = records + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(HEADER.pack(0))
+            for kind, key, records_of_kind in entries:
+                for record in records_of_kind:
+                    offset  = f.tell()
+                    pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+                    pickler.persistent_id = LazyMQT._reference(record)
+                    pickler.dump(record)
+                    index[kind][key(record)] = (offset, f.tell() - offset)
+            index_offset = f.tell()
+            pickle.dump(index, f, pickle.HIGHEST_PROTOCOL)
+            f.seek(0)
+            f.write(HEADER.pack(index_offset))
+        os.rename(temporary, records)
+
+    @staticmethod
+    def _reference(root):
+        '''
+        Returns a persistent_id function which stores topics and documents
+        other than root by id.
+        '''
+        def persistent_id(obj):
+            if obj is root:
+                return None
+            if isinstance(obj, MQTTopic):
+                return 'topics:%s' % obj.id
+            if isinstance(obj, MQTDocument):
+                return 'documents:%s' % obj.id
+            return None
+        return persistent_id
+
+    def _dereference(self, pid):
+        kind, key = pid.split(':', 1)
+        return self._record(kind, key)
+
+    def _read_index(self):
+        with self._lock:
+            self._file.seek(0)
+            self._file.seek(HEADER.unpack(self._file.read(HEADER.size))[0])
+            return pickle.load(self._file)
+
+    def _record(self, kind, key):
+        '''
+        Returns the record of the specified kind and key, reading it from
+        the record file on first access. Returns None if there is none.
+        '''
+        loaded = self._loaded[kind]
+        if key in loaded:
+            return loaded[key]
+        entry = self._index[kind].get(key)
+        if entry is None:
+            return None
+        offset, length = entry
+        with self._lock:
+            if key in loaded:
+                return loaded[key]
+            # References are resolved while unpickling and may read other
+            # records, so the unpickler must not read from the shared file.
+            self._file.seek(offset)
+            unpickler = pickle.Unpickler(io.BytesIO(self._file.read(length)))
+            unpickler.persistent_load = self._dereference
+            record = unpickler.load()
+            loaded[key] = record
+        return record
+
+    def __getstate__(self):
+        # Only the location is persisted; records are re-read on demand.
+        return {'source' : self.source, 'records' : self.records}
+
+    def __setstate__(self, state):
+        self.__init__(state['source'], state['records'])
+
+    #####################################
+    # Lazy Accessors                    #
+    #####################################
+
+    def find_topic(self, topic_id):
+        '''
+        Returns the topic with the specified ID, or None.
+        '''
+        return self._record('topics', topic_id)
+
+    def find_document(self, document_id):
+        '''
+        Returns the document with the specified ID, or None.
+        '''
+        return self._record('documents', document_id)
+
+    def find_gold_standard(self, topic_id, document_id):
+        '''
+        Returns the gold standard judgment for a Topic-Document pair.
+        '''
+        return self._record('gold_standard', (topic_id, document_id))
+
+    def topics(self):
+        '''
+        Returns all topics. Loads every topic record.
+        '''
+        return [self.find_topic(k) for k in self._index['topics']]
+
+    def documents(self):
+        '''
+        Returns all documents. Loads every document record.
+        '''
+        return [self.find_document(k) for k in self._index['documents']]
+
+    def gold_standard(self):
+        '''
+        Returns all gold standard judgments. Loads every gold standard record.
+        '''
+        return [self._record('gold_standard', k) for k in self._index['gold_standard']]
+
+    def loaded(self):
+        '''
+        Returns the number of records of each kind read so far.
+        '''
+        return dict((kind, len(records)) for kind, records in self._loaded.items())
+
+    def __getattr__(self, name):
+        # Only called for attributes neither LazyMQT nor MQT define, i.e.
+        # state an eagerly loaded MQT would hold.
+        if name.startswith('__'):
+            raise AttributeError(name)
+        raise AttributeError("LazyMQT does not provide %r; only topics, documents and gold "
+                             "standard judgments are served lazily. Load the collection with "
+                             "MQT.load instead." % name)
@@ -0,0 +1,99 @@
+'''
+Virtualized list model for the topic and document lists.
+'''
+import bisect
+
+from PyQt4 import QtCore
+
+def prefix_range(ids, prefix):
+    '''
+    Returns the (start, end) range of a sorted list of IDs that start
+    with prefix.
+    '''
+    if not prefix:
+        return (0, len(ids))
+    start = bisect.bisect_left(ids, prefix)
+
+    # IDs starting with prefix sort before every later ID, so the end of
+    # the range is the first one that does not.
+    low, high = start, len(ids)
+    while low < high:
+        middle = (low + high) // 2
+        if ids[middle].startswith(prefix):
+            low = middle + 1
+        else:
+            high = middle
+    return (start, low)
+
+
+def _string(value):
+    '''
+    Converts a QString to a Python string.
+    '''
+    try:
+        return unicode(value)
+    except NameError:
+        return str(value)
+
+
+class SortedIdListModel(QtCore.QAbstractListModel):
+    '''
+    Read-only list model over a sorted list of IDs. Nothing is created
+    per row: a view asks only for the rows it shows. A type-ahead filter
+    narrows the model to the IDs starting with a prefix, found by binary
+    search on the sorted list rather than by rebuilding it.
+    '''
+
+    def __init__(self, parent=None):
+        super(SortedIdListModel, self).__init__(parent)
+        self._ids    = []               # Sorted IDs.
+        self._prefix = ''               # Current type-ahead filter.
+        self._start  = 0                # Range of IDs matching the filter.
+        self._end    = 0
+
+    def set_ids(self, ids):
+        '''
+        Shows a list of IDs, which must already be sorted. The list is
+        not copied and must not be changed while shown.
+        '''
+        self.beginResetModel()
+        self._ids = ids
+        self._start, self._end = prefix_range(ids, self._prefix)
+        self.endResetModel()
+
+    def set_prefix(self, prefix):
+        '''
+        Narrows the shown IDs to those starting with prefix.
+        '''
+        prefix = _string(prefix)
+        if prefix == self._prefix:
+            return
+        self.beginResetModel()
+        self._prefix = prefix
+        self._start, self._end = prefix_range(self._ids, prefix)
+        self.endResetModel()
+
+    def id_at(self, row):
+        '''
+        Returns the ID shown at a row.
+        '''
+        return self._ids[self._start + row]
+
+    def row_of(self, id):
+        '''
+        Returns the row an ID is shown at, or None if it is not shown.
+        '''
+        row = bisect.bisect_left(self._ids, id, self._start, self._end)
+        if row < self._end and self._ids[row] == id:
+            return row - self._start
+        return None
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self._end - self._start
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if role != QtCore.Qt.DisplayRole or not index.isValid():
+            return None
+        return self._ids[self._start + index.row()]
@@ -0,0 +1,81 @@
+'''
+On-disk index of rationale matches.
+
+Matches of a rationale against a document text are stored under the
+content hashes of both texts, the same key the OverlapCache uses. The
+document text is the documenttext.MatchText of the page, which the
+viewer matches against too, so it reads precomputed matches for the
+text it shows.
+'''
+import json
+import sqlite3
+import threading
+
+from matching import Match
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS documents (
+    document_id  TEXT PRIMARY KEY,
+    url          TEXT,
+    text_digest  TEXT
+);
+CREATE TABLE IF NOT EXISTS matches (
+    text_digest       TEXT NOT NULL,
+    rationale_digest  TEXT NOT NULL,
+    minimum_length    INTEGER NOT NULL,
+    spans             TEXT NOT NULL,
+    PRIMARY KEY (text_digest, rationale_digest, minimum_length)
+);
+'''
+
+class MatchIndex(object):
+    '''
+    SQLite file of match spans, keyed by (text digest, rationale digest,
+    minimum match length). Each span is a matching.Match of character
+    offsets into the document text and the rationale.
+    '''
+
+    def __init__(self, path):
+        self.path  = path
+        self._lock = threading.Lock()
+        self._db   = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def get(self, key):
+        '''
+        Returns the list of Match stored for a key, or None.
+        '''
+        with self._lock:
+            row = self._db.execute('SELECT spans FROM matches WHERE text_digest = ? AND '
+                                   'rationale_digest = ? AND minimum_length = ?', key).fetchone()
+        if row is None:
+            return None
+        return [Match(*span) for span in json.loads(row[0])]
+
+    def put(self, document_id, url, text_digest, entries):
+        '''
+        Records the text a document was matched against and its matches.
+
+        Arguments:
+
+        entries -- List of ((text digest, rationale digest, minimum
+                   length), [Match]) pairs.
+        '''
+        with self._lock:
+            with self._db:
+                self._db.execute('INSERT OR REPLACE INTO documents VALUES (?, ?, ?)',
+                                 (document_id, url, text_digest))
+                self._db.executemany('INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?)',
+                                     [key + (json.dumps([list(m) for m in matches]),)
+                                      for key, matches in entries])
+
+    def documents(self):
+        '''
+        Returns a dictionary of document ID-text digest pairs for every
+        indexed document.
+        '''
+        with self._lock:
+            return dict(self._db.execute('SELECT document_id, text_digest FROM documents'))
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,329 @@
+'''
+Substring matching of rationales against a document and each other.
+
+The document text is indexed once in a suffix automaton. Every maximal
+common substring of a rationale and the document is then found in a
+single walk over the rationale, in time linear in its length.
+
+Substrings shared between rationales are found through one shingle
+index over all of them, instead of comparing every pair of rationales.
+'''
+from collections import namedtuple, defaultdict, OrderedDict
+
+# A common substring of length "length", starting at "text_start" in the
+# document and at "pattern_start" in the rationale.
+Match = namedtuple('Match', ['text_start', 'pattern_start', 'length'])
+
+# A stretch [start, end) of text covered by the same set of owners.
+Segment = namedtuple('Segment', ['start', 'end', 'owners'])
+
+# A substring common to two or more texts. "spans" holds a (text index,
+# start) pair for every text containing it.
+SharedSubstring = namedtuple('SharedSubstring', ['text', 'spans'])
+
+class DocumentIndex(object):
+    '''
+    Suffix automaton over a document text.
+    '''
+
+    def __init__(self, text):
+        self.text = text
+
+        # Per state: outgoing transitions, suffix link, length of the
+        # longest string in the state and end position of its first
+        # occurrence in the text.
+        self._next   = [{}]
+        self._link   = [-1]
+        self._length = [0]
+        self._end    = [-1]
+
+        last = 0
+        for position, character in enumerate(text):
+            last = self._extend(last, character, position)
+
+    def __len__(self):
+        return len(self.text)
+
+    def _extend(self, last, character, position):
+        nxt, link, length, end = self._next, self._link, self._length, self._end
+
+        current = len(nxt)
+        nxt.append({})
+        link.append(0)
+        length.append(length[last] + 1)
+        end.append(position)
+
+        state = last
+        while state != -1 and character not in nxt[state]:
+            nxt[state][character] = current
+            state = link[state]
+        if state == -1:
+            return current
+
+        target = nxt[state][character]
+        if length[state] + 1 == length[target]:
+            link[current] = target
+            return current
+
+        clone = len(nxt)
+        nxt.append(dict(nxt[target]))
+        link.append(link[target])
+        length.append(length[state] + 1)
+        end.append(end[target])
+        while state != -1 and nxt[state].get(character) == target:
+            nxt[state][character] = clone
+            state = link[state]
+        link[target]  = clone
+        link[current] = clone
+        return current
+
+    def maximal_matches(self, pattern, minimum_length=0):
+        '''
+        Returns every maximal common substring of pattern and the text
+        longer than minimum_length, in order of their end in pattern.
+
+        A match is maximal if it cannot be extended in either direction
+        within pattern while still occurring in the text. The text
+        position reported is that of the first occurrence.
+        '''
+        nxt, link, length, end = self._next, self._link, self._length, self._end
+        matches = []
+
+        state, matched = 0, 0
+        previous = None     # (state, matched) after the previous character.
+        for i, character in enumerate(pattern):
+            while state and character not in nxt[state]:
+                state   = link[state]
+                matched = length[state]
+            if character in nxt[state]:
+                state    = nxt[state][character]
+                matched += 1
+            else:
+                state, matched = 0, 0
+
+            # The longest match ending at i - 1 is right-maximal unless
+            # it was extended by this character.
+            if previous and previous[1] > minimum_length and matched != previous[1] + 1:
+                matches.append(self._match(previous[0], previous[1], i - 1))
+            previous = (state, matched)
+
+        if previous and previous[1] > minimum_length:
+            matches.append(self._match(previous[0], previous[1], len(pattern) - 1))
+        return matches
+
+    def _match(self, state, matched, pattern_end):
+        text_end = self._end[state]
+        return Match(text_end - matched + 1, pattern_end - matched + 1, matched)
+
+
+def _shingles(texts, k):
+    '''
+    Returns a dictionary of shingle-[(text index, position)] pairs for
+    every substring of length k of the texts.
+    '''
+    shingles = defaultdict(list)
+    for t, text in enumerate(texts):
+        for p in range(len(text) - k + 1):
+            shingles[text[p:p + k]].append((t, p))
+    return shingles
+
+def pairwise_substrings(texts, minimum_length, pairs=None):
+    '''
+    Returns the maximal common substrings longer than minimum_length of
+    pairs of texts.
+
+    All shingles (substrings of length minimum_length + 1) of all texts
+    are indexed once. For each pair of texts sharing a shingle, runs of
+    consecutive shared shingles along the same diagonal form a maximal
+    common substring of that pair. Total time is linear in the length
+    of the texts plus the number of shared shingle occurrences.
+
+    Arguments:
+
+    texts          -- Texts to compare.
+    minimum_length -- Substrings must be longer than this.
+    pairs          -- Optional (a, b) text index pairs, with a < b, to
+                      restrict the comparison to. Defaults to all pairs.
+
+    Returns an ordered dictionary of (a, b)-[(start in a, start in b,
+    length)] pairs, for the pairs sharing a substring.
+    '''
+    k        = minimum_length + 1
+    shingles = _shingles(texts, k)
+    wanted   = set(pairs) if pairs is not None else None
+
+    result = OrderedDict()
+    def emit(a, start, b, other_start, end):
+        result.setdefault((a, b), []).append((start, other_start, end + k - start))
+
+    for a, text in enumerate(texts):
+        runs = {}           # (other text, diagonal) -> start of run in text a
+        for p in range(len(text) - k + 1):
+            current = {}
+            for b, s in shingles[text[p:p + k]]:
+                if b > a and (wanted is None or (a, b) in wanted):
+                    key = (b, s - p)
+                    current[key] = runs.get(key, p)
+            for (b, diagonal), start in runs.items():
+                if (b, diagonal) not in current:
+                    emit(a, start, b, start + diagonal, p - 1)
+            runs = current
+        for (b, diagonal), start in runs.items():
+            emit(a, start, b, start + diagonal, len(text) - k)
+    return result
+
+def group_substrings(texts, minimum_length, pair_substrings):
+    '''
+    Groups the output of pairwise_substrings by substring, adding every
+    other text that contains each substring.
+
+    Returns a list of SharedSubstring, in order of first appearance.
+    '''
+    found = OrderedDict()   # Substring -> {text index -> start}
+    for (a, b), runs in pair_substrings.items():
+        for start, other_start, length in runs:
+            spans = found.setdefault(texts[a][start:start + length], {})
+            spans.setdefault(a, start)
+            spans.setdefault(b, other_start)
+
+    # A substring found between one pair may also occur in other texts
+    # sharing its first shingle.
+    k = minimum_length + 1
+    shingles = _shingles(texts, k) if found else {}
+    result = []
+    for string, spans in found.items():
+        for t, _ in shingles.get(string[:k], ()):
+            if t not in spans:
+                start = texts[t].find(string)
+                if start >= 0:
+                    spans[t] = start
+        result.append(SharedSubstring(string, tuple(sorted(spans.items()))))
+    return result
+
+def shared_substrings(texts, minimum_length):
+    '''
+    Returns every maximal substring longer than minimum_length that is
+    common to two or more texts, with the texts that contain it. See
+    pairwise_substrings.
+
+    Returns a list of SharedSubstring, in order of first appearance.
+    '''
+    return group_substrings(texts, minimum_length, pairwise_substrings(texts, minimum_length))
+
+
+def coverage_segments(spans):
+    '''
+    Merges possibly overlapping spans into non-overlapping segments with
+    a sweep line over their boundaries.
+
+    Arguments:
+
+    spans -- Iterable of (start, end, owner), covering [start, end).
+
+    Returns a sorted list of Segment, each carrying the frozenset of
+    owners covering it. Adjacent segments with the same owners are merged
+    and uncovered text is omitted.
+    '''
+    events = []
+    for start, end, owner in spans:
+        if end > start:
+            events.append((start, 1, owner))
+            events.append((end, -1, owner))
+    events.sort(key=lambda e: e[0])
+
+    segments = []
+    active   = {}           # Owner -> number of its spans covering the sweep line.
+    position = None
+    i = 0
+    while i < len(events):
+        at = events[i][0]
+        if active and at > position:
+            owners = frozenset(active)
+            if segments and segments[-1].end == position and segments[-1].owners == owners:
+                segments[-1] = Segment(segments[-1].start, at, owners)
+            else:
+                segments.append(Segment(position, at, owners))
+        while i < len(events) and events[i][0] == at:
+            _, delta, owner = events[i]
+            count = active.get(owner, 0) + delta
+            if count:
+                active[owner] = count
+            else:
+                del active[owner]
+            i += 1
+        position = at
+    return segments
+
+
+if __name__ == "__main__":
+    # Compares the suffix automaton against difflib.SequenceMatcher on a
+    # synthetic Wikipedia-sized page.
+    #
+    # Usage: python matching.py [page characters] [rationales]
+    import itertools
+    import random
+    import sys
+    import time
+
+    from difflib import SequenceMatcher
+
+    size       = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    rationales = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    minimum    = 5
+
+    rng   = random.Random(0)
+    words = ['the', 'band', 'album', 'released', 'record', 'music', 'of', 'and', 'in',
+             'Beatles', 'Lennon', 'McCartney', 'Harrison', 'Starr', 'Liverpool', 'tour',
+             'single', 'chart', 'number', 'one', 'studio', 'producer', 'Martin', 'Abbey',
+             'Road', 'film', 'success', 'critics', 'influence', 'culture']
+    text  = []
+    while sum(len(w) + 1 for w in text) < size:
+        text.append(rng.choice(words))
+    text = ' '.join(text)
+
+    # Rationales quote a few sentences of the page with edits in between.
+    patterns = []
+    for _ in range(rationales):
+        parts = []
+        for _ in range(rng.randint(2, 5)):
+            start = rng.randrange(len(text) - 200)
+            parts.append(text[start:start + rng.randint(20, 120)])
+        patterns.append(' because '.join(parts))
+
+    def report(name, seconds, found):
+        print ("%-16s %8.3fs %6d matches %8d matched chars" %
+               (name, seconds, len(found), sum(len(s) for s in found)))
+
+    start = time.time()
+    found = []
+    for p in patterns:
+        for block in SequenceMatcher(None, text, p).get_matching_blocks():
+            if block[2] > minimum:
+                found.append(text[block[0]:block[0] + block[2]])
+    report('SequenceMatcher', time.time() - start, found)
+
+    start = time.time()
+    index = DocumentIndex(text)
+    build = time.time() - start
+    found = []
+    for p in patterns:
+        found.extend(text[m.text_start:m.text_start + m.length] for m in index.maximal_matches(p, minimum))
+    print ("Automaton build  %8.3fs for %d characters" % (build, len(text)))
+    report('Automaton', time.time() - start, found)
+
+    # All-pairs overlap between rationales.
+    for count in (rationales, rationales * 5):
+        selected = (patterns * 5)[:count]
+        selected = [p[rng.randrange(10):] for p in selected]
+
+        start = time.time()
+        found = []
+        for a, b in itertools.combinations(selected, 2):
+            for block in SequenceMatcher(None, a, b).get_matching_blocks():
+                if block[2] > minimum:
+                    found.append(a[block[0]:block[0] + block[2]])
+        report('Pairs (%d)' % count, time.time() - start, found)
+
+        start = time.time()
+        found = [s.text for s in shared_substrings(selected, minimum)]
+        report('Shingles (%d)' % count, time.time() - start, found)
@@ -0,0 +1,144 @@
+'''
+Content-addressed cache of rationale overlap results.
+
+Documents and rationales are identified by a hash of their text, so a
+result is reused whenever the same text comes back, whichever objects
+carry it. Matches of one rationale against one document and overlap
+between one pair of rationales are cached as separate entries, so a
+selection that adds one rationale only computes what involves it.
+'''
+import hashlib
+import sys
+import threading
+
+from collections import OrderedDict
+
+# Approximate memory used by a DocumentIndex per character of text.
+INDEX_BYTES_PER_CHARACTER = 450
+
+def digest(text):
+    '''
+    Returns the content hash of a text.
+    '''
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8')
+    return hashlib.sha1(text).hexdigest()
+
+def _sequence_size(items, item_size):
+    return sys.getsizeof(items) + sum(item_size(i) for i in items)
+
+def matches_size(matches):
+    '''
+    Approximate memory used by a list of matching.Match.
+    '''
+    return _sequence_size(matches, lambda m: sys.getsizeof(m) + 3 * 24)
+
+def runs_size(runs):
+    '''
+    Approximate memory used by a list of (start, start, length) runs.
+    '''
+    return _sequence_size(runs, lambda r: sys.getsizeof(r) + 3 * 24)
+
+class OverlapCache(object):
+    '''
+    LRU cache of document indexes, rationale matches and pairwise
+    rationale overlap, bounded by the approximate memory of its entries.
+    '''
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, backing=None):
+        '''
+        Arguments:
+
+        max_bytes -- Approximate memory bound of the cached entries.
+        backing   -- Optional dictionary of kind-store pairs. On a miss for
+                     that kind, store.get(key) is consulted before
+                     computing, e.g. a MatchIndex for 'matches'.
+        '''
+        self.max_bytes = max_bytes
+        self.backing   = backing or {}
+        self._entries  = OrderedDict()      # (kind, key) -> (value, size), oldest first.
+        self._bytes    = 0
+        self._lock     = threading.RLock()
+
+        # Counters, exposed through stats().
+        self.hits      = {}                 # Kind -> count
+        self.misses    = {}                 # Kind -> count
+        self.backed    = {}                 # Kind -> misses served by backing store
+        self.evictions = 0
+
+    def get(self, kind, key, compute, size):
+        '''
+        Returns the cached value for (kind, key), filling the cache with
+        compute() on a miss.
+
+        Arguments:
+
+        size -- Called with the computed value; returns its approximate
+                memory in bytes.
+        '''
+        value = self.lookup(kind, key)
+        if value is not None:
+            return value
+        backing = self.backing.get(kind)
+        if backing is not None:
+            value = backing.get(key)
+            if value is not None:
+                self.backed[kind] = self.backed.get(kind, 0) + 1
+                self.store(kind, key, value, size(value))
+                return value
+        value = compute()
+        self.store(kind, key, value, size(value))
+        return value
+
+    def lookup(self, kind, key):
+        '''
+        Returns the cached value for (kind, key), or None, and counts the
+        hit or miss.
+        '''
+        with self._lock:
+            entry = self._entries.pop((kind, key), None)
+            if entry is None:
+                self.misses[kind] = self.misses.get(kind, 0) + 1
+                return None
+            self._entries[(kind, key)] = entry
+            self.hits[kind] = self.hits.get(kind, 0) + 1
+            return entry[0]
+
+    def store(self, kind, key, value, size):
+        '''
+        Caches a value, evicting least recently used entries to stay
+        within max_bytes. Values larger than max_bytes are not cached.
+        '''
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop((kind, key), None)
+            if old:
+                self._bytes -= old[1]
+            self._entries[(kind, key)] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        '''
+        Returns a dictionary of cache counters.
+        '''
+        with self._lock:
+            entries = {}
+            for kind, _ in self._entries:
+                entries[kind] = entries.get(kind, 0) + 1
+            return {'bytes'     : self._bytes,
+                    'max_bytes' : self.max_bytes,
+                    'entries'   : entries,
+                    'hits'      : dict(self.hits),
+                    'misses'    : dict(self.misses),
+                    'backed'    : dict(self.backed),
+                    'evictions' : self.evictions}
@@ -0,0 +1,133 @@
+'''
+Offline precomputation of rationale matches.
+
+Reads or fetches every judged document, matches every judgment's
+rationale against it and writes the match spans to a MatchIndex. The
+viewer then reads matches from the index and only computes those that
+are missing.
+
+Usage: python precompute.py <data directory> <index file>
+                            [--documents STORE DIRECTORY] [--processes N]
+'''
+import argparse
+import multiprocessing
+import sys
+import traceback
+
+from collections import OrderedDict
+
+import ingest
+from datamodel import DataModel
+from matching import DocumentIndex
+from matchindex import MatchIndex
+from documenttext import MatchText, html_text
+from documentstore import DocumentStore, DocumentFetcher
+from overlapcache import digest
+from rationale import Rationale
+
+# Document fetcher of a worker process, and the store directory it fills.
+_fetcher   = None
+_directory = None
+
+def read_document(document_id, url, directory=None):
+    '''
+    Returns the HTML of a document from the DocumentStore in directory,
+    fetching it into the store first if needed. Without a directory, the
+    document is fetched without being stored.
+    '''
+    global _fetcher, _directory
+    if _fetcher is None or _directory != directory:
+        store = DocumentStore(directory) if directory else None
+        _fetcher, _directory = DocumentFetcher(store, concurrency=1), directory
+    if _fetcher.store is None:
+        return _fetcher.download(url)
+    if document_id not in _fetcher.store:
+        error = _fetcher.fetch_one(document_id, url)
+        if error:
+            raise IOError(error)
+    return _fetcher.store.get(document_id)
+
+def match_document(task):
+    '''
+    Worker entry point. Matches the rationales of one document.
+
+    Arguments:
+
+    task -- (document ID, URL, [rationale text], directory, minimum length)
+
+    Returns (document ID, URL, text digest, entries, error), with entries
+    as expected by MatchIndex.put.
+    '''
+    document_id, url, rationales, directory, minimum_length = task
+    try:
+        # Match against the visible text with whitespace collapsed, as the
+        # viewer does, so both agree on the text digest. html_text parses
+        # as WebKit does, so the visible text is the page's.
+        text  = MatchText(html_text(read_document(document_id, url, directory)).text).text
+        index = DocumentIndex(text)
+        text_digest = digest(text)
+        entries = [((text_digest, digest(r), minimum_length), index.maximal_matches(r, minimum_length))
+                   for r in rationales]
+        return (document_id, url, text_digest, entries, None)
+    except Exception:
+        return (document_id, url, None, None, traceback.format_exc())
+
+def tasks(model, directory=None, minimum_length=None):
+    '''
+    Returns a task for every judged document, with the distinct
+    rationale texts judged against it across all topics.
+    '''
+    if minimum_length is None:
+        minimum_length = Rationale.minimum_match_length
+    result = []
+    for document in model.judged_documents():
+        rationales = OrderedDict()
+        for j in model._filtered(document=document.id):
+            rationales[j.rationale] = None
+        result.append((document.id, document.url, list(rationales), directory, minimum_length))
+    return result
+
+def run(model, index, directory=None, processes=None):
+    '''
+    Matches every judged document on a process pool and writes the
+    results to the MatchIndex as they complete.
+
+    Returns an ordered dictionary of document ID-error pairs for every
+    document that could not be matched.
+    '''
+    errors = OrderedDict()
+    pool = multiprocessing.Pool(processes or multiprocessing.cpu_count())
+    try:
+        for document_id, url, text_digest, entries, error in \
+                pool.imap_unordered(match_document, tasks(model, directory)):
+            if error:
+                errors[document_id] = error
+            else:
+                index.put(document_id, url, text_digest, entries)
+    finally:
+        pool.close()
+        pool.join()
+    return errors
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute rationale matches.")
+    parser.add_argument('directory', help="directory of AMT result files")
+    parser.add_argument('index', help="match index file to write")
+    parser.add_argument('--documents', default=None,
+                        help="document store directory, filled with fetched documents")
+    parser.add_argument('--collection', default='2009.mqt', help="MQT test collection")
+    parser.add_argument('--processes', type=int, default=None, help="worker processes")
+    args = parser.parse_args(argv)
+
+    model = DataModel(args.collection)
+    model.load_files(ingest.find_files(args.directory), args.processes)
+    index = MatchIndex(args.index)
+    errors = run(model, index, args.documents, args.processes)
+    for document_id, error in errors.items():
+        sys.stderr.write("Error while matching document %s:\n%s\n" % (document_id, error))
+    index.close()
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import itertools
+
+from collections import namedtuple, defaultdict, OrderedDict
+
+from matching import DocumentIndex, pairwise_substrings, group_substrings
+from instrument import traced
+from overlapcache import digest, matches_size, runs_size, INDEX_BYTES_PER_CHARACTER
+
+class Rationale(object):
+    '''
+    Provides various utilities for analyzing similarity of rationales
+    with respect to each and a source text.
+    '''
+
+    def __init__(self, label, rationale):
+        self.label      = label
+        self.rationale  = rationale 
+
+    # Matches must be longer than this to be reported.
+    minimum_match_length = 5
+
+    @staticmethod
+    def compute_matches(index, rationale, minimum_match_length=None):
+        '''
+        Returns every maximal substring of a rationale, longer than the
+        minimum match length, that occurs in the indexed document text.
+
+        Arguments:
+
+        index     -- DocumentIndex of the source text.
+        rationale -- Rationale to match.
+
+        Returns a list of matching.Match, giving text and rationale offsets.
+        '''
+        if minimum_match_length is None:
+            minimum_match_length = Rationale.minimum_match_length
+        return index.maximal_matches(rationale.rationale.rationale, minimum_match_length)
+
+    @staticmethod
+    @traced('rationale.compute_overlap')
+    def compute_overlap(text, rationales, token=None, cache=None):
+        '''
+        Stores the key-string tuple and, for every tuple stored, computes the 
+        overlap of the string with the source text. Additionally, separately
+        computes overlapping portions of the text common to more than one triple.
+        
+        Arguments:
+        
+        text       -- Source text, or a DocumentIndex of it, to compare
+                      rationales against.
+        rationales -- Rationales to use for computation. 
+        token      -- Optional background.CancellationToken, checked
+                      between steps so a cancelled computation stops early.
+        cache      -- Optional OverlapCache. Document indexes, matches and
+                      pairwise overlap are then reused across calls.
+        
+        Returns namedtuple with fields:
+        
+        matches -- Dictionary of rationale-[string] pairs, where the list of strings 
+                   mapped to a rationale are substrings found in the text.
+        spans   -- Dictionary of rationale-[matching.Match] pairs, giving the
+                   offsets of those substrings in the text.
+        overlap -- List of strings that are common to two or more rationales.
+        shared  -- List of (string, [rationale]) pairs, giving the rationales
+                   each overlapping string is common to.
+        '''
+        minimum_match_length = Rationale.minimum_match_length
+        result = namedtuple('RationaleComputation', ['matches', 'spans', 'overlap', 'shared'])
+        texts  = [r.rationale.rationale for r in rationales]
+
+        # Compute matches against a single index of the text.
+        if cache is not None:
+            document_key = digest(text.text if isinstance(text, DocumentIndex) else text)
+            index = text if isinstance(text, DocumentIndex) else cache.get(
+                'index', document_key, lambda: DocumentIndex(text),
+                lambda i: len(i) * INDEX_BYTES_PER_CHARACTER)
+        else:
+            index = text if isinstance(text, DocumentIndex) else DocumentIndex(text)
+
+        matches  = defaultdict(list)
+        spans    = {}
+        for rationale, rationale_text in zip(rationales, texts):
+            if token:
+                token.check()
+            if cache is not None:
+                found = cache.get('matches', (document_key, digest(rationale_text), minimum_match_length),
+                                  lambda: Rationale.compute_matches(index, rationale, minimum_match_length),
+                                  matches_size)
+            else:
+                found = Rationale.compute_matches(index, rationale, minimum_match_length)
+            spans[rationale] = found
+            for match in found:
+                matches[rationale].append(index.text[match.text_start : match.text_start + match.length])
+     
+        # Compute overlap in rationales through one shared shingle index,
+        # reusing cached pairs where possible.
+        if token:
+            token.check()
+        if cache is not None:
+            pairs = Rationale._cached_pairs(texts, minimum_match_length, cache)
+        else:
+            pairs = pairwise_substrings(texts, minimum_match_length)
+        shared = [(s.text, [rationales[t] for t, _ in s.spans])
+                  for s in group_substrings(texts, minimum_match_length, pairs)]
+        overlap = [string for string, _ in shared]
+                
+        return result(matches = matches, spans = spans, overlap = overlap, shared = shared)
+
+    @staticmethod
+    def _cached_pairs(texts, minimum_match_length, cache):
+        '''
+        Returns pairwise_substrings for texts, computing only the pairs
+        of rationale texts that are not cached yet, in a single pass.
+        '''
+        keys    = [digest(t) for t in texts]
+        pairs   = OrderedDict()
+        missing = []
+        for a, b in itertools.combinations(range(len(texts)), 2):
+            # Runs are cached for the pair in content order, so flip them
+            # back if the selection has the texts the other way around.
+            flip = keys[a] > keys[b]
+            key  = (keys[b], keys[a], minimum_match_length) if flip else (keys[a], keys[b], minimum_match_length)
+            runs = cache.lookup('pair', key)
+            if runs is None:
+                missing.append((a, b))
+            elif runs:
+                pairs[(a, b)] = [(sb, sa, n) for sa, sb, n in runs] if flip else runs
+
+        computed = pairwise_substrings(texts, minimum_match_length, missing) if missing else {}
+        for a, b in missing:
+            runs = computed.get((a, b), [])
+            flip = keys[a] > keys[b]
+            key  = (keys[b], keys[a], minimum_match_length) if flip else (keys[a], keys[b], minimum_match_length)
+            cache.store('pair', key, [(sb, sa, n) for sa, sb, n in runs] if flip else runs,
+                        runs_size(runs))
+            if runs:
+                pairs[(a, b)] = runs
+        return pairs
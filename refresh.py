@@ -0,0 +1,79 @@
+'''
+Dirty-tracking refresh of the CWR statistics panels.
+'''
+from collections import OrderedDict
+
+class RefreshScheduler(object):
+    '''
+    Refreshes only the panels whose inputs changed.
+
+    Each panel declares the named inputs it depends on, such as the
+    selected topic or document, and a render function taking their
+    values in that order. Handlers set the current input values and call
+    refresh(), which renders every panel whose inputs differ from those
+    it was last rendered with, once each, in registration order.
+    '''
+
+    def __init__(self):
+        self._values  = {}              # Input name -> current value.
+        self._panels  = OrderedDict()   # Panel name -> (inputs, render).
+        self._shown   = {}              # Panel name -> input values last rendered.
+        self.renders  = {}              # Panel name -> number of renders.
+
+    def panel(self, name, inputs, render):
+        '''
+        Registers a panel.
+
+        Arguments:
+
+        name   -- Name of the panel.
+        inputs -- Names of the inputs the panel depends on.
+        render -- Called as render(*values) with the input values, in
+                  the order of inputs, to update the panel.
+        '''
+        self._panels[name] = (tuple(inputs), render)
+        self.renders[name] = 0
+
+    def set(self, **values):
+        '''
+        Sets the current value of one or more inputs. Inputs never set
+        have the value None.
+        '''
+        self._values.update(values)
+
+    def get(self, input):
+        '''
+        Returns the current value of an input.
+        '''
+        return self._values.get(input)
+
+    def invalidate(self, *names):
+        '''
+        Marks panels dirty regardless of their inputs. With no names, all
+        panels are marked.
+        '''
+        for name in names or list(self._panels):
+            self._shown.pop(name, None)
+
+    def _current(self, inputs):
+        return tuple(self._values.get(i) for i in inputs)
+
+    def dirty(self):
+        '''
+        Returns the names of the panels a refresh would render.
+        '''
+        return [name for name, (inputs, _) in self._panels.items()
+                if name not in self._shown or self._shown[name] != self._current(inputs)]
+
+    def refresh(self):
+        '''
+        Renders every dirty panel. Returns the names of those rendered.
+        '''
+        rendered = self.dirty()
+        for name in rendered:
+            inputs, render = self._panels[name]
+            values = self._current(inputs)
+            render(*values)
+            self._shown[name] = values
+            self.renders[name] += 1
+        return rendered
@@ -0,0 +1,242 @@
+'''
+Headless batch report of CWR statistics.
+
+Loads a directory of AMT result files through the DataModel and computes
+statistics for every judged topic and Topic-Document pair across worker
+processes. Results are streamed out as they complete, one line per topic
+or pair, in a deterministic order. Nothing here imports a GUI module.
+
+A DataModel holds open files and database connections, which must not be
+shared across processes, so every worker builds its own from the same
+arguments in the pool initializer. Workers load the AMT result files
+themselves, from the snapshot if one is given, except with the 'sqlite'
+store: the loading process writes the judgments to a database file once,
+and workers query it. Without --database, a temporary database file is
+used when there are several processes.
+
+With --workers, one line per worker is written instead, ranking workers
+by accuracy against the gold standard.
+
+Usage: python report.py <directory> [--processes N] [--format json|tsv] [--workers]
+                        [--store objects|compact|sqlite] [--database FILE]
+'''
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+
+from collections import OrderedDict
+
+import ingest
+from datamodel import DataModel
+from rationale import Rationale
+
+# Columns of a report line, in order.
+COLUMNS = ['level', 'topic', 'document', 'judgments', 'workers', 'd1_agreement',
+           'd2_agreement', 'gold_standard', 'gold_agreement', 'mean_relevance',
+           'rationale_overlaps', 'rationale_overlap_chars', 'confusion_matrix']
+
+# Columns of a worker report line, in order.
+WORKER_COLUMNS = ['worker', 'judgments', 'gold_judgments', 'gold_accuracy', 'd1_agreement',
+                  'd2_agreement', 'comparisons', 'median_work_time', 'p90_work_time',
+                  'mean_rationale_length']
+
+# Data model used by _statistics. Built by _initialize in worker processes
+# and set by run in the loading process.
+_model = None
+
+def _initialize(options, filenames):
+    '''
+    Worker initializer. Builds the worker's own DataModel with the
+    specified arguments and loads filenames into it.
+    '''
+    global _model
+    _model = DataModel(**options)
+    _model.load_files(filenames)
+
+def _gold_standard(model, topic_id, document_id):
+    try:
+        return model.gold_standard(topic_id, document_id)
+    except Exception:
+        return None
+
+def statistics(model, topic_id, document_id=None):
+    '''
+    Returns an ordered dictionary of statistics for a topic or, if a
+    document is specified, a Topic-Document pair.
+    '''
+    judgments = model._filtered(topic_id, document_id)
+    values    = [int(j.value) for j in judgments]
+    workers   = set(getattr(getattr(j, 'assignment', None), 'worker_id', None) for j in judgments)
+    workers.discard(None)
+
+    record = OrderedDict((c, None) for c in COLUMNS)
+    record['level']          = 'pair' if document_id else 'topic'
+    record['topic']          = topic_id
+    record['document']       = document_id
+    record['judgments']      = len(judgments)
+    record['workers']        = len(workers)
+    record['d1_agreement']   = model.agreement(1, topic_id, document_id)
+    record['d2_agreement']   = model.agreement(2, topic_id, document_id)
+    record['mean_relevance'] = float(sum(values)) / len(values) if values else None
+    record['confusion_matrix'] = model.confusion_matrix(topic_id, document_id).strip()
+
+    if document_id:
+        gold = _gold_standard(model, topic_id, document_id)
+        record['gold_standard'] = gold
+        if gold is not None and values:
+            record['gold_agreement'] = float(sum(1 for v in values if v == int(gold))) / len(values)
+
+        # Overlap between the rationales themselves; document text is not
+        # available headless.
+        rationales = [Rationale(str(i), j) for i, j in enumerate(judgments)]
+        overlap = Rationale.compute_overlap('', rationales).overlap
+        record['rationale_overlaps']      = len(overlap)
+        record['rationale_overlap_chars'] = sum(len(s) for s in overlap)
+    return record
+
+def _statistics(key):
+    '''
+    Worker entry point.
+    '''
+    return statistics(_model, *key)
+
+def keys(model):
+    '''
+    Returns the (topic, document) keys of every report line, in order.
+    Topic lines have a document of None and precede their pairs.
+    '''
+    result = []
+    for topic in sorted(t.id for t in model.judged_topics()):
+        result.append((topic, None))
+        for document in sorted(d.id for d in model.judged_documents_by_topic(topic)):
+            result.append((topic, document))
+    return result
+
+def run(model, processes=None, chunksize=16, options=None, filenames=()):
+    '''
+    Yields a statistics record for every judged topic and Topic-Document
+    pair, in the order of keys().
+
+    Arguments:
+
+    model     -- Loaded DataModel.
+    processes -- Number of worker processes. Defaults to 1, computing
+                 records in this process with model.
+    options   -- DataModel arguments workers build their model with, as
+                 a dictionary. Required with several processes; workers
+                 must end up with the same judgments as model.
+    filenames -- AMT result files workers load into their model.
+    '''
+    global _model
+    processes = processes or 1
+    if processes < 2:
+        _model = model
+        try:
+            for key in keys(model):
+                yield _statistics(key)
+        finally:
+            _model = None
+        return
+    if options is None:
+        raise ValueError("Several processes need the DataModel arguments of the workers.")
+    pool = multiprocessing.Pool(processes, _initialize, (options, filenames))
+    try:
+        for record in pool.imap(_statistics, keys(model), chunksize):
+            yield record
+    finally:
+        pool.terminate()
+        pool.join()
+
+def workers(model, key='gold_accuracy', minimum_judgments=1):
+    '''
+    Yields a record for every worker with at least minimum_judgments
+    judgments, best first by the named WorkerStatistics field.
+    '''
+    for s in model.worker_ranking(key, minimum_judgments):
+        record = OrderedDict((c, None) for c in WORKER_COLUMNS)
+        record['worker']                = s.worker_id
+        record['judgments']             = s.judgments
+        record['gold_judgments']        = s.gold_judgments
+        record['gold_accuracy']         = s.gold_accuracy
+        record['d1_agreement']          = s.d1_agreement
+        record['d2_agreement']          = s.d2_agreement
+        record['comparisons']           = s.comparisons
+        record['mean_rationale_length'] = s.mean_rationale_length
+        if s.work_time:
+            record['median_work_time']  = s.work_time.median
+            record['p90_work_time']     = s.work_time.p90
+        yield record
+
+def _tsv(record):
+    def cell(value):
+        if value is None:
+            return ''
+        return str(value).replace('\t', ' ').replace('\n', ' | ')
+    return '\t'.join(cell(v) for v in record.values())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless CWR statistics report.")
+    parser.add_argument('directory', help="directory of AMT result files")
+    parser.add_argument('--collection', default='2009.mqt', help="MQT test collection")
+    parser.add_argument('--snapshot', default=None, help="snapshot file for faster loading")
+    parser.add_argument('--lazy', action='store_true', help="load the test collection lazily")
+    parser.add_argument('--store', default='objects', choices=DataModel.STORES,
+                        help="judgment store")
+    parser.add_argument('--database', default=None,
+                        help="database file of the sqlite store, rebuilt from the AMT result files")
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                        help="worker processes computing statistics")
+    parser.add_argument('--format', default='json', choices=['json', 'tsv'], help="output format")
+    parser.add_argument('--workers', action='store_true',
+                        help="report per-worker quality instead, most accurate first")
+    args = parser.parse_args(argv)
+    if args.database and args.store != 'sqlite':
+        parser.error("--database requires --store sqlite")
+
+    database  = args.database
+    temporary = None
+    if args.store == 'sqlite' and not database and args.processes > 1 and not args.workers:
+        fd, temporary = tempfile.mkstemp(prefix='cwr_report_', suffix='.db')
+        os.close(fd)
+        database = temporary
+    if database and os.path.exists(database):
+        # The database only holds what this run loads.
+        for path in (database, database + '-wal', database + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+    try:
+        options = dict(collection=args.collection, snapshot=args.snapshot, lazy=args.lazy,
+                       store=args.store, database=database or ':memory:')
+        filenames = ingest.find_files(args.directory)
+        model  = DataModel(**options)
+        errors = model.load_files(filenames)
+        for filename, error in errors.items():
+            sys.stderr.write("Error while loading AMT results from %s:\n%s\n" % (filename, error))
+
+        out = sys.stdout
+        if args.format == 'tsv':
+            out.write('\t'.join(WORKER_COLUMNS if args.workers else COLUMNS) + '\n')
+        if args.workers:
+            records = workers(model)
+        else:
+            # Workers of the sqlite store query the database loaded here.
+            # Those of other stores load the files that loaded without
+            # error, as this process did.
+            loaded = [] if database else [f for f in filenames if f not in errors]
+            records = run(model, args.processes, options=options, filenames=loaded)
+        for record in records:
+            out.write((json.dumps(record) if args.format == 'json' else _tsv(record)) + '\n')
+            out.flush()
+        return 1 if errors else 0
+    finally:
+        if temporary:
+            for path in (temporary, temporary + '-wal', temporary + '-shm'):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+'''
+On-disk snapshot of the parsed test collection and AMT results.
+
+The snapshot file is a log of pickled records, read in one pass at
+startup: a header, the test collection, then one record per AMT result
+file with its judgments, or one noting that a file was dropped. Later
+records replace earlier ones for the same file, so a change only appends
+the records of the files that changed. The file is rewritten whole when
+the collection changes, or when replaced records take up more of it
+than the live ones.
+
+Every source file is recorded with its size and modification time; an
+entry is only reused while its source is unchanged. Records are pickled
+separately, so judgments read back point at copies of their Topic and
+Document objects; the DataModel points them back at its own.
+'''
+import os
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+# Bump whenever the layout of the pickled data changes.
+VERSION = 2
+
+def signature(path):
+    '''
+    Returns (size, mtime) for the specified file.
+    '''
+    st = os.stat(path)
+    return (st.st_size, st.st_mtime)
+
+class Snapshot(object):
+    '''
+    A snapshot of one test collection and the AMT result files parsed
+    against it.
+    '''
+
+    def __init__(self, path):
+        self.path       = path
+        self.collection = None      # (path, signature, test collection)
+        self.files      = {}        # Path -> (signature, [Judgment])
+        self._pending   = []        # File records not written yet, in order.
+        self._replaced  = 0         # File records in the log that were replaced.
+        self._rewrite   = False     # True if the whole file must be rewritten.
+        self.read()
+
+    @property
+    def dirty(self):
+        '''
+        True if modified since last read/write.
+        '''
+        return self._rewrite or bool(self._pending)
+
+    def read(self):
+        '''
+        Reads the snapshot from disk. A missing, unreadable or outdated
+        snapshot is treated as empty. A log cut short by an interrupted
+        write keeps the records before the cut.
+        '''
+        self.collection, self.files = None, {}
+        self._pending, self._replaced, self._rewrite = [], 0, False
+        try:
+            f = open(self.path, 'rb')
+        except IOError:
+            return
+        with f:
+            try:
+                if pickle.load(f) != ('snapshot', VERSION):
+                    return
+                self.collection = pickle.load(f)
+            except Exception:
+                self.collection = None
+                return
+            while True:
+                try:
+                    record = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception:
+                    self._rewrite = True
+                    break
+                self._apply(record)
+
+    def _apply(self, record):
+        filename, entry = record
+        if filename in self.files:
+            self._replaced += 1
+        if entry is None:
+            self.files.pop(filename, None)
+            self._replaced += 1
+        else:
+            self.files[filename] = entry
+
+    def write(self):
+        '''
+        Writes changes to disk if there are any: appends the records of
+        the files stored or dropped since the last write, or replaces the
+        file atomically when it must be rewritten, so an interrupted
+        rewrite never corrupts it.
+        '''
+        if not self.dirty:
+            return
+        if self._rewrite or self._replaced > len(self.files) or not os.path.exists(self.path):
+            temporary = self.path + '.tmp'
+            with open(temporary, 'wb') as f:
+                pickle.dump(('snapshot', VERSION), f, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(self.collection, f, pickle.HIGHEST_PROTOCOL)
+                for record in self.files.items():
+                    pickle.dump(record, f, pickle.HIGHEST_PROTOCOL)
+            os.rename(temporary, self.path)
+            self._replaced = 0
+        else:
+            with open(self.path, 'ab') as f:
+                for record in self._pending:
+                    pickle.dump(record, f, pickle.HIGHEST_PROTOCOL)
+        self._pending = []
+        self._rewrite = False
+
+    def _record(self, filename, entry):
+        self._apply((filename, entry))
+        self._pending.append((filename, entry))
+
+    def test_collection(self, path, loader):
+        '''
+        Returns the snapshotted test collection if its source file is
+        unchanged. Otherwise, loads it with loader(path) and drops every
+        file entry, since those were parsed against the old collection.
+        '''
+        path = os.path.abspath(path)
+        sig  = signature(path)
+        if self.collection and self.collection[:2] == (path, sig):
+            return self.collection[2]
+        tc = loader(path)
+        self.collection = (path, sig, tc)
+        self.files      = {}
+        self._pending   = []
+        self._rewrite   = True
+        return tc
+
+    def judgments(self, filename):
+        '''
+        Returns the snapshotted judgments for a file, or None if the file
+        is not in the snapshot or has changed since.
+        '''
+        entry = self.files.get(filename)
+        if entry and entry[0] == signature(filename):
+            return entry[1]
+        return None
+
+    def store(self, filename, judgments):
+        '''
+        Records the judgments parsed from a file.
+        '''
+        self._record(filename, (signature(filename), judgments))
+
+    def prune(self):
+        '''
+        Drops the entries of files that no longer exist. Entries of files
+        that exist but were not loaded this time are kept, so loading
+        different files or directories does not discard each other's.
+        '''
+        for f in [f for f in self.files if not os.path.exists(f)]:
+            self._record(f, None)
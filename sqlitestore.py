@@ -0,0 +1,312 @@
+'''
+SQLite-backed judgment store.
+
+Judgments are kept in indexed tables, so only query results are held in
+memory. Filtering by topic, document and Topic-Document pair runs as SQL,
+and so does the label counting behind agreement and the agreement
+matrix: label-pair counts, as defined in the agreement module, are
+aggregated from per-pair label histograms without reading judgments
+into memory. tests/test_sqlitestore.py checks the statistics computed
+from them against the test collection's.
+'''
+import os
+import sqlite3
+import threading
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from amt import assignment
+
+# Bump whenever the schema changes. Stored as the database user_version.
+SCHEMA_VERSION = 2
+
+# The value column has no type affinity, so relevance values are read
+# back with the type they were stored with.
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS topics (
+    id        INTEGER PRIMARY KEY,
+    topic_id  TEXT UNIQUE NOT NULL,
+    object    BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    id           INTEGER PRIMARY KEY,
+    document_id  TEXT UNIQUE NOT NULL,
+    object       BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS judgments (
+    id          INTEGER PRIMARY KEY,
+    topic       INTEGER NOT NULL REFERENCES topics(id),
+    document    INTEGER NOT NULL REFERENCES documents(id),
+    worker      TEXT,
+    value       NOT NULL,
+    gold        INTEGER,
+    rationale   TEXT,
+    feedback    TEXT,
+    assignment  BLOB
+);
+CREATE INDEX IF NOT EXISTS judgments_pair     ON judgments (topic, document, value);
+CREATE INDEX IF NOT EXISTS judgments_document ON judgments (document, value);
+CREATE INDEX IF NOT EXISTS judgments_worker   ON judgments (worker);
+CREATE TABLE IF NOT EXISTS topic_documents (
+    topic     INTEGER NOT NULL,
+    document  INTEGER NOT NULL,
+    PRIMARY KEY (topic, document)
+);
+'''
+
+class SQLiteJudgment(object):
+    '''
+    A judgment read back from the store. Exposes the attributes of a
+    test collection judgment.
+    '''
+    __slots__ = ('row', 'topic', 'document', 'worker', 'value',
+                 'gold_standard', 'rationale', 'feedback', 'assignment')
+
+    def __init__(self, row, topic, document, worker, value, gold_standard, rationale, feedback,
+                 assignment):
+        self.row           = row
+        self.topic         = topic
+        self.document      = document
+        self.worker        = worker
+        self.value         = value
+        self.gold_standard = gold_standard
+        self.rationale     = rationale
+        self.feedback      = feedback
+        self.assignment    = assignment
+
+    def __eq__(self, other):
+        return isinstance(other, SQLiteJudgment) and other.row == self.row
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.row)
+
+
+class SQLiteJudgmentStore(object):
+    '''
+    Judgments held in a SQLite database.
+    '''
+
+    # Rows fetched per round trip when streaming results.
+    BATCH = 1000
+
+    def __init__(self, path=':memory:', cache_pages=2000):
+        '''
+        Arguments:
+
+        path        -- Database file. Defaults to an in-memory database.
+        cache_pages -- Page cache size, bounding memory used by queries.
+        '''
+        self.path        = path
+        self.cache_pages = cache_pages
+        self._local      = threading.local()
+        self._connection = self._connect() if path == ':memory:' else None
+        self._create()
+
+        # Topic and Document objects are few; they are unpickled once.
+        self._topics    = {}    # Topic ID -> (row id, Topic)
+        self._documents = {}    # Document ID -> (row id, Document)
+        self._objects   = {}    # ('t' or 'd', row id) -> Topic or Document
+        for kind, table, key in (('t', 'topics', 'topic_id'), ('d', 'documents', 'document_id')):
+            for row, key_value, blob in self._db.execute('SELECT id, %s, object FROM %s' % (key, table)):
+                obj = pickle.loads(bytes(blob))
+                self._objects[(kind, row)] = obj
+                (self._topics if kind == 't' else self._documents)[key_value] = (row, obj)
+
+    def _create(self):
+        '''
+        Creates the tables of a new database. Raises ValueError for a
+        database written with another schema.
+        '''
+        db = self._db
+        version = db.execute('PRAGMA user_version').fetchone()[0]
+        tables  = db.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]
+        if tables and version != SCHEMA_VERSION:
+            raise ValueError("Judgment database %s has schema version %d, expected %d; "
+                             "delete it to rebuild it." % (self.path, version, SCHEMA_VERSION))
+        db.executescript(SCHEMA)
+        db.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute('PRAGMA cache_size = %d' % self.cache_pages)
+        connection.execute('PRAGMA journal_mode = WAL')
+        return connection
+
+    @property
+    def _db(self):
+        '''
+        The database connection. A database file gets one connection per
+        thread and process, since SQLite connections must not be shared
+        across processes and queries from several threads should not
+        share a cursor state. An in-memory database only exists in its
+        one connection, which is shared and serialized by SQLite.
+        '''
+        if self._connection is not None:
+            return self._connection
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.pid        = os.getpid()
+            local.connection = self._connect()
+        return local.connection
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM judgments').fetchone()[0]
+
+    def _row_id(self, kind, obj):
+        '''
+        Returns the row id of a topic or document, inserting it if needed.
+        '''
+        ids   = self._topics if kind == 't' else self._documents
+        entry = ids.get(obj.id)
+        if entry:
+            return entry[0]
+        table, key = ('topics', 'topic_id') if kind == 't' else ('documents', 'document_id')
+        blob = sqlite3.Binary(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+        row  = self._db.execute('INSERT INTO %s (%s, object) VALUES (?, ?)' % (table, key),
+                                (obj.id, blob)).lastrowid
+        ids[obj.id] = (row, obj)
+        self._objects[(kind, row)] = obj
+        return row
+
+    def add(self, judgments):
+        '''
+        Inserts judgments in a single transaction.
+        '''
+        def rows():
+            for j in judgments:
+                t = self._row_id('t', j.topic)
+                d = self._row_id('d', j.document)
+                a = assignment(j)
+                yield (t, d,
+                       a.worker_id if a else None,
+                       j.value,
+                       a.gold_standard if a else None,
+                       j.rationale,
+                       getattr(j, 'feedback', None),
+                       sqlite3.Binary(pickle.dumps(a, pickle.HIGHEST_PROTOCOL)) if a else None)
+        with self._db:
+            for batch in self._batches(rows()):
+                self._db.executemany('INSERT INTO judgments (topic, document, worker, value, gold, '
+                                     'rationale, feedback, assignment) '
+                                     'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', batch)
+                self._db.executemany('INSERT OR IGNORE INTO topic_documents VALUES (?, ?)',
+                                     [r[:2] for r in batch])
+
+    def _batches(self, rows):
+        batch = []
+        for r in rows:
+            batch.append(r)
+            if len(batch) == self.BATCH:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _judgment(self, row):
+        i, t, d, worker, value, gold, rationale, feedback, blob = row
+        return SQLiteJudgment(i, self._objects[('t', t)], self._objects[('d', d)], worker,
+                              value, gold, rationale, feedback,
+                              pickle.loads(bytes(blob)) if blob is not None else None)
+
+    def _where(self, topic_id, document_id):
+        '''
+        Returns (SQL condition, parameters) filtering judgments by topic
+        and document, or None if nothing can match.
+        '''
+        conditions, parameters = ['1'], []
+        for kind, column, key in (('t', 'topic', topic_id), ('d', 'document', document_id)):
+            if key:
+                entry = (self._topics if kind == 't' else self._documents).get(key)
+                if not entry:
+                    return None
+                conditions.append('%s = ?' % column)
+                parameters.append(entry[0])
+        return ' AND '.join(conditions), parameters
+
+    def iter_judgments(self, topic_id=None, document_id=None):
+        '''
+        Streams judgments, optionally filtered by topic and document,
+        without holding the full result in memory.
+        '''
+        where = self._where(topic_id, document_id)
+        if where is None:
+            return
+        cursor = self._db.execute('SELECT id, topic, document, worker, value, gold, rationale, '
+                                  'feedback, assignment FROM judgments WHERE %s ORDER BY id' % where[0], where[1])
+        while True:
+            rows = cursor.fetchmany(self.BATCH)
+            if not rows:
+                break
+            for row in rows:
+                yield self._judgment(row)
+
+    def judgments(self):
+        return list(self.iter_judgments())
+
+    def by_topic(self, topic_id):
+        return list(self.iter_judgments(topic_id=topic_id)) if topic_id else []
+
+    def by_document(self, document_id):
+        return list(self.iter_judgments(document_id=document_id)) if document_id else []
+
+    def by_pair(self, topic_id, document_id):
+        if not (topic_id and document_id):
+            return []
+        return list(self.iter_judgments(topic_id, document_id))
+
+    def topics(self):
+        return [obj for _, obj in sorted(self._topics.values(), key=lambda e: e[0])]
+
+    def documents(self):
+        return [obj for _, obj in sorted(self._documents.values(), key=lambda e: e[0])]
+
+    def document(self, document_id):
+        entry = self._documents.get(document_id)
+        return entry[1] if entry else None
+
+    def documents_by_topic(self, topic_id):
+        entry = self._topics.get(topic_id)
+        if not entry:
+            return []
+        rows = self._db.execute('SELECT document FROM topic_documents WHERE topic = ? '
+                                'ORDER BY rowid', (entry[0],))
+        return [self._objects[('d', d)] for (d,) in rows]
+
+    #####################################
+    # Aggregate Pushdown                #
+    #####################################
+
+    def label_pair_counts(self, topic_id=None, document_id=None):
+        '''
+        Returns a dictionary of (label, label)-count pairs over ordered
+        pairs of distinct judgments on the same Topic-Document pair, for
+        all judgments or those of a topic, document or pair. See the
+        agreement module.
+        '''
+        where = self._where(topic_id, document_id)
+        if where is None:
+            return {}
+        histogram = ('SELECT topic, document, CAST(value AS INTEGER) AS label, COUNT(*) AS n '
+                     'FROM judgments WHERE %s GROUP BY topic, document, label' % where[0])
+        rows = self._db.execute('SELECT a.label, b.label, SUM(a.n * (b.n - (a.label = b.label))) '
+                                'FROM (%s) a JOIN (%s) b '
+                                'ON a.topic = b.topic AND a.document = b.document '
+                                'GROUP BY a.label, b.label' % (histogram, histogram),
+                                where[1] * 2)
+        return dict(((r, c), n) for r, c, n in rows if n)
+
+    def labels(self):
+        '''
+        Returns every label judged, sorted.
+        '''
+        return [label for (label,) in
+                self._db.execute('SELECT DISTINCT CAST(value AS INTEGER) FROM judgments ORDER BY 1')]
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,123 @@
+import threading
+
+from collections import OrderedDict
+
+class StatisticsCache(object):
+    '''
+    Bounded LRU cache of computed statistics. Entries are keyed by
+    (statistic, degree, topic, document), where topic and document are
+    the filters the statistic was computed with (None for no filter).
+
+    The cache may be shared between threads. A value being computed by
+    one thread is waited for, not recomputed, by others asking for it.
+    '''
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self._entries = OrderedDict()       # Key -> computed value, oldest first.
+        self._lock    = threading.Lock()
+        self._pending = {}                  # Key -> Event set once computed.
+        self._generation = 0                # Incremented whenever entries are dropped.
+
+        # Counters, exposed through stats().
+        self.hits          = 0
+        self.misses        = 0
+        self.evictions     = 0
+        self.invalidations = 0
+
+    def get(self, statistic, degree, topic, document, compute):
+        '''
+        Returns the cached value for the key, calling compute() to fill
+        the cache on a miss.
+        '''
+        key = (statistic, degree, topic, document)
+        entries = self._entries
+        while True:
+            with self._lock:
+                if key in entries:
+                    self.hits += 1
+                    value = entries.pop(key)
+                    entries[key] = value
+                    return value
+                pending = self._pending.get(key)
+                if pending is None:
+                    self.misses += 1
+                    pending = self._pending[key] = threading.Event()
+                    generation = self._generation
+                    break
+            # Another thread is computing it; look again once it is done.
+            pending.wait()
+
+        try:
+            value = compute()
+        except:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+            raise
+        with self._lock:
+            del self._pending[key]
+            # A value computed across an invalidation may already be stale.
+            if generation == self._generation:
+                entries[key] = value
+                if len(entries) > self.capacity:
+                    entries.popitem(last=False)
+                    self.evictions += 1
+        pending.set()
+        return value
+
+    def __contains__(self, key):
+        '''
+        True if a value is cached for the (statistic, degree, topic,
+        document) key.
+        '''
+        return key in self._entries
+
+    def invalidate(self, pairs):
+        '''
+        Drops every entry whose filter would have matched a judgment on
+        one of the specified (topic ID, document ID) pairs.
+        '''
+        pairs = set(pairs)
+        if not pairs:
+            return
+        topics    = set(t for t, _ in pairs)
+        documents = set(d for _, d in pairs)
+
+        def affected(topic, document):
+            if topic is None and document is None:
+                return True
+            if document is None:
+                return topic in topics
+            if topic is None:
+                return document in documents
+            return (topic, document) in pairs
+
+        with self._lock:
+            self._generation += 1
+            stale = [k for k in self._entries if affected(k[2], k[3])]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        '''
+        Drops every entry. Counters are preserved.
+        '''
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        '''
+        Returns a dictionary of cache counters.
+        '''
+        lookups = self.hits + self.misses
+        return {'size'          : len(self._entries),
+                'capacity'      : self.capacity,
+                'hits'          : self.hits,
+                'misses'        : self.misses,
+                'hit_rate'      : float(self.hits) / lookups if lookups else 0.0,
+                'evictions'     : self.evictions,
+                'invalidations' : self.invalidations}
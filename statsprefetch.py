@@ -0,0 +1,143 @@
+'''
+Background prefetching of per-document statistics.
+
+When a topic is selected, the Statistics of every document judged for
+it are computed on a small pool of worker threads, in list order, and
+land in the DataModel's statistics cache. A later document click then
+reads them from the cache, and only computes synchronously on a miss.
+'''
+import threading
+import traceback
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+class StatisticsPrefetcher(object):
+    '''
+    Computes DataModel.statistics() for Topic-Document pairs on worker
+    threads. Each prefetch() replaces the pairs still queued from the
+    previous one, so selecting another topic redirects the workers.
+    '''
+
+    def __init__(self, data_model, workers=2, limit=None):
+        '''
+        Arguments:
+
+        data_model -- DataModel whose statistics are prefetched.
+        workers    -- Number of worker threads.
+        limit      -- Most pairs prefetched per call. Defaults to half
+                      the statistics cache capacity, so that prefetched
+                      results do not evict each other.
+        '''
+        self.data_model = data_model
+        self.workers    = workers
+        self.limit      = limit if limit is not None else data_model.statistics_cache.capacity // 2
+
+        self._queue      = queue.Queue()
+        self._generation = 0            # Incremented to drop queued pairs.
+        self._lock       = threading.Lock()
+        self._threads    = []
+
+        # Counters, exposed through stats().
+        self.computed = 0
+        self.skipped  = 0               # Already cached when dequeued.
+        self.dropped  = 0               # Superseded by a later prefetch().
+        self.errors   = {}              # (topic ID, document ID) -> error.
+
+    def prefetch(self, topic_id, document_ids):
+        '''
+        Queues the statistics of a topic's documents for computation, in
+        the order given, replacing any pairs still queued.
+        '''
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            self._start_workers()
+        for document_id in list(document_ids)[:self.limit]:
+            self._queue.put((generation, topic_id, document_id))
+
+    def cancel(self):
+        '''
+        Drops every queued pair. Computations in flight still finish.
+        '''
+        with self._lock:
+            self._generation += 1
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            worker = threading.Thread(target=self._run)
+            worker.daemon = True
+            worker.start()
+            self._threads.append(worker)
+
+    def _run(self):
+        dm = self.data_model
+        while True:
+            generation, topic_id, document_id = self._queue.get()
+            if generation != self._generation:
+                self.dropped += 1
+                continue
+            if dm.has_statistics(topic_id, document_id):
+                self.skipped += 1
+                continue
+            try:
+                dm.statistics(topic_id, document_id)
+                self.computed += 1
+            except Exception:
+                self.errors[(topic_id, document_id)] = traceback.format_exc()
+
+    def stats(self):
+        '''
+        Returns a dictionary of prefetch counters.
+        '''
+        return {'queued'   : self._queue.qsize(),
+                'computed' : self.computed,
+                'skipped'  : self.skipped,
+                'dropped'  : self.dropped,
+                'errors'   : len(self.errors)}
+
+
+if __name__ == "__main__":
+    # Compares document click latency with and without prefetching, on
+    # the topic with the most judged documents.
+    #
+    # Usage: python statsprefetch.py [data directory]
+    import sys
+    import time
+
+    import ingest
+    from datamodel import DataModel
+
+    directory = sys.argv[1] if len(sys.argv) > 1 else 'data'
+
+    def model():
+        dm = DataModel()
+        dm.load_files(ingest.find_files(directory, '.csv'))
+        return dm
+
+    def clicks(dm, topic_id, documents):
+        start = time.time()
+        for d in documents:
+            dm.statistics(topic_id, d)
+        return (time.time() - start) / len(documents)
+
+    dm = model()
+    topic_id = max((t.id for t in dm.judged_topics()),
+                   key=lambda t: len(dm.judged_documents_by_topic(t)))
+    documents = sorted(d.id for d in dm.judged_documents_by_topic(topic_id))
+    cold = clicks(dm, topic_id, documents)
+
+    dm = model()
+    prefetcher = StatisticsPrefetcher(dm)
+    start = time.time()
+    prefetcher.prefetch(topic_id, documents)
+    while prefetcher.computed + len(prefetcher.errors) < len(documents):
+        time.sleep(0.001)
+    took = time.time() - start
+    warm = clicks(dm, topic_id, documents)
+
+    print ("Topic %s, %d documents: prefetch took %.3fs in the background" %
+           (topic_id, len(documents), took))
+    print ("Click latency: %.2f ms computed, %.3f ms prefetched" % (cold * 1e3, warm * 1e3))
@@ -0,0 +1,283 @@
+'''
+Synthetic AMT result corpora.
+
+Writes AMT result files with the same columns as the real exports, at any
+size, so that loading and statistics can be measured at scale. Every
+Topic-Document pair is judged in one HIT by several distinct workers.
+Workers have their own accuracy against the gold standard, and most
+rationales are excerpts of a deterministic synthetic document text, with
+a few words changed, so overlap computation sees realistic matches.
+
+Topic-Document pairs are drawn from a test collection's gold standard
+when one is given, so that the test collection can import the files, and
+invented otherwise.
+
+Usage: python synthetic.py <directory> [judgments] [--rows-per-file N]
+                           [--seed S] [--collection MQT]
+'''
+import argparse
+import csv
+import os
+import random
+import zlib
+
+from collections import namedtuple
+
+from amt import parse_row
+
+# Columns of an AMT result file, in the order of the real exports.
+COLUMNS = ['HITId', 'HITTypeId', 'Title', 'Description', 'Keywords', 'Reward', 'CreationTime',
+           'MaxAssignments', 'RequesterAnnotation', 'AssignmentDurationInSeconds',
+           'AutoApprovalDelayInSeconds', 'Expiration', 'NumberOfSimilarHITs',
+           'LifetimeInSeconds', 'AssignmentId', 'WorkerId', 'AssignmentStatus', 'AcceptTime',
+           'SubmitTime', 'AutoApprovalTime', 'ApprovalTime', 'RejectionTime',
+           'RequesterFeedback', 'WorkTimeInSeconds', 'LifetimeApprovalRate',
+           'Last30DaysApprovalRate', 'Last7DaysApprovalRate', 'query', 'query_id',
+           'description', 'narrative', 'document_url', 'document_id', 'gold_standard',
+           'user_feedback', 'user_rationale', 'user_relevance', 'Approve', 'Reject']
+
+# Column values shared by every row.
+_CONSTANT = {'HITTypeId'                   : '3KIFW8VYC9WMJF2NQ7J3WNNE17TPBH',
+             'Title'                       : 'Relevant or Not?',
+             'Description'                 : 'Help us improve search engines! Decide if pages '
+                                             'are relevant or not relevant for a query.',
+             'Keywords'                    : 'relevance, judgments, web, query, search, fun',
+             'Reward'                      : '$0.11',
+             'CreationTime'                : 'Thu Feb 04 10:35:59 PST 2016',
+             'RequesterAnnotation'         : 'BatchId:0000000;',
+             'AssignmentDurationInSeconds' : '3600',
+             'AutoApprovalDelayInSeconds'  : '21600',
+             'Expiration'                  : 'Fri Feb 12 10:35:59 PST 2016',
+             'AcceptTime'                  : 'Thu Feb 04 16:32:08 PST 2016',
+             'SubmitTime'                  : 'Thu Feb 04 16:33:22 PST 2016',
+             'AutoApprovalTime'            : 'Thu Feb 04 22:33:22 PST 2016',
+             'user_feedback'               : '{}'}
+
+# A judged Topic-Document pair and its gold standard value.
+Pair = namedtuple('Pair', ['topic_id', 'query', 'description', 'narrative',
+                           'document_id', 'document_url', 'gold_standard'])
+
+# Vocabulary of synthetic document texts and free-text rationales.
+WORDS = ('the of and to in is for on that with as by this page information about are '
+         'from was his her music career award education history album song written '
+         'famous school university born life work published book review article '
+         'relevant describes mentions query topic search results site official news '
+         'biography early later public known first years national record several').split()
+
+_ID_CHARACTERS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+def _id(rng, length):
+    return ''.join(rng.choice(_ID_CHARACTERS) for _ in range(length))
+
+def document_text(document_id, words=400):
+    '''
+    Returns the deterministic synthetic text of a document.
+    '''
+    rng = random.Random(zlib.crc32(document_id.encode('utf-8')))
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+def invented_pairs(count, pairs_per_topic=50, seed=0):
+    '''
+    Returns count invented Topic-Document pairs, pairs_per_topic to a
+    topic, with uniformly distributed gold standard values.
+    '''
+    rng = random.Random(seed)
+    pairs = []
+    for i in range(count):
+        topic_id = str(20000 + i // pairs_per_topic)
+        pairs.append(Pair(topic_id     = topic_id,
+                          query        = 'topic %s' % topic_id,
+                          description  = 'Describe topic %s' % topic_id,
+                          narrative    = 'Relevant are documents about topic %s.' % topic_id,
+                          document_id  = 'clueweb09-en%04d-%02d-%05d' % (i // 100000, i // 1000 % 100, i % 1000),
+                          document_url = 'http://example.com/%d' % i,
+                          gold_standard = rng.randint(0, 2)))
+    return pairs
+
+def collection_pairs(collection):
+    '''
+    Returns the Topic-Document pairs of a test collection's gold standard.
+    '''
+    pairs = []
+    for gs in collection.gold_standard():
+        t, d = gs.topic, gs.document
+        pairs.append(Pair(topic_id     = t.id,
+                          query        = getattr(t, 'query', ''),
+                          description  = getattr(t, 'description', ''),
+                          narrative    = getattr(t, 'narrative', ''),
+                          document_id  = d.id,
+                          document_url = getattr(d, 'url', ''),
+                          gold_standard = int(gs.value)))
+    return pairs
+
+def _relevance(rng, gold, accuracy):
+    '''
+    Returns a worker's relevance label (-1 to 3) for a document with the
+    given gold standard value (0 to 2).
+    '''
+    if rng.random() < 0.05:
+        return -1                       # Document could not be judged.
+    if rng.random() < accuracy:
+        return (0, rng.choice((1, 2)), rng.choice((2, 3)))[gold]
+    return rng.randint(0, 3)
+
+def _rationale(rng, text):
+    '''
+    Returns a rationale: usually an excerpt of the document text with a
+    few words changed, otherwise free text.
+    '''
+    if rng.random() < 0.3:
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(5, 60)))
+    words = text.split(' ')
+    length = rng.randint(5, 60)
+    start = rng.randrange(max(1, len(words) - length))
+    excerpt = words[start:start + length]
+    for _ in range(len(excerpt) // 10):
+        excerpt[rng.randrange(len(excerpt))] = rng.choice(WORDS)
+    return ' '.join(excerpt)
+
+def rows(judgments, pairs=None, judgments_per_pair=8, workers=None, seed=0):
+    '''
+    Yields judgments AMT result rows, as column-value dictionaries.
+
+    Arguments:
+
+    judgments          -- Number of rows.
+    pairs              -- Topic-Document pairs to judge, in order. Pairs
+                          are reused if there are too few. Defaults to
+                          invented pairs.
+    judgments_per_pair -- Assignments of each HIT.
+    workers            -- Size of the worker pool. Defaults to one
+                          worker for every 20 judgments.
+    seed               -- Random seed; equal arguments give equal rows.
+    '''
+    rng = random.Random(seed)
+    hits = (judgments + judgments_per_pair - 1) // judgments_per_pair
+    if pairs is None:
+        pairs = invented_pairs(hits, seed=seed)
+    workers = workers or max(judgments_per_pair, judgments // 20)
+
+    # (Worker ID, accuracy, median work time, approval count) of each worker.
+    pool = [('A' + _id(rng, 13), rng.betavariate(6, 3), rng.randint(20, 120), rng.randint(1, 200))
+            for _ in range(workers)]
+
+    texts = {}
+    emitted = 0
+    for hit in range(hits):
+        pair = pairs[hit % len(pairs)]
+        text = texts.get(pair.document_id)
+        if text is None:
+            if len(texts) > 1000:
+                texts.clear()
+            text = texts[pair.document_id] = document_text(pair.document_id)
+        hit_id = _id(rng, 30)
+        for worker_id, accuracy, work_time, approved in rng.sample(pool, judgments_per_pair):
+            if emitted == judgments:
+                return
+            emitted += 1
+            status = 'Approved' if rng.random() < 0.96 else 'Submitted'
+            rate = '100%% (%d/%d)' % (approved, approved)
+            row = dict(_CONSTANT)
+            row.update({'HITId'                  : hit_id,
+                        'MaxAssignments'         : str(judgments_per_pair),
+                        'AssignmentId'           : _id(rng, 30),
+                        'WorkerId'               : worker_id,
+                        'AssignmentStatus'       : status,
+                        'ApprovalTime'           : '2016-02-05 06:37:37 UTC' if status == 'Approved' else '',
+                        'WorkTimeInSeconds'      : str(max(5, int(rng.lognormvariate(0, 0.6) * work_time))),
+                        'LifetimeApprovalRate'   : rate,
+                        'Last30DaysApprovalRate' : rate,
+                        'Last7DaysApprovalRate'  : rate,
+                        'query'                  : pair.query,
+                        'query_id'               : pair.topic_id,
+                        'description'            : pair.description,
+                        'narrative'              : pair.narrative,
+                        'document_url'           : pair.document_url,
+                        'document_id'            : pair.document_id,
+                        'gold_standard'          : str(pair.gold_standard),
+                        'user_rationale'         : _rationale(rng, text),
+                        'user_relevance'         : str(_relevance(rng, pair.gold_standard, accuracy))})
+            yield row
+
+def write_corpus(directory, judgments, rows_per_file=50000, prefix='synthetic', **options):
+    '''
+    Writes a synthetic corpus of AMT result files into directory, named
+    <prefix><number>_rationales.csv. Further keyword arguments are passed
+    to rows().
+
+    Returns the paths of the files written, in order.
+    '''
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    filenames = []
+    out = None
+    for i, row in enumerate(rows(judgments, **options)):
+        if i % rows_per_file == 0:
+            if out:
+                out.close()
+            filenames.append(os.path.join(directory, '%s%04d_rationales.csv' % (prefix, len(filenames))))
+            out = open(filenames[-1], 'w')
+            writer = csv.DictWriter(out, COLUMNS, lineterminator='\n')
+            writer.writeheader()
+        writer.writerow(row)
+    if out:
+        out.close()
+    return filenames
+
+
+class Record(object):
+    '''
+    Stand-in for a test collection topic, document or judgment.
+    '''
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+def judgments(filenames):
+    '''
+    Yields judgment stand-ins for the rows of AMT result files, annotated
+    with their AMTAssignment like loaded judgments, without needing the
+    test collection. Topics and documents are shared objects.
+    '''
+    topics, documents = {}, {}
+    for filename in filenames:
+        with open(filename, 'r') as f:
+            for row in csv.DictReader(f):
+                t = topics.get(row['query_id'])
+                if t is None:
+                    t = topics[row['query_id']] = Record(id=row['query_id'], query=row['query'],
+                                                         narrative=row['narrative'])
+                d = documents.get(row['document_id'])
+                if d is None:
+                    d = documents[row['document_id']] = Record(id=row['document_id'],
+                                                               url=row['document_url'])
+                a = parse_row(row)
+                yield Record(topic=t, document=d, value=row['user_relevance'],
+                             rationale=a.rationale, feedback=a.feedback, assignment=a)
+
+class Collection(object):
+    '''
+    Stand-in for a test collection which imports AMT result files with
+    judgments(). Defined at module level so that spawned worker
+    processes can unpickle it.
+    '''
+    def import_amt_results(self, filename):
+        return list(judgments([filename]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes a synthetic AMT result corpus.")
+    parser.add_argument('directory')
+    parser.add_argument('judgments', type=int, nargs='?', default=100000)
+    parser.add_argument('--rows-per-file', type=int, default=50000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--collection', default=None,
+                        help="MQT test collection to draw Topic-Document pairs from")
+    args = parser.parse_args()
+
+    pairs = None
+    if args.collection:
+        from testcollection.mqt import MQT
+        pairs = collection_pairs(MQT.load(args.collection))
+    for filename in write_corpus(args.directory, args.judgments, args.rows_per_file,
+                                 pairs=pairs, seed=args.seed):
+        print (filename)
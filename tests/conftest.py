@@ -0,0 +1,39 @@
+'''
+Shared fixtures. Modules are imported from the repository root, as the
+CWR runs them.
+
+Tests that need the MQT test collection (the testcollection submodule
+and a collection file) are skipped without it. The collection file is
+read from CWR_COLLECTION, defaulting to 2009.mqt in the repository root.
+'''
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DATA = os.path.join(ROOT, 'data')
+
+@pytest.fixture
+def data_files():
+    '''
+    The AMT result files in data/.
+    '''
+    import ingest
+    return ingest.find_files(DATA)
+
+@pytest.fixture
+def collection_path():
+    '''
+    Path of the MQT test collection. Skips the test without one.
+    '''
+    path = os.environ.get('CWR_COLLECTION', os.path.join(ROOT, '2009.mqt'))
+    try:
+        from testcollection.mqt import MQT
+    except ImportError:
+        pytest.skip("the testcollection submodule is not available")
+    if not os.path.exists(path):
+        pytest.skip("no test collection at %s; set CWR_COLLECTION" % path)
+    return path
@@ -0,0 +1,33 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import synthetic
+from agreement import label_pair_counts, degree_agreement, agreement_matrix
+from agreementengine import AgreementTable, verify
+from judgmentstore import JudgmentIndex
+
+def test_matches_agreement_module(data_files):
+    index = JudgmentIndex()
+    index.add(synthetic.judgments(data_files))
+    table  = AgreementTable(index.judgments())
+    labels = table.labels.tolist()
+    keys = [(None, None, index.judgments())]
+    for t in table.encoded.topics:
+        keys.append((t, None, index.by_topic(t)))
+    for d in table.encoded.documents:
+        keys.append((None, d, index.by_document(d)))
+    for t, d in table.encoded.pairs:
+        keys.append((t, d, index.by_pair(t, d)))
+    for topic, document, judgments in keys:
+        counts = label_pair_counts(judgments)
+        assert table.label_pair_counts(topic, document) == counts
+        for degree in (1, 2):
+            assert table.agreement(degree, topic, document) == degree_agreement(counts, degree)
+        assert table.matrix(topic, document) == agreement_matrix(counts, labels)
+
+def test_matches_collection(collection_path, data_files):
+    from datamodel import DataModel
+    model = DataModel(collection_path)
+    assert model.load_files(data_files) == {}
+    assert verify(model) == []
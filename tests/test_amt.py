@@ -0,0 +1,46 @@
+import amt
+from synthetic import Record
+
+def _row(assignment_id, rationale, relevance=1, topic='t', document='d'):
+    return amt.AMTAssignment(assignment_id=assignment_id, hit_id='h', worker_id='w' + assignment_id,
+                             status='Approved', work_time=10, approval_rate=1.0,
+                             topic_id=topic, document_id=document, document_url='u',
+                             gold_standard=1, relevance=relevance, rationale=rationale,
+                             feedback='')
+
+def _judgment(rationale, value='1', topic='t', document='d'):
+    return Record(topic=Record(id=topic), document=Record(id=document), value=value,
+                  rationale=rationale)
+
+def _ids(judgments):
+    return [j.assignment.assignment_id if j.assignment else None for j in judgments]
+
+def test_matches_identical_rows_in_file_order():
+    rows = [_row('1', 'same'), _row('2', 'other'), _row('3', 'same')]
+    judgments = amt.annotate([_judgment('same'), _judgment('other'), _judgment('same')], rows)
+    assert _ids(judgments) == ['1', '2', '3']
+
+def test_matches_changed_text_only_when_unique():
+    rows = [_row('1', 'A  rationale\n'), _row('2', 'another one')]
+    judgments = amt.annotate([_judgment('a rationale'), _judgment('another one')], rows)
+    assert _ids(judgments) == ['1', '2']
+
+def test_matches_changed_duplicates_in_file_order():
+    rows = [_row('1', 'Same text'), _row('2', 'same  text')]
+    judgments = amt.annotate([_judgment('same text'), _judgment('same text')], rows)
+    assert _ids(judgments) == ['1', '2']
+
+def test_leaves_ambiguous_judgments_unassigned():
+    rows = [_row('1', 'Same text'), _row('2', 'same  text')]
+    judgments = amt.annotate([_judgment('same text')], rows)
+    assert _ids(judgments) == [None]
+
+def test_never_falls_back_to_topic_and_document():
+    rows = [_row('1', 'first'), _row('2', 'second', relevance=0)]
+    judgments = amt.annotate([_judgment('changed'), _judgment('second', value='1')], rows)
+    assert _ids(judgments) == [None, None]
+
+def test_exact_matches_are_not_taken_by_changed_text():
+    rows = [_row('1', 'text'), _row('2', 'Text')]
+    judgments = amt.annotate([_judgment('TEXT'), _judgment('text')], rows)
+    assert _ids(judgments) == ['2', '1']
@@ -0,0 +1,25 @@
+import pytest
+
+import amt
+
+@pytest.fixture
+def model(collection_path):
+    from datamodel import DataModel
+    return DataModel(collection_path)
+
+def test_load_reports_errors(model, data_files, tmpdir):
+    missing = str(tmpdir.join('missing_rationales.csv'))
+    assert list(model.load(missing)) == [missing]
+    assert model.load(data_files[0]) == {}
+    assert len(model.judged_data) > 0
+
+def test_assignments_belong_to_their_judgments(model, data_files):
+    assert model.load_files(data_files) == {}
+    ids = []
+    for j in model.judged_data:
+        a = amt.assignment(j)
+        if a is not None:
+            assert (a.topic_id, a.document_id, a.relevance) == \
+                   (j.topic.id, j.document.id, int(j.value))
+            ids.append(a.assignment_id)
+    assert len(ids) == len(set(ids))
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import threading
+
+import pytest
+
+from documentstore import DocumentStore, DocumentFetcher, decode
+
+try:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+
+TEXT = u'caf\xe9 – na\xefve'
+
+# Path -> (Content-Type header, body), one for every step of the rule.
+PAGES = {
+    '/header' : ('text/html; charset=ISO-8859-1',
+                 u'<meta charset="utf-8"><p>%s</p>' % TEXT.replace(u'–', u'-')),
+    '/meta'   : ('text/html', u'<html><head><meta http-equiv="Content-Type" '
+                              u'content="text/html; charset=windows-1252"></head><p>%s</p>' % TEXT),
+    '/plain'  : ('text/html', u'<p>%s</p>' % TEXT),
+    '/unknown': ('text/html; charset=x-nonsense', u'<p>%s</p>' % TEXT),
+}
+
+def _encoded(path):
+    content_type, body = PAGES[path]
+    codec = {'/header': 'latin-1', '/meta': 'cp1252'}.get(path, 'utf-8')
+    return content_type, body.encode(codec)
+
+@pytest.fixture
+def server():
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            content_type, body = _encoded(self.path)
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield 'http://127.0.0.1:%d' % server.server_address[1]
+    server.shutdown()
+    thread.join()
+
+def test_decode_rule():
+    for path, (content_type, body) in PAGES.items():
+        assert decode(_encoded(path)[1], content_type) == body
+    # Without a header, the meta element decides.
+    assert decode(_encoded('/header')[1]) != PAGES['/header'][1]
+    assert decode(u'<meta charset="utf-16"><p>\xe9</p>'.encode('utf-8')) == u'<meta charset="utf-16"><p>\xe9</p>'
+    assert decode(b'<p>\xff</p>') == u'<p>�</p>'
+
+def test_stored_and_downloaded_text_agree(server, tmpdir):
+    pytest.importorskip('requests')
+    store   = DocumentStore(str(tmpdir))
+    fetcher = DocumentFetcher(store, concurrency=2)
+    assert fetcher.fetch([(path, server + path) for path in PAGES]) == {}
+    for path, (content_type, body) in PAGES.items():
+        assert store.get(path) == body
+        assert fetcher.download(server + path) == body
+        assert store.metadata(path)['content_type'] == content_type
+        with open(store._path(path), 'rb') as f:
+            assert f.read() == _encoded(path)[1]
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import csv
+import json
+import os
+import subprocess
+
+import pytest
+
+from conftest import DATA
+from documenttext import EXTRACT_TEXT_JS, MatchText, TextMap, html_text
+from overlapcache import digest
+
+pytest.importorskip('bs4')
+pytest.importorskip('html5lib')
+
+# Text the HTML5 parsing algorithm and WebKit agree on: scripts and the
+# head are hidden, entities are decoded, <br> adds no text, CR LF is
+# normalized, text inside a table row is moved before the table and
+# text after </html> is appended to the body.
+PAGE = (u'<html><head><title>Title</title><style>p { }</style></head><body>'
+        u'<p>a&amp;b&nbsp;c&copy d<br>e</p><script>var x = 1;</script>'
+        u'<table><tr>stray<td>cell</td></tr></table>'
+        u'<div style="display: none">styled</div>\U0001F600z\r\nw</body></html>tail')
+PAGE_TEXT = u'a&b\xa0c\xa9 destraycellstyled\U0001F600z\nwtail'
+
+# Builds a minimal DOM from a JSON tree and runs a snippet against it.
+_DOM_JS = u'''
+var tree = %s, body = null;
+function build(n, parent) {
+    if (n.text !== undefined) return {nodeType: 3, nodeName: '#text', data: n.text, parentNode: parent};
+    if (n.comment !== undefined) return {nodeType: 8, nodeName: '#comment', data: n.comment, parentNode: parent};
+    var element = {nodeType: 1, nodeName: n.name.toUpperCase(), parentNode: parent, childNodes: []};
+    for (var i = 0; i < n.children.length; i++) element.childNodes.push(build(n.children[i], element));
+    if (element.nodeName === 'BODY') body = element;
+    return element;
+}
+var html = build(tree, null);
+function texts(node, found) {
+    if (node.nodeType === 3) found.push(node);
+    (node.childNodes || []).forEach(function (c) { texts(c, found); });
+    return found;
+}
+globalThis.window = globalThis;
+globalThis.NodeFilter = {SHOW_TEXT: 4};
+globalThis.document = {
+    documentElement: html, body: body,
+    createTreeWalker: function (root) {
+        var found = texts(root, []), i = 0;
+        return {nextNode: function () { return found[i++] || null; }};
+    }
+};
+console.log(eval(%s));
+'''
+
+def _tree(node):
+    from bs4 import Comment, NavigableString
+    if isinstance(node, Comment):
+        return {'comment': node}
+    if isinstance(node, NavigableString):
+        return {'text': node}
+    return {'name': node.name, 'children': [_tree(c) for c in node.contents]}
+
+def _node():
+    try:
+        subprocess.check_output(['node', '--version'])
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip("node is not available")
+
+def page_text(html, tmpdir):
+    '''
+    Runs EXTRACT_TEXT_JS under node against the html5lib tree of a page,
+    and returns its TextMap as the viewer builds it.
+    '''
+    from bs4 import BeautifulSoup
+    _node()
+    script = tmpdir.join('extract.js')
+    tree   = _tree(BeautifulSoup(html, 'html5lib').html)
+    script.write_text(_DOM_JS % (json.dumps(tree), json.dumps(EXTRACT_TEXT_JS)), 'utf-8')
+    result = json.loads(subprocess.check_output(['node', str(script)]).decode('utf-8'))
+    return result, TextMap.from_page(result['text'], result['starts'])
+
+def data_rationale():
+    '''
+    Returns (document ID, URL, rationale) of the first long rationale in
+    data/.
+    '''
+    with open(os.path.join(DATA, 'small4_rationales.csv')) as f:
+        for row in csv.DictReader(f):
+            if len(row['user_rationale']) > 60:
+                return row['document_id'], row['document_url'], row['user_rationale']
+
+def data_page(rationale):
+    '''
+    A page around a rationale, with everything the parsers treat
+    differently.
+    '''
+    return PAGE.replace(u'<br>e', u'<br>e <em>%s</em>' % rationale.replace('&', '&amp;'))
+
+def test_html_text_parses_as_browser():
+    assert html_text(PAGE).text == PAGE_TEXT
+
+def test_page_offsets():
+    text_map = TextMap.from_page(u'a\U0001F600b\U0001F600c', [0, 3, 4])
+    assert text_map.starts == [0, 2, 3]
+    assert [text_map.page_offset(i) for i in range(6)] == [0, 1, 3, 4, 6, 7]
+
+def test_extract_js_matches_html_text(tmpdir):
+    result, text_map = page_text(PAGE, tmpdir)
+    expected = html_text(PAGE)
+    assert text_map.text == expected.text
+    assert text_map.starts == expected.starts
+    assert [expected.page_offset(s) for s in expected.starts] == result['starts']
+
+def test_precompute_digest_matches_viewer(tmpdir):
+    precompute = pytest.importorskip('precompute')
+    from documentstore import DocumentStore
+    document_id, url, rationale = data_rationale()
+    html = data_page(rationale)
+    DocumentStore(str(tmpdir.join('documents'))).put(document_id, url, html, 200)
+
+    task = (document_id, url, [rationale], str(tmpdir.join('documents')), 5)
+    _, _, text_digest, entries, error = precompute.match_document(task)
+    assert error is None
+    viewer = MatchText(page_text(html, tmpdir)[1].text)
+    assert text_digest == digest(viewer.text)
+    matches = entries[0][1]
+    assert sum(m.length for m in matches) == len(rationale)
+    start = viewer.text.index(rationale)
+    assert [(m.text_start, m.length) for m in matches] == [(start, len(rationale))]
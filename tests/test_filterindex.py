@@ -0,0 +1,74 @@
+import pytest
+
+pytest.importorskip('numpy')
+
+import amt
+import synthetic
+from filterindex import FilterIndex, Is, Between
+
+def _judgments(tmpdir, n=2000):
+    return list(synthetic.judgments(synthetic.write_corpus(str(tmpdir), n, rows_per_file=n // 4)))
+
+# Filters and the same conditions on a judgment and its assignment.
+FILTERS = [
+    (Is('status', 'Approved') & Between('approval_rate', 0.95) & Between('work_time', 10, 300),
+     lambda j, a: a.status == 'Approved' and a.approval_rate >= 0.95 and 10 <= a.work_time <= 300),
+    (Is('gold_agreement', False) | Is('status', 'Submitted'),
+     lambda j, a: (a.gold_standard is not None and int(j.value) != a.gold_standard) or
+                  a.status == 'Submitted'),
+    (Is('gold_agreement', True) & ~Is('relevance', 0),
+     lambda j, a: int(j.value) == a.gold_standard and int(j.value) != 0),
+    (Is('gold_standard', 1), lambda j, a: a.gold_standard == 1),
+]
+
+def test_select_matches_scan(tmpdir):
+    judgments = _judgments(tmpdir)
+    index     = FilterIndex(judgments)
+    appended  = FilterIndex(judgments[:1500])
+    appended.add(judgments[1500:])
+    for where, matches in FILTERS:
+        expected = [j for j in judgments if matches(j, j.assignment)]
+        assert expected
+        assert index.select(where) == expected
+        assert appended.select(where) == expected
+
+@pytest.mark.parametrize('attribute, value', [
+    ('gold_agreement', 1), ('gold_agreement', 0), ('relevance', True),
+    ('gold_standard', False), ('gold_standard', '1'), ('topic', 20000), ('worker', 1),
+])
+def test_values_of_the_wrong_type_are_rejected(attribute, value):
+    with pytest.raises(ValueError):
+        Is(attribute, value)
+    with pytest.raises(ValueError):
+        Is(attribute, None, value)
+
+def test_booleans_and_labels_stay_apart(tmpdir):
+    index = FilterIndex(_judgments(tmpdir))
+    agrees = [j for j in index.judgments if int(j.value) == j.assignment.gold_standard]
+    assert index.select(Is('gold_agreement', True)) == agrees
+    assert index.select(Is('relevance', 1)) == [j for j in index.judgments if int(j.value) == 1]
+    unknown = [j for j in index.judgments if j.assignment.gold_standard is None]
+    assert index.select(Is('gold_agreement', None)) == unknown
+
+def test_agreement_where_matches_collection(data_files, collection_path):
+    from datamodel import DataModel
+    model = DataModel(collection_path)
+    model.load_files(data_files)
+    collection = model.test_collection
+    topic = sorted(model.sorted_topic_ids())[0]
+    slices = [
+        (Is('status', 'Approved') & Between('approval_rate', 0.9), None,
+         lambda j, a: a.status == 'Approved' and a.approval_rate >= 0.9),
+        (Is('gold_agreement', False), None,
+         lambda j, a: a.gold_standard is not None and int(j.value) != a.gold_standard),
+        (~Is('relevance', 0), topic,
+         lambda j, a: int(j.value) != 0 and j.topic.id == topic),
+    ]
+    for where, topic_id, matches in slices:
+        manual = [j for j in model.judged_data if amt.assignment(j) and matches(j, amt.assignment(j))]
+        assert manual
+        for degree in (1, 2):
+            assert model.agreement(degree, topic_id, where=where) == \
+                collection.compute_agreement(manual, degree)[0]
+        assert model.confusion_matrix(topic_id, where=where) == \
+            model._confusion_matrix_string(collection.compute_agreement_matrix(manual))
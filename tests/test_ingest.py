@@ -0,0 +1,50 @@
+import csv
+import multiprocessing
+
+import pytest
+
+import amt
+import ingest
+import synthetic
+
+def _corpus(directory, judgments=400, files=4):
+    return synthetic.write_corpus(str(directory), judgments, rows_per_file=judgments // files)
+
+def _summary(parsed):
+    return [(p.filename, p.error, [j.assignment for j in p.judgments]) for p in parsed]
+
+def test_parses_serially_by_default(tmpdir, monkeypatch):
+    files = _corpus(tmpdir)
+    monkeypatch.setattr(multiprocessing, 'Pool', None)
+    parsed = ingest.parse_files(synthetic.Collection(), files)
+    assert [p.filename for p in parsed] == files
+    assert all(p.error is None for p in parsed)
+
+@pytest.mark.parametrize('method', ['fork', 'spawn'])
+def test_workers_match_serial(tmpdir, method):
+    if not hasattr(multiprocessing, 'get_all_start_methods'):
+        pytest.skip("start methods need Python 3")
+    if method not in multiprocessing.get_all_start_methods():
+        pytest.skip("%s is not available" % method)
+    files  = _corpus(tmpdir)
+    serial = ingest.parse_files(synthetic.Collection(), files, processes=1)
+    previous = multiprocessing.get_start_method()
+    multiprocessing.set_start_method(method, force=True)
+    try:
+        parallel = ingest.parse_files(synthetic.Collection(), files, processes=2)
+    finally:
+        multiprocessing.set_start_method(previous, force=True)
+    assert _summary(parallel) == _summary(serial)
+
+def test_errors_are_reported_per_file(tmpdir):
+    files   = _corpus(tmpdir, files=2)
+    missing = str(tmpdir.join('missing_rationales.csv'))
+    parsed  = ingest.parse_files(synthetic.Collection(), files[:1] + [missing] + files[1:])
+    assert [p.error is None for p in parsed] == [True, False, True]
+    assert parsed[1].judgments is None
+
+def test_read_assignments_matches_parse_row(data_files):
+    for filename in data_files:
+        with open(filename, 'r') as f:
+            expected = [amt.parse_row(row) for row in csv.DictReader(f)]
+        assert amt.read_assignments(filename) == expected
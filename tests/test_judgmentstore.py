@@ -0,0 +1,33 @@
+import pytest
+
+import amt
+from judgmentstore import CompactJudgmentStore
+from synthetic import Record
+
+def _judgment(value, gold=1):
+    a = amt.AMTAssignment(assignment_id='a', hit_id='h', worker_id='w', status='Approved',
+                          work_time=10, approval_rate=1.0, topic_id='t', document_id='d',
+                          document_url='u', gold_standard=gold, relevance=None,
+                          rationale='r', feedback='f')
+    return Record(topic=Record(id='t'), document=Record(id='d'), value=value, rationale='r',
+                  feedback='f', assignment=a)
+
+def test_keeps_more_than_256_values():
+    store = CompactJudgmentStore()
+    store.add(_judgment(str(v)) for v in range(1000))
+    assert [j.value for j in store.judgments()] == [str(v) for v in range(1000)]
+
+def test_rejects_values_beyond_the_column(monkeypatch):
+    store = CompactJudgmentStore()
+    monkeypatch.setattr(CompactJudgmentStore, 'MAX_VALUES', 2)
+    store.add([_judgment('0'), _judgment('1')])
+    with pytest.raises(ValueError):
+        store.add([_judgment('2')])
+    assert len(store) == 2
+    assert len(store.by_topic('t')) == 2
+
+def test_rejects_labels_beyond_the_column():
+    store = CompactJudgmentStore()
+    with pytest.raises(ValueError):
+        store.add([_judgment('1', gold=300)])
+    assert len(store) == 0
@@ -0,0 +1,46 @@
+import shutil
+
+import pytest
+
+@pytest.fixture
+def collections(collection_path, tmpdir):
+    '''
+    The test collection loaded eagerly, and a copy of it opened lazily,
+    so the record file is written next to the copy.
+    '''
+    from testcollection.mqt import MQT
+    from lazymqt import LazyMQT
+    copy = str(tmpdir.join('collection.mqt'))
+    shutil.copy(collection_path, copy)
+    LazyMQT.open(copy)
+    # Reopened from the record file, as later sessions are.
+    return MQT.load(collection_path), LazyMQT.open(copy)
+
+def _pair(gs):
+    return (gs.topic.id, gs.document.id)
+
+def test_gold_standard_matches_eager(collections):
+    eager, lazy = collections
+    for gs in eager.gold_standard():
+        found = lazy.find_gold_standard(*_pair(gs))
+        assert found.value == gs.value
+        assert _pair(found) == _pair(gs)
+        assert found.topic is lazy.find_topic(gs.topic.id)
+        assert found.document is lazy.find_document(gs.document.id)
+    assert sorted(map(_pair, lazy.gold_standard())) == sorted(map(_pair, eager.gold_standard()))
+
+def test_topics_and_documents_match_eager(collections):
+    eager, lazy = collections
+    assert sorted(t.id for t in lazy.topics()) == sorted(t.id for t in eager.topics())
+    assert sorted(d.id for d in lazy.documents()) == sorted(d.id for d in eager.documents())
+
+def test_agreement_matches_eager(collections, data_files):
+    eager, lazy = collections
+    for filename in data_files:
+        expected  = eager.import_amt_results(filename)
+        judgments = lazy.import_amt_results(filename)
+        assert [(_pair(j), j.value) for j in judgments] == [(_pair(j), j.value) for j in expected]
+        for degree in (1, 2):
+            assert lazy.compute_agreement(judgments, degree)[0] == \
+                   eager.compute_agreement(expected, degree)[0]
+        assert lazy.compute_agreement_matrix(judgments) == eager.compute_agreement_matrix(expected)
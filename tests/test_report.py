@@ -0,0 +1,16 @@
+import pytest
+
+@pytest.mark.parametrize('store', ['objects', 'sqlite'])
+def test_workers_match_serial(collection_path, data_files, tmpdir, store):
+    import report
+    from datamodel import DataModel
+    options = dict(collection=collection_path, store=store)
+    if store == 'sqlite':
+        options['database'] = str(tmpdir.join('judgments.db'))
+    model = DataModel(**options)
+    assert model.load_files(data_files) == {}
+    serial   = list(report.run(model))
+    parallel = list(report.run(model, 2, options=options,
+                               filenames=[] if store == 'sqlite' else data_files))
+    assert parallel == serial
+    assert len(serial) == len(report.keys(model))
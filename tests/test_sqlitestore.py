@@ -0,0 +1,64 @@
+import pytest
+
+import synthetic
+from agreement import label_pair_counts
+from judgmentstore import JudgmentIndex
+from sqlitestore import SQLiteJudgmentStore
+
+@pytest.fixture
+def stores(data_files):
+    '''
+    The judgments of data/*.csv in an in-memory SQLite store and in a
+    JudgmentIndex.
+    '''
+    judgments = list(synthetic.judgments(data_files))
+    sqlite, objects = SQLiteJudgmentStore(), JudgmentIndex()
+    sqlite.add(judgments)
+    objects.add(judgments)
+    return sqlite, objects
+
+def _fields(judgments):
+    return [(j.topic.id, j.document.id, j.value, j.rationale, j.feedback, j.assignment)
+            for j in judgments]
+
+def _keys(objects):
+    topics = [t.id for t in objects.topics()]
+    pairs  = [(t, d.id) for t in topics for d in objects.documents_by_topic(t)]
+    return topics, pairs
+
+def test_queries_match_objects(stores):
+    sqlite, objects = stores
+    topics, pairs = _keys(objects)
+    assert _fields(sqlite.judgments()) == _fields(objects.judgments())
+    for t in topics:
+        assert _fields(sqlite.by_topic(t)) == _fields(objects.by_topic(t))
+        assert [d.id for d in sqlite.documents_by_topic(t)] == \
+               [d.id for d in objects.documents_by_topic(t)]
+    for t, d in pairs:
+        assert _fields(sqlite.by_pair(t, d)) == _fields(objects.by_pair(t, d))
+        assert _fields(sqlite.by_document(d)) == _fields(objects.by_document(d))
+
+def test_label_pair_counts_match_agreement_module(stores):
+    sqlite, objects = stores
+    topics, pairs = _keys(objects)
+    assert sqlite.label_pair_counts() == label_pair_counts(objects.judgments())
+    for t in topics:
+        assert sqlite.label_pair_counts(t) == label_pair_counts(objects.by_topic(t))
+    for t, d in pairs:
+        assert sqlite.label_pair_counts(t, d) == label_pair_counts(objects.by_pair(t, d))
+        assert sqlite.label_pair_counts(None, d) == label_pair_counts(objects.by_document(d))
+
+def test_statistics_match_collection(collection_path, data_files):
+    from datamodel import DataModel
+    sqlite  = DataModel(collection_path, store='sqlite')
+    objects = DataModel(collection_path, store='objects')
+    for model in (sqlite, objects):
+        assert model.load_files(data_files) == {}
+    keys = [(None, None)]
+    for t in objects.sorted_topic_ids():
+        keys.append((t, None))
+        keys.extend((t, d) for d in objects.sorted_document_ids(t))
+    for t, d in keys:
+        for degree in (1, 2):
+            assert sqlite.agreement(degree, t, d) == objects.agreement(degree, t, d)
+        assert sqlite.confusion_matrix(t, d) == objects.confusion_matrix(t, d)
@@ -0,0 +1,124 @@
+import os
+
+import ingest
+import synthetic
+from watch import ResultWatcher, record_end
+
+def _records(data):
+    '''
+    Splits complete CSV records, keeping their newlines. A record with a
+    quoted newline spans several lines.
+    '''
+    records, record, quotes = [], b'', 0
+    for line in data.split(b'\n')[:-1]:
+        record += line + b'\n'
+        quotes += line.count(b'"')
+        if quotes % 2 == 0:
+            records.append(record)
+            record = b''
+    return records
+
+def _split(path):
+    with open(path, 'rb') as f:
+        header = f.readline()
+        return header, _records(f.read())
+
+class Model(object):
+    '''
+    Stands in for a DataModel: parses rows with the synthetic collection
+    and skips those whose AssignmentId it has, as DataModel does.
+    '''
+
+    def __init__(self):
+        self.assignment_ids = set()
+
+    def load_rows(self, header, records):
+        judgments = ingest.parse_rows(synthetic.Collection(), header, records)
+        new = set(j.assignment.assignment_id for j in judgments) - self.assignment_ids
+        self.assignment_ids |= new
+        return len(new)
+
+    def load_files(self, filenames):
+        for filename in filenames:
+            with open(filename, 'rb') as f:
+                header = f.readline()
+                self.load_rows(header, f.read())
+
+def _live(tmpdir, data_files):
+    '''
+    Copies the first data file, with all but its last three records, to
+    a watched directory. Returns (path, header, all records).
+    '''
+    directory = tmpdir.mkdir('live')
+    header, records = _split(data_files[0])
+    path = str(directory.join(os.path.basename(data_files[0])))
+    with open(path, 'wb') as f:
+        f.write(header + b''.join(records[:-3]))
+    return str(directory), path, header, records
+
+def _append(path, data):
+    with open(path, 'ab') as f:
+        f.write(data)
+
+def test_record_end():
+    assert record_end(b'a,b\nc,"d\ne"\nf') == len(b'a,b\nc,"d\ne"\n')
+    assert record_end(b'a,"b\n') == 0
+    assert record_end(b'a,"b""\n""c"\n') == len(b'a,"b""\n""c"\n')
+
+def test_records_split_data(data_files):
+    header, records = _split(data_files[0])
+    with open(data_files[0], 'rb') as f:
+        assert header + b''.join(records) == f.read()
+    assert len(records) == len(ingest.parse_rows(synthetic.Collection(), header, b''.join(records)))
+
+def test_rows_appended_before_the_watcher_are_loaded(tmpdir, data_files):
+    directory, path, header, records = _live(tmpdir, data_files)
+    model = Model()
+    model.load_files([path])
+    # Appended between loading the directory and watching it.
+    _append(path, records[-3])
+    watcher = ResultWatcher(model, directory)
+    assert watcher.poll() == {path: 1}
+    assert watcher.poll() == {}
+
+def test_partial_rows_are_not_reported(tmpdir, data_files):
+    directory, path, header, records = _live(tmpdir, data_files)
+    model = Model()
+    model.load_files([path])
+    watcher = ResultWatcher(model, directory)
+    assert watcher.poll() == {}
+
+    half = len(records[-2]) // 2
+    _append(path, records[-2][:half])
+    assert watcher.poll() == {}
+    _append(path, records[-2][half:] + records[-1])
+    assert watcher.poll() == {path: 2}
+
+def test_rewritten_file_loads_rows_once(tmpdir, data_files):
+    directory, path, header, records = _live(tmpdir, data_files)
+    model = Model()
+    watcher = ResultWatcher(model, directory)
+    assert watcher.poll() == {path: len(records) - 3}
+    with open(path, 'wb') as f:
+        f.write(header + b''.join(reversed(records)))
+    assert watcher.poll() == {path: 3}
+    assert len(model.assignment_ids) == len(records)
+
+def test_data_model_matches_full_load(tmpdir, data_files, collection_path):
+    from datamodel import DataModel
+    directory, path, header, records = _live(tmpdir, data_files)
+    watched = DataModel(collection_path)
+    watched.load_files([path])
+    _append(path, records[-3])
+    watcher = ResultWatcher(watched, directory)
+    _append(path, records[-2][:10])
+    assert watcher.poll() == {path: 1}
+    _append(path, records[-2][10:] + records[-1])
+    assert watcher.poll() == {path: 2}
+    assert watcher.poll() == {}
+
+    full = DataModel(collection_path)
+    full.load_files([data_files[0]])
+    assert len(watched.judged_data) == len(full.judged_data)
+    for degree in (1, 2):
+        assert watched.agreement(degree) == full.agreement(degree)
@@ -0,0 +1,35 @@
+from collections import defaultdict
+
+import amt
+
+def test_co_judge_agreement_matches_collection(collection_path, data_files):
+    from datamodel import DataModel
+    model = DataModel(collection_path)
+    assert model.load_files(data_files) == {}
+    tc = model.test_collection
+
+    # Every comparison of a worker with a co-judge, as judged by the
+    # collection's agreement over that pair of judgments alone.
+    by_pair = defaultdict(list)
+    for j in model.judged_data:
+        a = amt.assignment(j)
+        if a is not None and a.worker_id:
+            by_pair[(j.topic.id, j.document.id)].append((a.worker_id, j))
+    comparisons = defaultdict(int)
+    agreed      = defaultdict(lambda: [0, 0])
+    for judges in by_pair.values():
+        for i, (w, j) in enumerate(judges):
+            for v, k in judges[i + 1:]:
+                if v == w:
+                    continue
+                for worker in (w, v):
+                    comparisons[worker] += 1
+                    for n, degree in enumerate((1, 2)):
+                        agreed[worker][n] += tc.compute_agreement([j, k], degree)[0]
+
+    for worker in model.worker_aggregates.workers():
+        s = model.worker_statistics(worker)
+        assert s.comparisons == comparisons[worker]
+        if s.comparisons:
+            assert s.d1_agreement == float(agreed[worker][0]) / s.comparisons
+            assert s.d2_agreement == float(agreed[worker][1]) / s.comparisons
@@ -0,0 +1,188 @@
+'''
+Watch mode: incremental ingestion of AMT result files.
+
+While a crowdsourcing run is live, result exports land in the data
+directory and grow as batches complete. ResultWatcher polls the
+directory and hands the DataModel only what is new: whole new files,
+and only the complete rows appended to files it has already read. The
+DataModel skips rows whose AssignmentId it already has and updates its
+indexes and cached statistics for the affected topics and documents
+only.
+
+Usage: python watch.py <directory> [--collection MQT] [--interval SECONDS]
+'''
+import argparse
+import os
+import sys
+import time
+import traceback
+
+from collections import OrderedDict
+
+import ingest
+from instrument import traced
+
+# Bytes before a file's read offset compared to detect a rewritten file.
+TAIL = 256
+
+def record_end(data):
+    '''
+    Returns the length of the longest prefix of CSV data made of complete
+    records, ending with a newline outside any quoted field. Doubled
+    quotes inside a quoted field do not change its quoting, so a newline
+    ends a record when it is preceded by an even number of quotes.
+    '''
+    end, quotes, position = 0, 0, 0
+    for line in data.split(b'\n')[:-1]:
+        quotes   += line.count(b'"')
+        position += len(line) + 1
+        if quotes % 2 == 0:
+            end = position
+    return end
+
+
+class _File(object):
+    '''
+    What has been read of one watched file.
+    '''
+    __slots__ = ('signature', 'header', 'offset', 'tail')
+
+    def __init__(self):
+        self.signature = None           # (size, mtime) when last read.
+        self.header    = None           # Bytes of the header line.
+        self.offset    = 0              # End of the last complete record read.
+        self.tail      = b''            # Bytes just before offset.
+
+
+class ResultWatcher(object):
+    '''
+    Polls a directory of AMT result files and loads new rows into a
+    DataModel.
+    '''
+
+    def __init__(self, data_model, directory, suffix='.csv'):
+        '''
+        Arguments:
+
+        data_model -- DataModel to load rows into.
+        directory  -- Directory of AMT result files.
+        suffix     -- Suffix of the result files.
+
+        The first poll reads every file from its start, so rows appended
+        after the DataModel loaded the directory are not missed. Rows it
+        already has are skipped by AssignmentId.
+        '''
+        self.data_model = data_model
+        self.directory  = directory
+        self.suffix     = suffix
+        self._files     = {}            # Path -> _File
+
+    @traced('watch.poll')
+    def poll(self):
+        '''
+        Loads the rows added to the directory since the last poll.
+
+        Returns an ordered dictionary mapping every file judgments were
+        added from to their number, and every file that failed to load to
+        the error raised. Files whose only change is a partial row, or
+        rows already loaded, are left out.
+        '''
+        changes = OrderedDict()
+        for path in ingest.find_files(self.directory, self.suffix):
+            state = self._files.setdefault(path, _File())
+            try:
+                signature = _signature(path)
+            except OSError:
+                continue
+            if signature == state.signature:
+                continue
+            try:
+                added = self._read(path, state)
+            except Exception:
+                changes[path] = traceback.format_exc()
+                continue
+            if added:
+                changes[path] = added
+        return changes
+
+    def _read(self, path, state):
+        '''
+        Reads the complete records of a file past what was read before,
+        and loads them. A file that no longer starts with what was read
+        before is read again from its start; rows already loaded are then
+        skipped by AssignmentId.
+
+        Returns the number of judgments added.
+        '''
+        signature = _signature(path)
+        with open(path, 'rb') as f:
+            header = f.readline()
+            if not header.endswith(b'\n'):
+                return 0
+
+            # Only the bytes past the offset are read, plus a few before it
+            # to check that the file was appended to and not rewritten.
+            appended = header == state.header and signature[0] >= state.offset
+            if appended:
+                f.seek(max(0, state.offset - len(state.tail)))
+                appended = f.read(len(state.tail)) == state.tail
+            start = state.offset if appended else len(header)
+            f.seek(start)
+            data = f.read()
+
+        end = record_end(data)
+        added = 0
+        if end:
+            added = self.data_model.load_rows(header, data[:end])
+
+        state.signature = signature
+        state.header    = header
+        state.offset    = start + end
+        state.tail      = ((state.tail if appended else header) + data[max(0, end - TAIL):end])[-TAIL:]
+        return added
+
+    def watch(self, interval=2.0, callback=None):
+        '''
+        Polls forever, every interval seconds, calling callback(changes)
+        after every poll that found something.
+        '''
+        while True:
+            changes = self.poll()
+            if changes and callback:
+                callback(changes)
+            time.sleep(interval)
+
+def _signature(path):
+    st = os.stat(path)
+    return (st.st_size, st.st_mtime)
+
+
+if __name__ == "__main__":
+    # Headless live view: loads a directory, then reports every batch of
+    # new judgments and the resulting overall agreement.
+    from datamodel import DataModel
+
+    parser = argparse.ArgumentParser(description="Watches a directory of AMT result files.")
+    parser.add_argument('directory')
+    parser.add_argument('--collection', default='2009.mqt', help="MQT test collection")
+    parser.add_argument('--interval', type=float, default=2.0, help="seconds between polls")
+    args = parser.parse_args()
+
+    dm = DataModel(args.collection)
+    errors = dm.load_files(ingest.find_files(args.directory))
+    for filename, error in errors.items():
+        sys.stderr.write("Error while loading AMT results from %s:\n%s\n" % (filename, error))
+    watcher = ResultWatcher(dm, args.directory)
+
+    def report(changes):
+        for path, added in changes.items():
+            if isinstance(added, int):
+                print ("%s: %d new judgments" % (path, added))
+            else:
+                sys.stderr.write("Error while loading new AMT results from %s:\n%s\n" % (path, added))
+        print ("%d judgments, D1 agreement %f, D2 agreement %f" %
+               (len(dm.judged_data), dm.agreement(1), dm.agreement(2)))
+        sys.stdout.flush()
+
+    report(OrderedDict())
+    watcher.watch(args.interval, report)
@@ -0,0 +1,201 @@
+'''
+Per-worker quality aggregates.
+
+Every judgment carries the AMT assignment it came from (see the amt
+module), which names its worker. WorkerAggregates folds judgments into
+per-worker counters in a single streaming pass, and keeps them current
+as more judgments are added:
+
+- number of judgments
+- accuracy against the gold standard, and the confusion against it
+- agreement with co-judges, the other workers who judged the same
+  Topic-Document pair, for degrees 1 and 2 as in the agreement module
+- work time distribution and rationale length
+'''
+from collections import namedtuple, defaultdict, Counter
+
+import amt
+
+# Summary of a worker's work time in seconds.
+WorkTime = namedtuple('WorkTime', ['count', 'mean', 'minimum', 'median', 'p90', 'maximum'])
+
+# Aggregates of one worker. Ratios are None when undefined.
+WorkerStatistics = namedtuple('WorkerStatistics', ['worker_id',
+                                                   'judgments',
+                                                   'gold_judgments',    # Judgments with a gold standard.
+                                                   'gold_accuracy',
+                                                   'confusion',         # (gold, label) -> count
+                                                   'comparisons',       # Label pairs with co-judges.
+                                                   'd1_agreement',
+                                                   'd2_agreement',
+                                                   'work_time',
+                                                   'mean_rationale_length'])
+
+def _label(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+class _Worker(object):
+    '''
+    Running counters of one worker.
+    '''
+    __slots__ = ('judgments', 'gold_judgments', 'gold_correct', 'confusion', 'comparisons',
+                 'agreed', 'work_times', 'rationale_chars')
+
+    def __init__(self):
+        self.judgments       = 0
+        self.gold_judgments  = 0
+        self.gold_correct    = 0
+        self.confusion       = Counter()
+        self.comparisons     = 0
+        self.agreed          = [0, 0]           # Agreeing comparisons of degree 1 and 2.
+        self.work_times      = []
+        self.rationale_chars = 0
+
+class WorkerAggregates(object):
+    '''
+    Per-worker aggregates over judgments, updated incrementally.
+
+    Each added judgment is compared against the judgments already seen
+    for its Topic-Document pair, so co-judge agreement costs time linear
+    in the number of judges of a pair, and adding judgments file by file
+    gives the same result as adding them all at once.
+    '''
+
+    # Agreement degrees, as in the agreement module.
+    DEGREES = (1, 2)
+
+    def __init__(self):
+        self._workers = defaultdict(_Worker)    # Worker ID -> _Worker
+        self._pairs   = defaultdict(list)       # (Topic ID, Document ID) -> [(_Worker, label)]
+        self.unattributed = 0                   # Judgments without a known worker.
+
+    def add(self, judgments):
+        '''
+        Folds judgments into the aggregates.
+        '''
+        workers, pairs = self._workers, self._pairs
+        d1, d2 = self.DEGREES
+        for j in judgments:
+            a = amt.assignment(j)
+            if a is None or not a.worker_id:
+                self.unattributed += 1
+                continue
+            w = workers[a.worker_id]
+            label = _label(j.value)
+            w.judgments += 1
+
+            if a.gold_standard is not None and label is not None:
+                w.gold_judgments += 1
+                w.gold_correct   += label == a.gold_standard
+                w.confusion[(a.gold_standard, label)] += 1
+            if a.work_time is not None:
+                w.work_times.append(a.work_time)
+            w.rationale_chars += len(j.rationale or '')
+
+            if label is None:
+                continue
+            judges = pairs[(j.topic.id, j.document.id)]
+            for other, other_label in judges:
+                if other is w:
+                    continue
+                difference = abs(label - other_label)
+                agreed1, agreed2 = difference < d1, difference < d2
+                # Both workers gain the comparison.
+                w.comparisons += 1
+                w.agreed[0] += agreed1
+                w.agreed[1] += agreed2
+                other.comparisons += 1
+                other.agreed[0] += agreed1
+                other.agreed[1] += agreed2
+            judges.append((w, label))
+
+    def __len__(self):
+        return len(self._workers)
+
+    def workers(self):
+        '''
+        Returns the IDs of all workers seen, sorted.
+        '''
+        return sorted(self._workers)
+
+    def statistics(self, worker_id):
+        '''
+        Returns the WorkerStatistics of a worker, or None if unknown.
+        '''
+        w = self._workers.get(worker_id)
+        if w is None:
+            return None
+        times = sorted(w.work_times)
+        work_time = None
+        if times:
+            work_time = WorkTime(count   = len(times),
+                                 mean    = float(sum(times)) / len(times),
+                                 minimum = times[0],
+                                 median  = times[len(times) // 2],
+                                 p90     = times[min(len(times) - 1, int(0.9 * len(times)))],
+                                 maximum = times[-1])
+        ratio = lambda n, d: float(n) / d if d else None
+        return WorkerStatistics(worker_id             = worker_id,
+                                judgments             = w.judgments,
+                                gold_judgments        = w.gold_judgments,
+                                gold_accuracy         = ratio(w.gold_correct, w.gold_judgments),
+                                confusion             = dict(w.confusion),
+                                comparisons           = w.comparisons,
+                                d1_agreement          = ratio(w.agreed[0], w.comparisons),
+                                d2_agreement          = ratio(w.agreed[1], w.comparisons),
+                                work_time             = work_time,
+                                mean_rationale_length = ratio(w.rationale_chars, w.judgments))
+
+    def ranking(self, key='gold_accuracy', minimum_judgments=1):
+        '''
+        Returns the WorkerStatistics of every worker with at least
+        minimum_judgments judgments, best first by the named field.
+        Workers for whom the field is undefined come last.
+        '''
+        statistics = [self.statistics(w) for w in self.workers()]
+        statistics = [s for s in statistics if s.judgments >= minimum_judgments]
+        defined    = [s for s in statistics if getattr(s, key) is not None]
+        undefined  = [s for s in statistics if getattr(s, key) is None]
+        return sorted(defined, key=lambda s: getattr(s, key), reverse=True) + undefined
+
+
+if __name__ == "__main__":
+    # Aggregates a synthetic corpus in one pass and in file-sized
+    # increments, and prints the most accurate workers.
+    #
+    # Usage: python workerstats.py [judgments]
+    import shutil
+    import sys
+    import tempfile
+    import time
+
+    import synthetic
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    directory = tempfile.mkdtemp(prefix='cwr_workers_')
+    try:
+        files = synthetic.write_corpus(directory, n, rows_per_file=max(1, n // 10))
+        judgments = list(synthetic.judgments(files))
+
+        start = time.time()
+        once = WorkerAggregates()
+        once.add(judgments)
+        took = time.time() - start
+
+        incremental = WorkerAggregates()
+        for f in files:
+            incremental.add(synthetic.judgments([f]))
+        assert [once.statistics(w) for w in once.workers()] == \
+               [incremental.statistics(w) for w in incremental.workers()]
+
+        print ("%d judgments by %d workers aggregated in %.3fs (%.0f judgments/s)" %
+               (len(judgments), len(once), took, len(judgments) / took))
+        for s in once.ranking('gold_accuracy', minimum_judgments=20)[:10]:
+            print ("%s %5d judgments  gold %.3f  D1 %.3f  D2 %.3f  median %4ds  rationale %5.1f chars" %
+                   (s.worker_id, s.judgments, s.gold_accuracy, s.d1_agreement, s.d2_agreement,
+                    s.work_time.median, s.mean_rationale_length))
+    finally:
+        shutil.rmtree(directory)